@@ -1,17 +1,36 @@
-from chisel.api.openai import (
-    OpenAITxtToImg,
-    OpenAIImgToImg,
-    OpenAIImgEdit,
-)
-from chisel.api.stability_ai import (
-    StabilityAITxtToImg,
-    StabilityAIImgToImg,
-    StabilityAIImgEdit,
-    StabilityAISuperRes,
-)
-from chisel.api.stable_diffusion_api import (
-    StableDiffusionAPITxtToImg,
-    StableDiffusionAPIImgToImg,
-    StableDiffusionAPIImgEdit,
-    StableDiffusionAPISuperRes
-)
+import importlib
+from typing import Any
+
+# Providers are imported on first access so that using one provider doesn't
+# load every other provider's SDK.
+_lazy_imports = {
+    "OpenAITxtToImg": "chisel.api.openai",
+    "OpenAIImgToImg": "chisel.api.openai",
+    "OpenAIImgEdit": "chisel.api.openai",
+    "StabilityAITxtToImg": "chisel.api.stability_ai",
+    "StabilityAIImgToImg": "chisel.api.stability_ai",
+    "StabilityAIImgEdit": "chisel.api.stability_ai",
+    "StabilityAISuperRes": "chisel.api.stability_ai",
+    "StableDiffusionAPITxtToImg": "chisel.api.stable_diffusion_api",
+    "StableDiffusionAPIImgToImg": "chisel.api.stable_diffusion_api",
+    "StableDiffusionAPIImgEdit": "chisel.api.stable_diffusion_api",
+    "StableDiffusionAPISuperRes": "chisel.api.stable_diffusion_api",
+    "LocalTxtToImg": "chisel.api.local",
+    "LocalImgToImg": "chisel.api.local",
+    "LocalImgEdit": "chisel.api.local",
+    "LocalSuperRes": "chisel.api.local",
+}
+
+__all__ = list(_lazy_imports)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy_imports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
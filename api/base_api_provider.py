@@ -1,33 +1,126 @@
+import asyncio
+import copy
+import functools
 import json
+import time
 from abc import abstractmethod, ABCMeta
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple, Union
+)
+from urllib.parse import urlsplit
 
 import PIL
 import requests
-from requests.adapters import HTTPAdapter, Retry
 
+from chisel.api.resilience import (
+    RETRY_STATUSES, Resilience, RetryableHTTPError, get_resilience, parse_retry_after
+)
+# Re-exported: providers import APIResult from here.
+from chisel.api.result import APIResult
+from chisel.model_type import ModelType
 from chisel.storage.local_fs import LocalFS
 from chisel.util.files import get_ext
+from chisel.util.metrics import MetricsRegistry, get_metrics
+from chisel.util.tracing import bind_context, get_tracer
+from chisel.util.transport import get_transport
+
+
+RESULT_MODES = ("disk", "memory")
+
+
+def _measured_run(run: Callable) -> Callable:
+    @functools.wraps(run)
+    def measured_run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        metrics = get_metrics()
+        if not metrics.enabled:
+            return run(self, inp, params)
+        start = time.perf_counter()
+        try:
+            result = run(self, inp, params)
+        except Exception:
+            self._record_call(metrics, start, None, error=True)
+            raise
+        self._record_call(metrics, start, result)
+        return result
+    return measured_run
+
+
+def _measured_arun(arun: Callable) -> Callable:
+    @functools.wraps(arun)
+    async def measured_arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        metrics = get_metrics()
+        if not metrics.enabled:
+            return await arun(self, inp, params)
+        start = time.perf_counter()
+        try:
+            result = await arun(self, inp, params)
+        except Exception:
+            self._record_call(metrics, start, None, error=True)
+            raise
+        self._record_call(metrics, start, result)
+        return result
+    return measured_arun
 
 
 class BaseAPIProvider(metaclass=ABCMeta):
+    model_type: ModelType = None
+    # "disk" writes every image to LocalFS before returning it. "memory" keeps
+    # the encoded bytes in the APIResult and, if persist_results is set,
+    # writes them to LocalFS in the background.
+    result_mode: str = "disk"
+    persist_results: bool = True
+    # Providers that hand calls on to other providers leave the metrics to
+    # those, so that each call is counted once.
+    delegates: bool = False
+    # Whether a call reproduces its output: always (`deterministic`), or only
+    # with a seed set (`seeded`). Other providers' results are never cached
+    # or coalesced.
+    deterministic: bool = False
+    seeded: bool = False
+
     def __init__(self, storage_dir: str = "~/chisel"):
         self.storage = LocalFS(storage_dir)
-        s = requests.Session()
-        retries = Retry(
-            total=5,
-            backoff_factor=0.1,
-            status_forcelist=[404, 500, 502, 503, 504]
-        )
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-        s.mount('https://', HTTPAdapter(max_retries=retries))
-        self.requests_session = s
+        self.transport = get_transport()
+        self.requests_session = self.transport.session
+        self.resilience: Resilience = get_resilience()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if cls.delegates:
+            return
+        if "run" in cls.__dict__ and not getattr(cls.run, "__isabstractmethod__", False):
+            cls.run = _measured_run(cls.__dict__["run"])
+        if "arun" in cls.__dict__:
+            cls.arun = _measured_arun(cls.__dict__["arun"])
 
     @abstractmethod
     def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
         return None
 
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        # Providers without a native async client fall back to running the
+        # blocking call on the event loop's default executor.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, bind_context(functools.partial(self.run, inp, params))
+        )
+
+    def stream(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Iterator[Any]:
+        """
+        Yields results as soon as the provider returns them. Providers that
+        can't stream yield their complete result once.
+        """
+        yield self.run(inp, params)
+
+    async def astream(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[Any]:
+        yield await self.arun(inp, params)
+
     def get_params(self) -> Dict[str, Any]:
         return self.params
 
@@ -38,25 +131,237 @@ class BaseAPIProvider(metaclass=ABCMeta):
                 if k in self.params.keys():
                     self.params[k] = v
 
+    def fork(self) -> "BaseAPIProvider":
+        """
+        Returns a copy with its own params that shares everything else, so
+        calls with different params can run concurrently without seeing each
+        other's through set_params().
+        """
+        api = copy.copy(self)
+        if "params" in self.__dict__:
+            api.params = dict(self.params)
+        return api
+
+    def set_result_mode(self, mode: str, persist: bool = True) -> None:
+        if mode not in RESULT_MODES:
+            raise ValueError(f"Invalid result mode: {mode}. Expected one of {RESULT_MODES}.")
+        self.result_mode = mode
+        self.persist_results = persist
+
+    def get_provider_name(self) -> str:
+        return type(self).__name__
+
+    def _get_model_type_name(self) -> str:
+        return self.model_type.model_type if self.model_type is not None else "none"
+
+    def _record_bytes(self, sent: int, received: int) -> None:
+        metrics = get_metrics()
+        if not metrics.enabled:
+            return
+        provider = self.get_provider_name()
+        if sent:
+            metrics.bytes.inc(sent, provider=provider, direction="upload")
+        if received:
+            metrics.bytes.inc(received, provider=provider, direction="download")
+
+    def _record_call(
+        self,
+        metrics: MetricsRegistry,
+        start: float,
+        result: Any,
+        error: bool = False,
+    ) -> None:
+        provider = self.get_provider_name()
+        model_type = self._get_model_type_name()
+        metrics.request_seconds.observe(
+            time.perf_counter() - start, provider=provider, model_type=model_type
+        )
+        metrics.requests.inc(
+            provider=provider,
+            model_type=model_type,
+            outcome="error" if error else "success",
+        )
+        if isinstance(result, APIResult) and len(result) > 0:
+            metrics.images.inc(
+                len(result), provider=provider, model_type=model_type, outcome="produced"
+            )
+
+    def _get_endpoint(self, url: str, include_path: bool = True) -> str:
+        split = urlsplit(url)
+        if include_path:
+            return f"{split.netloc}{split.path}"
+        return split.netloc
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str = None,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Sends a request through the shared session, retrying transient
+        failures under this provider's circuit breaker and retry budget.
+        """
+        if endpoint is None:
+            endpoint = self._get_endpoint(url)
+        attempts = 0
+
+        def send() -> requests.Response:
+            nonlocal attempts
+            attempts += 1
+            r = self.requests_session.request(method, url, **kwargs)
+            if r.status_code in RETRY_STATUSES:
+                r.close()
+                raise RetryableHTTPError(
+                    url, r.status_code, parse_retry_after(r.headers.get("Retry-After"))
+                )
+            return r
+
+        with get_tracer().span(f"{method} {endpoint}", cat="http") as span:
+            try:
+                r = self.resilience.call(self.get_provider_name(), endpoint, send)
+                nbytes = int(r.headers.get("Content-Length") or 0)
+                span.set(status=r.status_code, bytes=nbytes)
+                self._record_bytes(len(r.request.body or b"") if r.request else 0, nbytes)
+                return r
+            finally:
+                span.set(retries=max(attempts - 1, 0))
+
+    async def _arequest(
+        self,
+        method: str,
+        url: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        endpoint: str = None,
+        **kwargs
+    ) -> Any:
+        """
+        The async counterpart of _request. `handler` consumes the aiohttp
+        response while the connection is still open.
+        """
+        if endpoint is None:
+            endpoint = self._get_endpoint(url)
+        attempts = 0
+        status = None
+
+        async def send() -> Any:
+            nonlocal attempts, status
+            attempts += 1
+            session = self.transport.aiohttp_session()
+            async with session.request(method, url, **kwargs) as r:
+                status = r.status
+                data = kwargs.get("data", None)
+                self._record_bytes(
+                    len(data) if isinstance(data, (bytes, str)) else 0, r.content_length or 0
+                )
+                if r.status in RETRY_STATUSES:
+                    raise RetryableHTTPError(
+                        url, r.status, parse_retry_after(r.headers.get("Retry-After"))
+                    )
+                return await handler(r)
+
+        with get_tracer().span(f"{method} {endpoint}", cat="http") as span:
+            try:
+                return await self.resilience.acall(self.get_provider_name(), endpoint, send)
+            finally:
+                span.set(status=status, retries=max(attempts - 1, 0))
+
     def _write_img(self, img: PIL.Image, filename: str) -> Path:
         return self.storage.write_img_to_tmp(img, filename)
 
+    def _store_img_bytes(
+        self,
+        data: bytes,
+        filename: str = None,
+        ext: str = None,
+    ) -> Union[Path, Future, None]:
+        """
+        Writes an encoded image according to the result mode. Returns its
+        path, a Future of its path when persisting in the background, or None.
+        """
+        if self.result_mode == "disk":
+            return self.storage.write_to_tmp(data, filename, ext)
+        if self.persist_results:
+            return self.storage.write_to_tmp_async(data, filename, ext)
+        return None
+
+    def _fetch_img(
+        self,
+        url: str,
+        ext: str = None
+    ) -> Tuple[Union[Path, Future, None], Optional[bytes]]:
+        """
+        Downloads an image, returning (local_filename, data). `data` is only
+        kept in memory result mode.
+        """
+        if self.result_mode == "disk":
+            return self._download_img_from_url(url, ext=ext), None
+
+        r = self._request("GET", url, endpoint=self._get_endpoint(url, include_path=False))
+        if r.status_code != 200:
+            return None, None
+        return self._store_img_bytes(r.content, ext=ext or get_ext(url)), r.content
+
+    async def _afetch_img(
+        self,
+        url: str,
+        ext: str = None
+    ) -> Tuple[Union[Path, Future, None], Optional[bytes]]:
+        if self.result_mode == "disk":
+            return await self._adownload_img_from_url(url, ext=ext), None
+
+        async def handler(r) -> Optional[bytes]:
+            if r.status != 200:
+                return None
+            return await r.read()
+
+        data = await self._arequest(
+            "GET", url, handler, endpoint=self._get_endpoint(url, include_path=False)
+        )
+        if data is None:
+            return None, None
+        return self._store_img_bytes(data, ext=ext or get_ext(url)), data
+
     def _download_img_from_url(
         self,
         url: str,
         filename: str = None,
         ext: str = None
     ) -> Path:
-        r = self.requests_session.get(url, stream=True)
+        with get_tracer().span("download_img", cat="io", url=url):
+            r = self._request(
+                "GET", url, endpoint=self._get_endpoint(url, include_path=False), stream=True
+            )
+
+            full_path = None
+            if r.status_code == 200:
+                if filename is None and ext is None:
+                    ext = get_ext(url)
+                elif filename is not None and ext is None:
+                    ext = get_ext(filename)
+                full_path = self.storage.stream_to_tmp(r, filename, ext)
+        return full_path
 
-        full_path = None
-        if r.status_code == 200:
+    async def _adownload_img_from_url(
+        self,
+        url: str,
+        filename: str = None,
+        ext: str = None
+    ) -> Path:
+        async def handler(r) -> Optional[Path]:
+            if r.status != 200:
+                return None
+            ext_ = ext
             if filename is None and ext is None:
-                ext = get_ext(url)
+                ext_ = get_ext(url)
             elif filename is not None and ext is None:
-                ext = get_ext(filename)
-            full_path = self.storage.stream_to_tmp(r, filename, ext)
-        return full_path
+                ext_ = get_ext(filename)
+            return await self.storage.astream_to_tmp(r, filename, ext_)
+
+        return await self._arequest(
+            "GET", url, handler, endpoint=self._get_endpoint(url, include_path=False)
+        )
 
     def _post_with_retry(
         self,
@@ -65,26 +370,59 @@ class BaseAPIProvider(metaclass=ABCMeta):
         payload: Any,
     ) -> Dict[str, Any]:
         data = json.dumps(payload)
-        return self.requests_session.post(url, headers=headers, data=data)
+        return self._request("POST", url, headers=headers, data=data)
+
+    async def _apost(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: Any,
+    ) -> Dict[str, Any]:
+        data = json.dumps(payload)
 
+        async def handler(r) -> Dict[str, Any]:
+            return await r.json(content_type=None)
 
-class APIResult(object):
-    def __init__(self) -> None:
-        self.results = []
+        return await self._arequest("POST", url, handler, headers=headers, data=data)
 
-    def add(
-        self,
-        local_filename: str = None,
-        remote_url: str = None,
-    ) -> None:
-        self.results.append({
-            "img": PIL.Image.open(str(local_filename)),
-            "local_filename": local_filename,
-            "remote_url": remote_url,
-        })
 
-    def get_image(self, idx: int) -> PIL.Image:
-        return self.results[idx].get("img", None)
+class WrappedAPIProvider(BaseAPIProvider):
+    """
+    Base for providers that add behavior around another provider. The wrapped
+    provider owns params, storage and transport; attribute lookups that miss
+    on the wrapper fall through to it.
+    """
+
+    delegates: bool = True
+
+    def __init__(self, api: BaseAPIProvider) -> None:
+        self.api = api
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "api":
+            raise AttributeError(name)
+        return getattr(self.api, name)
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self.api.params
+
+    def unwrap(self) -> BaseAPIProvider:
+        api = self.api
+        while isinstance(api, WrappedAPIProvider):
+            api = api.api
+        return api
+
+    def fork(self) -> BaseAPIProvider:
+        wrapper = copy.copy(self)
+        wrapper.api = self.api.fork()
+        return wrapper
+
+    def set_result_mode(self, mode: str, persist: bool = True) -> None:
+        self.api.set_result_mode(mode, persist)
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        return self.api.run(inp, params)
 
-    def __len__(self) -> int:
-        return len(self.results)
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        return await self.api.arun(inp, params)
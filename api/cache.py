@@ -0,0 +1,388 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import PIL
+
+from chisel.api.base_api_provider import (
+    APIResult, BaseAPIProvider, WrappedAPIProvider
+)
+from chisel.data_types import Image
+from chisel.storage.local_fs import LocalFS
+from chisel.util.files import get_ext
+from chisel.util.tracing import bind_context
+
+
+# Params that carry credentials or delivery details rather than anything that
+# changes the generated image.
+IGNORED_PARAMS = {"key", "webhook", "track_id"}
+
+# put() stages entries in ".<key>.<uuid>" directories; ones older than this
+# are from a put() that died.
+STALE_TMP_SECONDS = 3600
+
+
+def hash_input(inp: Any) -> Any:
+    """
+    Returns a JSON-serializable digest of an op input. Images (PIL, ndarray,
+    bytes, or paths to files) are reduced to a hash of their content so that
+    the same image reached through different paths hashes the same.
+    """
+    if inp is None or isinstance(inp, (bool, int, float)):
+        return inp
+    if isinstance(inp, (list, tuple)):
+        return [hash_input(x) for x in inp]
+    if isinstance(inp, Image):
+        # Don't download an image that's only known by its URL just to hash it.
+        if not inp.has_local():
+            return str(inp.url)
+        return _hash_image(inp)
+    numpy = sys.modules.get("numpy", None)
+    if (
+        isinstance(inp, (bytes, bytearray, memoryview, PIL.Image.Image))
+        or (numpy is not None and isinstance(inp, numpy.ndarray))
+        or (isinstance(inp, (str, Path)) and os.path.isfile(str(inp)))
+    ):
+        return _hash_image(Image.coerce(inp))
+    return str(inp)
+
+
+def _hash_image(img: Image) -> str:
+    # Hash decoded pixels so that bytes, a path, an array or a PIL image hash
+    # the same as each other and as an Image wrapping them. Anything that
+    # doesn't decode as an image is hashed as given.
+    try:
+        return "img:" + img.content_hash
+    except (OSError, ValueError, TypeError):
+        pass
+    try:
+        return "bytes:" + hashlib.sha256(img.get_bytes()).hexdigest()
+    except (OSError, ValueError, TypeError):
+        import numpy
+
+        array = img.array
+        h = hashlib.sha256(f"{array.dtype}:{array.shape}".encode())
+        h.update(numpy.ascontiguousarray(array).tobytes())
+        return "ndarray:" + h.hexdigest()
+
+
+def _normalize_param(value: Any) -> Any:
+    # StableDiffusionAPI sends numbers as strings ("512") while the other
+    # providers use ints, so compare them by their string form.
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def get_effective_params(
+    api: BaseAPIProvider,
+    params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    effective = dict(api.get_params())
+    if params is not None and isinstance(params, dict):
+        for k, v in params.items():
+            if k in effective:
+                effective[k] = v
+    return effective
+
+
+def request_key(
+    api: BaseAPIProvider,
+    inp: Any,
+    params: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Returns a content address for a provider call: the provider class, its
+    ModelType, the normalized params and a hash of the input.
+    """
+    if isinstance(api, WrappedAPIProvider):
+        api = api.unwrap()
+    effective = get_effective_params(api, params)
+    model_type = api.model_type.model_type if api.model_type is not None else None
+    blob = json.dumps(
+        {
+            "provider": f"{type(api).__module__}.{type(api).__qualname__}",
+            "model_type": model_type,
+            "params": {
+                k: _normalize_param(v) for k, v in effective.items()
+                if k not in IGNORED_PARAMS
+            },
+            "input": hash_input(inp),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(
+    api: BaseAPIProvider,
+    params: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """
+    Whether a call reproduces its output, as the provider declares: always,
+    or for seeded providers only when a seed is set.
+    """
+    if isinstance(api, WrappedAPIProvider):
+        api = api.unwrap()
+    backends = getattr(api, "apis", None)
+    if backends is not None:
+        # A RoutingProvider may send the call to any of its backends.
+        return all(is_deterministic(backend, params) for backend in backends)
+    if api.deterministic:
+        return True
+    if api.seeded:
+        return get_effective_params(api, params).get("seed", None) is not None
+    return False
+
+
+class ResultCache(object):
+    """
+    A size-bounded LRU cache of APIResults on disk under LocalFS, with an
+    in-memory index so lookups never scan the cache directory.
+
+    Each entry is a directory named by its key holding the result images and
+    a manifest.json; the manifest's mtime records when it was last used, which
+    is how LRU order survives a restart.
+    """
+
+    manifest_name: str = "manifest.json"
+
+    def __init__(
+        self,
+        storage_dir: str = "~/chisel",
+        max_bytes: int = 2 * 1024 ** 3,
+    ) -> None:
+        self.storage = LocalFS(storage_dir)
+        self.cache_dir = self.storage.get_dir("cache")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[str, Tuple[List[Dict[str, Any]], int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        entries = []
+        now = time.time()
+        for entry_dir in self.cache_dir.iterdir():
+            if entry_dir.name.startswith("."):
+                # A put() in progress, maybe by another instance or process;
+                # only clear out ones long since abandoned.
+                try:
+                    if now - entry_dir.stat().st_mtime > STALE_TMP_SECONDS:
+                        shutil.rmtree(str(entry_dir), ignore_errors=True)
+                except FileNotFoundError:
+                    pass
+                continue
+            entry = self._read_entry(entry_dir.name)
+            if entry is None:
+                continue
+            files, size, mtime = entry
+            entries.append((mtime, entry_dir.name, files, size))
+
+        for _, key, files, size in sorted(entries):
+            self._index[key] = (files, size)
+            self._size += size
+
+    def _read_entry(self, key: str) -> Optional[Tuple[List[Dict[str, Any]], int, float]]:
+        entry_dir = self.cache_dir / key
+        manifest_path = entry_dir / self.manifest_name
+        try:
+            with open(str(manifest_path), "r") as f:
+                files = json.load(f)
+            size = sum((entry_dir / x["filename"]).stat().st_size for x in files)
+            return files, size, manifest_path.stat().st_mtime
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            return None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Optional[APIResult]:
+        with self._lock:
+            entry = self._index.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+
+        entry_dir = self.cache_dir / key
+        try:
+            os.utime(str(entry_dir / self.manifest_name))
+            api_result = APIResult()
+            for x in entry[0]:
+                # Entries decode lazily, so they get their own link to each
+                # file: a later put() may evict this key before they're read.
+                local_filename = self.storage.link_to_tmp(entry_dir / x["filename"])
+                api_result.add(local_filename, remote_url=x["remote_url"])
+        except FileNotFoundError:
+            # Removed from disk behind our back; treat it as a miss.
+            self._remove(key)
+            return None
+        return api_result
+
+    def put(self, key: str, api_result: APIResult) -> bool:
+        """
+        Copies the images of `api_result` into the cache, or writes their
+        bytes for results only held in memory. Returns False if the result
+        can't be cached (e.g. an image was neither kept nor written to disk).
+        """
+        if not isinstance(api_result, APIResult) or len(api_result) == 0:
+            return False
+        sources = []
+        for r in api_result.results:
+            # A spilled entry writes its file before dropping its bytes, so
+            # reading the bytes first always finds one or the other.
+            data = r.get("data", None)
+            local_filename = r.get("local_filename", None)
+            if local_filename is None and data is None:
+                return False
+            sources.append((local_filename, data, r.get("remote_url", None)))
+
+        tmp_dir = self.cache_dir / f".{key}.{uuid.uuid4().hex}"
+        tmp_dir.mkdir(parents=True)
+        files = []
+        size = 0
+        for i, (local_filename, data, remote_url) in enumerate(sources):
+            if local_filename is not None:
+                filename = f"{i}{Path(str(local_filename)).suffix}"
+                shutil.copyfile(str(local_filename), str(tmp_dir / filename))
+            else:
+                filename = f"{i}{(get_ext(remote_url) if remote_url else None) or '.png'}"
+                with open(str(tmp_dir / filename), "wb") as f:
+                    f.write(data)
+            size += (tmp_dir / filename).stat().st_size
+            files.append({"filename": filename, "remote_url": remote_url})
+        with open(str(tmp_dir / self.manifest_name), "w") as f:
+            json.dump(files, f)
+
+        with self._lock:
+            if key in self._index:
+                shutil.rmtree(str(tmp_dir), ignore_errors=True)
+                return True
+            try:
+                os.replace(str(tmp_dir), str(self.cache_dir / key))
+            except OSError:
+                # Another instance or process got there first: keep theirs.
+                shutil.rmtree(str(tmp_dir), ignore_errors=True)
+                entry = self._read_entry(key)
+                if entry is None:
+                    return False
+                files, size, _ = entry
+            self._index[key] = (files, size)
+            self._size += size
+            evicted = self._evict()
+
+        for evicted_key in evicted:
+            shutil.rmtree(str(self.cache_dir / evicted_key), ignore_errors=True)
+        return True
+
+    def _evict(self) -> List[str]:
+        evicted = []
+        # Always keep the newest entry, even if it alone is over budget.
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key, (_, size) = self._index.popitem(last=False)
+            self._size -= size
+            evicted.append(key)
+        return evicted
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+        shutil.rmtree(str(self.cache_dir / key), ignore_errors=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._index.keys())
+            self._index.clear()
+            self._size = 0
+        for key in keys:
+            shutil.rmtree(str(self.cache_dir / key), ignore_errors=True)
+
+
+_caches: Dict[str, ResultCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_result_cache(
+    storage_dir: str = "~/chisel",
+    max_bytes: int = 2 * 1024 ** 3,
+) -> ResultCache:
+    """
+    Returns the process-wide ResultCache for `storage_dir`, so that every op
+    caching there shares one index and one max_bytes bound. `max_bytes` only
+    applies when the cache is first created.
+    """
+    path = os.path.realpath(os.path.expanduser(storage_dir))
+    cache = _caches.get(path, None)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(path, None)
+            if cache is None:
+                cache = ResultCache(path, max_bytes)
+                _caches[path] = cache
+    return cache
+
+
+class CachedAPIProvider(WrappedAPIProvider):
+    """
+    Wraps a provider so that calls with the same provider, ModelType, params
+    and input are served from a ResultCache without any network I/O. Calls
+    whose output isn't reproducible (a seeded provider with seed=None) always
+    go to the wrapped provider.
+    """
+
+    def __init__(self, api: BaseAPIProvider, cache: ResultCache) -> None:
+        super().__init__(api)
+        self.cache = cache
+
+    def get_key(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Optional[str]:
+        if not is_deterministic(self.api, params):
+            return None
+        return request_key(self.api, inp, params)
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        key = self.get_key(inp, params)
+        if key is None:
+            return self.api.run(inp, params)
+
+        result = self.cache.get(key)
+        if result is None:
+            result = self.api.run(inp, params)
+            self.cache.put(key, result)
+        return result
+
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        key = self.get_key(inp, params)
+        if key is None:
+            return await self.api.arun(inp, params)
+
+        result = self.cache.get(key)
+        if result is None:
+            result = await self.api.arun(inp, params)
+            # put() copies the result's files; keep that off the event loop.
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, bind_context(self.cache.put), key, result)
+        return result
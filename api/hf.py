@@ -4,27 +4,28 @@ from typing import Any, Dict, List
 
 from PIL import Image
 
-from chisel.api.base_api_provider import (
-    APIResult, BaseAPIProvider
-)
+from chisel.api.base_api_provider import BaseAPIProvider
 
 
 class HF(BaseAPIProvider):
     api_key_name: str = "HF_API_KEY"
+    base_url: str = "https://api-inference.huggingface.co/models"
 
     def __init__(self) -> None:
         super().__init__()
         self.api_key = os.environ.get(self.api_key_name)
 
     def _process_results(self, response) -> List[Any]:
-        api_result = APIResult()
+        return self._process_content(
+            response.headers['Content-Type'], response.content
+        )
 
-        if response.headers['Content-Type'] == 'image/jpeg':
-            data = response.content
-            full_path = self.storage.write_to_tmp(data, ext=".png")
+    def _process_content(self, content_type: str, content: bytes) -> List[Any]:
+        if content_type == 'image/jpeg':
+            full_path = self.storage.write_to_tmp(content, ext=".png")
             return Image.open(full_path)
         else:
-            data = json.loads(response.content.decode("utf-8"))
+            data = json.loads(content.decode("utf-8"))
             self.storage.write_to_tmp(data, ext=".txt")
             return data
 
@@ -33,16 +34,30 @@ class HFInference(HF):
     def __init__(self) -> None:
         super().__init__()
 
-    def run(self, inp: Any, params: Dict[str, str] = None) -> Any:
+    def _get_request(self, params: Dict[str, str] = None) -> Any:
         model_id = params.get("model_id", None)
         txt_to_img = params.get("txt_to_img", False)
 
-        api_url = f"https://api-inference.huggingface.co/models/{model_id}"
+        api_url = f"{self.base_url}/{model_id}"
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             'Content-Type': 'application/json',
         }
+        return api_url, headers
 
+    def run(self, inp: Any, params: Dict[str, str] = None) -> Any:
+        api_url, headers = self._get_request(params)
         response = self._post_with_retry(api_url, headers, inp)
         return self._process_results(response)
+
+    async def arun(self, inp: Any, params: Dict[str, str] = None) -> Any:
+        api_url, headers = self._get_request(params)
+
+        async def handler(response):
+            return response.headers['Content-Type'], await response.read()
+
+        content_type, content = await self._arequest(
+            "POST", api_url, handler, headers=headers, data=json.dumps(inp)
+        )
+        return self._process_content(content_type, content)
@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from chisel.api.resilience import (
+    RETRY_STATUSES, RetryableHTTPError, is_retryable, parse_retry_after
+)
+from chisel.util.transport import Transport, get_transport
+
+
+class JobTimeoutError(Exception):
+    pass
+
+
+class JobFetchError(Exception):
+    pass
+
+
+class _Job(object):
+    def __init__(
+        self,
+        fetch_url: str,
+        payload: Dict[str, Any],
+        deadline: float,
+        future: Future,
+    ) -> None:
+        self.fetch_url = fetch_url
+        self.payload = payload
+        self.deadline = deadline
+        self.future = future
+        self.attempts = 0
+
+
+class JobPoller(object):
+    """
+    Tracks jobs that a provider accepted but hasn't finished ("processing")
+    and polls their fetch endpoints until they land. All jobs are multiplexed
+    on one event loop running in a background thread, and each job is polled
+    when its ETA says it should be ready rather than on a fixed interval.
+
+    Futures resolve to the provider's final response (whatever its status
+    other than "processing"), so callers parse it exactly like a synchronous
+    response.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        timeout: float = 600.0,
+        transport: Optional[Transport] = None,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.transport = transport
+        self._heap: List[Tuple[float, int, _Job]] = []
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run_loop, name="chisel-job-poller", daemon=True
+                )
+                self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._started.set()
+        self._loop.run_until_complete(self._poll_forever())
+
+    def _delay_for(self, eta: Optional[float], attempts: int) -> float:
+        if eta is not None:
+            try:
+                delay = float(eta)
+            except (TypeError, ValueError):
+                delay = None
+            if delay is not None and delay > 0:
+                return min(max(delay, self.min_interval), self.max_interval)
+        # No usable ETA: back off exponentially from min_interval.
+        return min(self.min_interval * (2 ** attempts), self.max_interval)
+
+    def submit(
+        self,
+        fetch_url: str,
+        payload: Dict[str, Any],
+        eta: Optional[float] = None,
+    ) -> Future:
+        """
+        Starts tracking a job. Thread-safe; returns a concurrent Future.
+        """
+        self._ensure_started()
+        future: Future = Future()
+        job = _Job(fetch_url, payload, time.monotonic() + self.timeout, future)
+        self._loop.call_soon_threadsafe(
+            self._schedule, job, self._delay_for(eta, 0)
+        )
+        return future
+
+    async def asubmit(
+        self,
+        fetch_url: str,
+        payload: Dict[str, Any],
+        eta: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        return await asyncio.wrap_future(self.submit(fetch_url, payload, eta))
+
+    def pending(self) -> int:
+        return len(self._heap) + self._in_flight
+
+    def _schedule(self, job: _Job, delay: float) -> None:
+        due = time.monotonic() + delay
+        if due > job.deadline:
+            due = job.deadline
+        heapq.heappush(self._heap, (due, next(self._seq), job))
+        self._wakeup.set()
+
+    async def _poll_forever(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, job = heapq.heappop(self._heap)
+                self._in_flight += 1
+                asyncio.ensure_future(self._poll(job))
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job: _Job) -> None:
+        try:
+            if job.future.cancelled():
+                return
+            if time.monotonic() >= job.deadline:
+                job.future.set_exception(JobTimeoutError(
+                    f"Job at {job.fetch_url} didn't finish within {self.timeout}s."
+                ))
+                return
+
+            job.attempts += 1
+            response = None
+            eta = None
+            try:
+                response = await self._fetch(job)
+            except Exception as e:
+                # Transient errors are retried until the deadline; others,
+                # like a 4xx, won't go away and fail the job.
+                if not is_retryable(e):
+                    raise
+                eta = getattr(e, "retry_after", None)
+
+            if response is not None and response.get("status", None) != "processing":
+                job.future.set_result(response)
+                return
+
+            if response is not None:
+                eta = response.get("eta", None)
+            self._schedule(job, self._delay_for(eta, job.attempts))
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+
+    async def _fetch(self, job: _Job) -> Dict[str, Any]:
+        transport = self.transport if self.transport is not None else get_transport()
+        session = transport.aiohttp_session()
+        headers = {"Content-Type": "application/json"}
+        async with session.post(
+            job.fetch_url, headers=headers, data=json.dumps(job.payload)
+        ) as r:
+            if r.status in RETRY_STATUSES:
+                raise RetryableHTTPError(
+                    job.fetch_url, r.status, parse_retry_after(r.headers.get("Retry-After"))
+                )
+            if r.status >= 400:
+                raise JobFetchError(f"HTTP {r.status} from {job.fetch_url}")
+            return await r.json(content_type=None)
+
+
+_job_poller: Optional[JobPoller] = None
+_job_poller_lock = threading.Lock()
+
+
+def get_job_poller() -> JobPoller:
+    global _job_poller
+    if _job_poller is None:
+        with _job_poller_lock:
+            if _job_poller is None:
+                _job_poller = JobPoller()
+    return _job_poller
@@ -1,9 +1,12 @@
-from pathlib import Path
-from typing import Any, Dict, List, Optional
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import openai
 
 from chisel.api.base_api_provider import APIResult, BaseAPIProvider
+from chisel.api.resilience import RETRY_STATUSES, RetryableError, parse_retry_after
+from chisel.data_types import Image
+from chisel.model_type import ModelType
 from chisel.util.env_handler import EnvHandler
 
 
@@ -18,24 +21,101 @@ class OpenAI(BaseAPIProvider):
                 + "before using this class"
             )
         openai.api_key = EnvHandler.get(self.api_key_name)
+        openai.requestssession = self.requests_session
+
+    def _use_shared_aiosession(self) -> None:
+        openai.aiosession.set(self.transport.aiohttp_session())
+
+    def _to_retryable(self, e: openai.error.OpenAIError) -> Exception:
+        transient = (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.APIConnectionError,
+            openai.error.Timeout,
+            openai.error.TryAgain,
+        )
+        if isinstance(e, transient) or (
+            isinstance(e, openai.error.APIError) and e.http_status in RETRY_STATUSES
+        ):
+            headers = e.headers or {}
+            retry_after = headers.get("Retry-After", headers.get("retry-after", None))
+            return RetryableError(str(e), parse_retry_after(retry_after))
+        return e
+
+    def _rewind(self, request: Dict[str, Any]) -> None:
+        # A retry has to re-send uploads from the start.
+        for v in request.values():
+            if hasattr(v, "seek"):
+                v.seek(0)
+
+    def _get_upload_size(self, request: Dict[str, Any]) -> int:
+        return sum(len(v) for v in request.values() if isinstance(v, bytes))
+
+    def _call(
+        self,
+        endpoint: str,
+        fn: Callable[..., Any],
+        request: Dict[str, Any]
+    ) -> Any:
+        def send() -> Any:
+            self._rewind(request)
+            self._record_bytes(self._get_upload_size(request), 0)
+            try:
+                return fn(**request)
+            except openai.error.OpenAIError as e:
+                raise self._to_retryable(e) from e
+
+        return self.resilience.call(self.get_provider_name(), endpoint, send)
+
+    async def _acall(
+        self,
+        endpoint: str,
+        fn: Callable[..., Awaitable[Any]],
+        request: Dict[str, Any]
+    ) -> Any:
+        self._use_shared_aiosession()
+
+        async def send() -> Any:
+            self._rewind(request)
+            self._record_bytes(self._get_upload_size(request), 0)
+            try:
+                return await fn(**request)
+            except openai.error.OpenAIError as e:
+                raise self._to_retryable(e) from e
+
+        return await self.resilience.acall(self.get_provider_name(), endpoint, send)
+
+    def _get_result_urls(self, response) -> List[str]:
+        results = response.get("data", None)
+        if results is None:
+            return []
+        return [
+            result.get("url") for result in results
+            if result.get("url", None) is not None
+        ]
 
     def _process_results(self, response) -> List[Any]:
         api_result = APIResult()
+        for url in self._get_result_urls(response):
+            local_filename, data = self._fetch_img(url, ext=".png")
+            api_result.add(local_filename, remote_url=url, data=data)
+        return api_result
 
-        results = response.get("data", None)
-        if results is None:
-            return api_result
-
-        for i, result in enumerate(results):
-            url = result.get("url", None)
-            if url is None:
-                continue
-            local_filename = self._download_img_from_url(url, ext=".png")
-            api_result.add(local_filename, remote_url=url)
+    async def _aprocess_results(self, response) -> List[Any]:
+        urls = self._get_result_urls(response)
+        images = await asyncio.gather(
+            *[self._afetch_img(url, ext=".png") for url in urls]
+        )
+
+        api_result = APIResult()
+        for (local_filename, data), url in zip(images, urls):
+            api_result.add(local_filename, remote_url=url, data=data)
         return api_result
 
 
 class OpenAITxtToImg(OpenAI):
+    model_type: ModelType = ModelType.TXT2IMG
+
     def __init__(self) -> None:
         super().__init__()
         self.params: Dict[str, Any] = {
@@ -43,18 +123,38 @@ class OpenAITxtToImg(OpenAI):
             "samples": 1,
         }
 
-    def run(self, inp: str, params: Optional[Dict[str, str]] = None) -> Any:
+    def _get_request(
+        self,
+        inp: str,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         if not isinstance(inp, str):
             raise ValueError("Expected inp to be a str (prompt).")
 
+        self.set_params(params)
         width = self.params.get("width", 512)
-        response = openai.Image.create(
-            prompt=inp, n=self.params.get("samples", 1), size=f"{width}x{width}"
+        return {
+            "prompt": inp,
+            "n": self.params.get("samples", 1),
+            "size": f"{width}x{width}",
+        }
+
+    def run(self, inp: str, params: Optional[Dict[str, str]] = None) -> Any:
+        response = self._call(
+            "images/generations", openai.Image.create, self._get_request(inp, params)
         )
         return self._process_results(response)
 
+    async def arun(self, inp: str, params: Optional[Dict[str, str]] = None) -> Any:
+        response = await self._acall(
+            "images/generations", openai.Image.acreate, self._get_request(inp, params)
+        )
+        return await self._aprocess_results(response)
+
 
 class OpenAIImgToImg(OpenAI):
+    model_type: ModelType = ModelType.IMG2IMG
+
     def __init__(self) -> None:
         super().__init__()
         self.params: Dict[str, Any] = {
@@ -62,20 +162,40 @@ class OpenAIImgToImg(OpenAI):
             "samples": 1,
         }
 
-    def run(self, inp: str, params: Optional[Dict[str, str]] = None) -> Any:
-        if not isinstance(inp, str) and not isinstance(inp, Path):
-            raise ValueError("Expected inp to be a str or Path (path to img).")
-
+    def _get_request(
+        self,
+        inp: str,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        self.set_params(params)
         width = self.params.get("width", 512)
-        response = openai.Image.create_variation(
-            image=open(str(inp), "rb"),
-            n=self.params.get("samples", 1),
-            size=f"{width}x{width}",
+        return {
+            # OpenAI takes PNG uploads; a PNG input is sent without re-encoding.
+            "image": Image.coerce(inp).png_bytes,
+            "n": self.params.get("samples", 1),
+            "size": f"{width}x{width}",
+        }
+
+    def run(self, inp: str, params: Optional[Dict[str, str]] = None) -> Any:
+        response = self._call(
+            "images/variations",
+            openai.Image.create_variation,
+            self._get_request(inp, params),
         )
         return self._process_results(response)
 
+    async def arun(self, inp: str, params: Optional[Dict[str, str]] = None) -> Any:
+        response = await self._acall(
+            "images/variations",
+            openai.Image.acreate_variation,
+            self._get_request(inp, params),
+        )
+        return await self._aprocess_results(response)
+
 
 class OpenAIImgEdit(OpenAI):
+    model_type: ModelType = ModelType.IMG_EDIT
+
     def __init__(self) -> None:
         super().__init__()
         self.params: Dict[str, Any] = {
@@ -83,16 +203,32 @@ class OpenAIImgEdit(OpenAI):
             "samples": 1,
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+    def _get_request(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         if not isinstance(inp, list):
             raise ValueError("Expected inp to be a list of three: [prompt, img, mask]")
 
+        self.set_params(params)
         width = self.params.get("width", 512)
-        response = openai.Image.create_edit(
-            image=open(inp[1], "rb"),
-            mask=open(inp[2], "rb"),
-            prompt=inp[0],
-            n=self.params.get("samples", 1),
-            size=f"{width}x{width}",
+        return {
+            "image": Image.coerce(inp[1]).png_bytes,
+            "mask": Image.coerce(inp[2]).png_bytes,
+            "prompt": inp[0],
+            "n": self.params.get("samples", 1),
+            "size": f"{width}x{width}",
+        }
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        response = self._call(
+            "images/edits", openai.Image.create_edit, self._get_request(inp, params)
         )
         return self._process_results(response)
+
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        response = await self._acall(
+            "images/edits", openai.Image.acreate_edit, self._get_request(inp, params)
+        )
+        return await self._aprocess_results(response)
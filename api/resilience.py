@@ -0,0 +1,342 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import requests
+
+from chisel.util.metrics import get_metrics
+from chisel.util.tracing import get_tracer
+
+
+# Statuses worth retrying: throttling and transient server-side failures.
+# 404 and the other 4xx won't change on a retry.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# grpc.StatusCode names, so that grpc is only imported by the providers
+# that use it.
+RETRY_GRPC_CODES = {"UNAVAILABLE", "RESOURCE_EXHAUSTED", "DEADLINE_EXCEEDED"}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryableError(Exception):
+    """
+    Raised by a call to signal a transient failure, optionally carrying the
+    server's Retry-After delay in seconds.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RetryableHTTPError(RetryableError):
+    def __init__(self, url: str, status: int, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"HTTP {status} from {url}", retry_after)
+        self.url = url
+        self.status = status
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, RetryableError):
+        return True
+    if isinstance(e, (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError)):
+        return True
+    # aiohttp and grpc errors can only exist if their modules were loaded.
+    aiohttp = sys.modules.get("aiohttp", None)
+    if aiohttp is not None and isinstance(e, aiohttp.ClientConnectionError):
+        return True
+    grpc = sys.modules.get("grpc", None)
+    if grpc is not None and isinstance(e, grpc.RpcError) and hasattr(e, "code"):
+        return e.code().name in RETRY_GRPC_CODES
+    return False
+
+
+class CircuitBreaker(object):
+    """
+    Opens after `failure_threshold` consecutive transient failures and fails
+    calls fast for `reset_timeout` seconds. After that a single trial call is
+    let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit for {self.name} is open.")
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError(f"Circuit for {self.name} is half-open.")
+                self._trial_in_flight = True
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_neutral(self) -> None:
+        # The call failed for a reason unrelated to the endpoint's health.
+        with self._lock:
+            self._trial_in_flight = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class RetryBudget(object):
+    """
+    Caps retries to a fraction of traffic: every request deposits `ratio`
+    tokens, every retry spends one. `min_tokens` lets low-traffic callers
+    retry at all. During an incident this keeps retries from multiplying
+    the load on an already struggling provider.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_tokens: float = 10.0,
+        max_tokens: float = 100.0,
+    ) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1.0:
+                self.rejected += 1
+                return False
+            self.tokens -= 1.0
+            self.retries += 1
+            return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+
+class Resilience(object):
+    """
+    Process-wide retry policy: a circuit breaker per (provider, endpoint),
+    one shared RetryBudget, and full-jitter exponential backoff that honors
+    Retry-After.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.2,
+        max_delay: float = 20.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        budget_ratio: float = 0.2,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.budget = RetryBudget(ratio=budget_ratio)
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get_breaker(self, provider: str, endpoint: str) -> CircuitBreaker:
+        key = (provider, endpoint)
+        breaker = self._breakers.get(key, None)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key, None)
+                if breaker is None:
+                    breaker = CircuitBreaker(
+                        f"{provider} {endpoint}",
+                        failure_threshold=self.failure_threshold,
+                        reset_timeout=self.reset_timeout,
+                    )
+                    self._breakers[key] = breaker
+        return breaker
+
+    def get_states(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            "breakers": {b.name: b.to_dict() for b in breakers.values()},
+            "budget": self.budget.to_dict(),
+        }
+
+    def get_delay(self, attempt: int, e: BaseException) -> Optional[float]:
+        """
+        Returns how long to wait before retry number `attempt` + 1, or None
+        if the call shouldn't be retried.
+        """
+        if attempt + 1 >= self.max_attempts or not is_retryable(e):
+            return None
+        retry_after = getattr(e, "retry_after", None)
+        if retry_after is not None and retry_after > self.max_delay:
+            # The server asked for a longer pause than we're willing to block.
+            return None
+        if not self.budget.withdraw():
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _on_error(self, breaker: CircuitBreaker, e: BaseException) -> None:
+        if is_retryable(e):
+            breaker.record_failure()
+        else:
+            breaker.record_neutral()
+
+    def call(self, provider: str, endpoint: str, fn: Callable[[], Any]) -> Any:
+        breaker = self.get_breaker(provider, endpoint)
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                self._on_error(breaker, e)
+                # Don't retry into a breaker this failure just opened.
+                delay = None if breaker.is_open() else self.get_delay(attempt, e)
+                if delay is None:
+                    raise
+                get_metrics().retries.inc(provider=provider, endpoint=endpoint)
+                with get_tracer().span(
+                    "retry_backoff", cat="retry", endpoint=endpoint, attempt=attempt + 1,
+                    error=type(e).__name__,
+                ):
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    async def acall(
+        self,
+        provider: str,
+        endpoint: str,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        breaker = self.get_breaker(provider, endpoint)
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                breaker.record_neutral()
+                raise
+            except Exception as e:
+                self._on_error(breaker, e)
+                # Don't retry into a breaker this failure just opened.
+                delay = None if breaker.is_open() else self.get_delay(attempt, e)
+                if delay is None:
+                    raise
+                get_metrics().retries.inc(provider=provider, endpoint=endpoint)
+                with get_tracer().span(
+                    "retry_backoff", cat="retry", endpoint=endpoint, attempt=attempt + 1,
+                    error=type(e).__name__,
+                ):
+                    await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+
+_resilience: Optional[Resilience] = None
+_resilience_lock = threading.Lock()
+
+
+def get_resilience() -> Resilience:
+    global _resilience
+    if _resilience is None:
+        with _resilience_lock:
+            if _resilience is None:
+                _resilience = Resilience()
+    return _resilience
+
+
+def configure_resilience(**kwargs) -> Resilience:
+    """
+    Replaces the process-wide policy. Takes the same keyword arguments as
+    Resilience.
+    """
+    global _resilience
+    with _resilience_lock:
+        _resilience = Resilience(**kwargs)
+    return _resilience
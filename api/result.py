@@ -0,0 +1,284 @@
+import io
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+import PIL
+
+from chisel.data_types import Image
+from chisel.storage.local_fs import LocalFS
+from chisel.util.files import get_ext
+from chisel.util.tracing import get_tracer
+
+
+class ResultMemoryBudget(object):
+    """
+    Caps the memory held by result images across every live APIResult:
+    encoded bytes kept in memory plus decoded pixels. When the total goes
+    over `max_bytes`, the least recently used entries spill to disk (their
+    bytes are written to LocalFS if no file exists yet) and drop what they
+    hold in memory; they're reloaded from disk on next access.
+    """
+
+    def __init__(self, max_bytes: int, storage_dir: str = "~/chisel") -> None:
+        self.max_bytes = max_bytes
+        self.storage_dir = storage_dir
+        self.spills = 0
+        self._storage: Optional[LocalFS] = None
+        self._entries: "OrderedDict[int, Tuple[weakref.ref, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_size(self) -> int:
+        return self._size
+
+    def get_storage(self) -> LocalFS:
+        if self._storage is None:
+            self._storage = LocalFS(self.storage_dir)
+        return self._storage
+
+    def touch(self, entry: "ResultEntry", nbytes: int) -> None:
+        """
+        Records that `entry` now holds `nbytes` in memory and marks it as the
+        most recently used.
+        """
+        key = id(entry)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            if nbytes > 0:
+                ref = weakref.ref(entry, lambda _, key=key: self._forget(key))
+                self._entries[key] = (ref, nbytes)
+                self._size += nbytes
+            evicted = self._evict()
+
+        for victim in evicted:
+            victim._spill(self)
+
+    def _forget(self, key: int) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+
+    def _evict(self) -> List["ResultEntry"]:
+        evicted = []
+        # Always keep the newest entry, even if it alone is over budget.
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, (ref, nbytes) = self._entries.popitem(last=False)
+            self._size -= nbytes
+            entry = ref()
+            if entry is not None:
+                evicted.append(entry)
+        self.spills += len(evicted)
+        return evicted
+
+
+_budget: Optional[ResultMemoryBudget] = None
+
+
+def get_result_budget() -> Optional[ResultMemoryBudget]:
+    return _budget
+
+
+def configure_result_budget(
+    max_bytes: Optional[int],
+    storage_dir: str = "~/chisel",
+) -> Optional[ResultMemoryBudget]:
+    """
+    Sets the process-wide memory budget for result images, or removes it
+    with max_bytes=None (the default: unbounded).
+    """
+    global _budget
+    _budget = None if max_bytes is None else ResultMemoryBudget(max_bytes, storage_dir)
+    return _budget
+
+
+class ResultEntry(object):
+    """
+    One image of an APIResult. Holds the encoded image bytes and/or a file in
+    LocalFS and only decodes the image when `img` is first read.
+
+    Supports dict-style access ("img", "local_filename", "remote_url",
+    "data") for code written against the old dict entries.
+    """
+
+    __slots__ = ("_local_filename", "_data", "_img", "remote_url", "__weakref__")
+
+    _keys = ("img", "local_filename", "remote_url", "data")
+
+    def __init__(
+        self,
+        local_filename: Union[str, Path, Future, None] = None,
+        remote_url: str = None,
+        data: Union[bytes, memoryview, None] = None,
+    ) -> None:
+        if isinstance(data, memoryview):
+            data = data.obj if isinstance(data.obj, bytes) else data.tobytes()
+        self._local_filename = local_filename
+        self._data = data
+        self._img = None
+        self.remote_url = remote_url
+        if data is not None:
+            self._account()
+
+    @property
+    def local_filename(self) -> Optional[Path]:
+        # Waits for a background write if one is still in flight.
+        if isinstance(self._local_filename, Future):
+            self._local_filename = self._local_filename.result()
+        return self._local_filename
+
+    @property
+    def data(self) -> Optional[memoryview]:
+        data = self._data
+        if data is None:
+            return None
+        return memoryview(data)
+
+    @property
+    def img(self) -> Optional[PIL.Image.Image]:
+        # Eviction may clear _img and _data from another thread at any point,
+        # so each is read once.
+        img = self._img
+        if img is None:
+            data = self._data
+            if data is not None:
+                # BytesIO shares the bytes object's buffer rather than copying.
+                img = PIL.Image.open(io.BytesIO(data))
+            elif self.local_filename is not None:
+                img = PIL.Image.open(str(self.local_filename))
+            else:
+                return None
+            # Decode now, which also closes the file, so that memory use is
+            # known and a large result set doesn't hold a descriptor per image.
+            with get_tracer().span("decode", cat="image", format=img.format):
+                img.load()
+            self._img = img
+        self._account()
+        return img
+
+    def to_image(self) -> Image:
+        """
+        Returns an Image handle sharing whatever this entry already holds, for
+        passing the result on to another op.
+        """
+        path = self._local_filename
+        if isinstance(path, Future):
+            path = path.result() if path.done() else None
+        img, data = self._img, self._data
+        if path is None and data is None and img is None:
+            return Image(url=self.remote_url)
+        return Image(pil=img, data=data, path=path, url=self.remote_url)
+
+    def is_resident(self) -> bool:
+        return self._img is not None or self._data is not None
+
+    def get_bytes(self) -> Optional[bytes]:
+        data = self._data
+        if data is not None:
+            return data
+        if self.local_filename is None:
+            return None
+        with open(str(self.local_filename), "rb") as f:
+            return f.read()
+
+    def release(self) -> None:
+        """
+        Drops the decoded image. It's decoded again on next access.
+        """
+        self._img = None
+        self._account()
+
+    def _get_nbytes(self) -> int:
+        data = self._data
+        nbytes = len(data) if data is not None else 0
+        img = self._img
+        if img is not None:
+            nbytes += img.width * img.height * len(img.getbands())
+        return nbytes
+
+    def _account(self) -> None:
+        budget = get_result_budget()
+        if budget is not None:
+            budget.touch(self, self._get_nbytes())
+
+    def _spill(self, budget: ResultMemoryBudget) -> None:
+        data = self._data
+        if data is not None and self.local_filename is None:
+            ext = get_ext(self.remote_url) if self.remote_url else None
+            self._local_filename = budget.get_storage().write_to_tmp(data, ext=ext or ".png")
+        self._img = None
+        self._data = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._keys:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self) -> str:
+        where = "memory" if self._data is not None else self._local_filename
+        return f"ResultEntry({where}, remote_url={self.remote_url!r})"
+
+
+class APIResult(object):
+    __slots__ = ("results",)
+
+    def __init__(self) -> None:
+        self.results: List[ResultEntry] = []
+
+    def add(
+        self,
+        local_filename: Union[str, Path, Future, None] = None,
+        remote_url: str = None,
+        data: Union[bytes, memoryview, None] = None,
+    ) -> ResultEntry:
+        with get_tracer().span("result.add", cat="result") as span:
+            entry = ResultEntry(local_filename, remote_url, data)
+            self.results.append(entry)
+            if data is not None:
+                span.set(bytes=len(data))
+        return entry
+
+    def extend(self, other: "APIResult") -> None:
+        self.results.extend(other.results)
+
+    def get_image(self, idx: int) -> PIL.Image:
+        return self.results[idx].img
+
+    def get_bytes(self, idx: int) -> Optional[bytes]:
+        return self.results[idx].get_bytes()
+
+    def to_image(self, idx: int = 0) -> Image:
+        return self.results[idx].to_image()
+
+    def iter_images(self, release: bool = True) -> Iterator[PIL.Image.Image]:
+        """
+        Yields the images one at a time. With `release`, each decoded image
+        is dropped from the result once the consumer moves on, so only one
+        is held at a time.
+        """
+        for entry in self.results:
+            img = entry.img
+            yield img
+            if release:
+                entry.release()
+
+    def __iter__(self) -> Iterator[ResultEntry]:
+        return iter(self.results)
+
+    def __getitem__(self, idx: int) -> ResultEntry:
+        return self.results[idx]
+
+    def __len__(self) -> int:
+        return len(self.results)
@@ -0,0 +1,307 @@
+import asyncio
+import copy
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, Sequence
+
+from chisel.api.base_api_provider import BaseAPIProvider, WrappedAPIProvider
+from chisel.api.resilience import CircuitOpenError, is_retryable
+from chisel.util.tracing import bind_context
+
+
+def is_backend_error(e: BaseException) -> bool:
+    """
+    Whether an error says something about the backend rather than the
+    request: a transient or transport failure, or an open circuit. Only
+    these count against a backend and send the request to another; bad
+    input or a 4xx would fail (and be billed) the same everywhere.
+    """
+    return is_retryable(e) or isinstance(e, CircuitOpenError)
+
+
+class BackendStats(object):
+    """
+    Rolling latency and error statistics for one backend: EWMAs for routing
+    decisions plus a window of recent latencies for the p95 hedge delay.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 200) -> None:
+        self.alpha = alpha
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.last_attempt = 0.0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.last_attempt = time.monotonic()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.error_ewma += self.alpha * ((0.0 if ok else 1.0) - self.error_ewma)
+            if not ok:
+                self.errors += 1
+                return
+            self._latencies.append(latency)
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.alpha * (latency - self.latency_ewma)
+
+    def num_samples(self) -> int:
+        return len(self._latencies)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_ewma": self.latency_ewma,
+            "error_rate": self.error_ewma,
+            "p95": self.p95(),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class RoutingProvider(BaseAPIProvider):
+    """
+    Routes each request to the backend with the lowest latency EWMA among
+    the healthy ones (error-rate EWMA below `max_error_rate`), failing over
+    to the next best backend if it fails with a transient or transport error;
+    other errors are raised as they are. Backends that haven't been tried for
+    `probe_interval` seconds get a probe request, so slow or failing backends
+    are re-measured and can recover.
+
+    With `hedge=True`, if the chosen backend hasn't answered after its p95
+    latency, the same request is also sent to the next best backend and
+    whichever succeeds first wins.
+    """
+
+    delegates: bool = True
+
+    def __init__(
+        self,
+        apis: Sequence[BaseAPIProvider],
+        hedge: bool = False,
+        max_error_rate: float = 0.5,
+        probe_interval: float = 30.0,
+        min_hedge_delay: float = 0.05,
+        min_hedge_samples: int = 10,
+        alpha: float = 0.2,
+        max_workers: int = 64,
+    ) -> None:
+        if len(apis) == 0:
+            raise ValueError("RoutingProvider needs at least one provider.")
+        super().__init__()
+        self.apis = list(apis)
+        self.hedge = hedge
+        self.max_error_rate = max_error_rate
+        self.probe_interval = probe_interval
+        self.min_hedge_delay = min_hedge_delay
+        self.min_hedge_samples = min_hedge_samples
+        self.stats = [BackendStats(alpha=alpha) for _ in self.apis]
+        self.hedges = 0
+        self._max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self.apis[0].get_params()
+
+    @property
+    def model_type(self):
+        return self.apis[0].model_type
+
+    def set_params(self, params: Dict[str, Any]) -> Any:
+        for api in self.apis:
+            api.set_params(params)
+
+    def fork(self) -> BaseAPIProvider:
+        # Forks route on the same stats and hedge on the same pool.
+        if self.hedge:
+            self._get_pool()
+        router = copy.copy(self)
+        router.apis = [api.fork() for api in self.apis]
+        return router
+
+    def set_result_mode(self, mode: str, persist: bool = True) -> None:
+        for api in self.apis:
+            api.set_result_mode(mode, persist)
+
+    def get_backend_name(self, idx: int) -> str:
+        def name(api: BaseAPIProvider) -> str:
+            if isinstance(api, WrappedAPIProvider):
+                api = api.unwrap()
+            return type(api).__name__
+
+        names = [name(api) for api in self.apis]
+        if names.count(names[idx]) > 1:
+            return f"{names[idx]}[{idx}]"
+        return names[idx]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            self.get_backend_name(i): dict(s.to_dict(), healthy=self._is_healthy(i))
+            for i, s in enumerate(self.stats)
+        }
+
+    def _is_healthy(self, idx: int) -> bool:
+        stats = self.stats[idx]
+        if stats.error_ewma < self.max_error_rate:
+            return True
+        return time.monotonic() - stats.last_attempt >= self.probe_interval
+
+    def select(self, exclude: Sequence[int] = ()) -> Optional[int]:
+        candidates = [i for i in range(len(self.apis)) if i not in exclude]
+        if not candidates:
+            return None
+        healthy = [i for i in candidates if self._is_healthy(i)]
+        if not healthy:
+            return min(candidates, key=lambda i: self.stats[i].error_ewma)
+        # Backends with no samples, or none within probe_interval, sort first
+        # so a backend that had one slow spell gets re-measured.
+        now = time.monotonic()
+        return min(
+            healthy,
+            key=lambda i: (
+                self.stats[i].latency_ewma is not None
+                and now - self.stats[i].last_attempt < self.probe_interval,
+                self.stats[i].latency_ewma or 0.0,
+            ),
+        )
+
+    def get_hedge_delay(self, idx: int) -> Optional[float]:
+        stats = self.stats[idx]
+        if stats.num_samples() < self.min_hedge_samples:
+            return None
+        return max(stats.p95(), self.min_hedge_delay)
+
+    def _call(self, idx: int, inp: Any, params: Optional[Dict[str, str]]) -> Any:
+        stats = self.stats[idx]
+        stats.start()
+        start = time.perf_counter()
+        try:
+            result = self.apis[idx].run(inp, params)
+        except Exception as e:
+            if is_backend_error(e):
+                stats.record(time.perf_counter() - start, ok=False)
+            raise
+        stats.record(time.perf_counter() - start, ok=True)
+        return result
+
+    async def _acall(self, idx: int, inp: Any, params: Optional[Dict[str, str]]) -> Any:
+        stats = self.stats[idx]
+        stats.start()
+        start = time.perf_counter()
+        try:
+            result = await self.apis[idx].arun(inp, params)
+        except asyncio.CancelledError:
+            # A cancelled hedge loser tells us nothing about the backend.
+            raise
+        except Exception as e:
+            if is_backend_error(e):
+                stats.record(time.perf_counter() - start, ok=False)
+            raise
+        stats.record(time.perf_counter() - start, ok=True)
+        return result
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix="chisel-router",
+                )
+            return self._pool
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        primary = self.select()
+        hedge_delay = self.get_hedge_delay(primary) if self.hedge else None
+        if hedge_delay is None or len(self.apis) == 1:
+            try:
+                return self._call(primary, inp, params)
+            except Exception as e:
+                fallback = self.select(exclude=[primary]) if is_backend_error(e) else None
+                if fallback is None:
+                    raise
+                return self._call(fallback, inp, params)
+
+        pool = self._get_pool()
+        futures = {pool.submit(bind_context(self._call), primary, inp, params): primary}
+        done, _ = wait(futures, timeout=hedge_delay)
+        if done:
+            future = next(iter(done))
+            if future.exception() is None or not is_backend_error(future.exception()):
+                return future.result()
+        secondary = self.select(exclude=[primary])
+        if secondary is not None:
+            if not done:
+                self.hedges += 1
+            futures[pool.submit(bind_context(self._call), secondary, inp, params)] = secondary
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The losing call keeps running in its thread; its result
+                    # is dropped but still feeds that backend's stats.
+                    return future.result()
+                error = future.exception()
+                if not is_backend_error(error):
+                    raise error
+        raise error
+
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        primary = self.select()
+        hedge_delay = self.get_hedge_delay(primary) if self.hedge else None
+        if hedge_delay is None or len(self.apis) == 1:
+            try:
+                return await self._acall(primary, inp, params)
+            except Exception as e:
+                fallback = self.select(exclude=[primary]) if is_backend_error(e) else None
+                if fallback is None:
+                    raise
+                return await self._acall(fallback, inp, params)
+
+        tasks = {asyncio.ensure_future(self._acall(primary, inp, params))}
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if done:
+            task = next(iter(done))
+            if task.exception() is None or not is_backend_error(task.exception()):
+                return task.result()
+        secondary = self.select(exclude=[primary])
+        if secondary is not None:
+            if not done:
+                self.hedges += 1
+            tasks.add(asyncio.ensure_future(self._acall(secondary, inp, params)))
+
+        error = None
+        pending = tasks
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    if not is_backend_error(error):
+                        raise error
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from chisel.api.base_api_provider import BaseAPIProvider, WrappedAPIProvider
+from chisel.api.cache import is_deterministic, request_key
+
+
+class _Call(object):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls by key: while a call for a key is in flight,
+    later callers with the same key wait for it and receive its result (or
+    its exception) instead of starting their own.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def ado(
+        self,
+        key: str,
+        fn: Callable[..., Awaitable[Any]],
+        *args
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        task = self._tasks.get(task_key, None)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._tasks[task_key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        else:
+            self.shared += 1
+        # Shield the shared call so one waiter being cancelled doesn't cancel
+        # it for everyone else.
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+
+class CoalescingAPIProvider(WrappedAPIProvider):
+    """
+    Wraps a provider so identical concurrent requests (same provider,
+    ModelType, params, seed and input) share one provider call, and every
+    waiter gets the same APIResult. Requests without a fixed seed are never
+    coalesced since each one is expected to produce a different image.
+    """
+
+    def __init__(
+        self,
+        api: BaseAPIProvider,
+        single_flight: SingleFlight = None,
+    ) -> None:
+        super().__init__(api)
+        if single_flight is None:
+            single_flight = SingleFlight()
+        self.single_flight = single_flight
+
+    def get_key(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Optional[str]:
+        if not is_deterministic(self.api, params):
+            return None
+        return request_key(self.api, inp, params)
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        key = self.get_key(inp, params)
+        if key is None:
+            return self.api.run(inp, params)
+        return self.single_flight.do(key, self.api.run, inp, params)
+
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        key = self.get_key(inp, params)
+        if key is None:
+            return await self.api.arun(inp, params)
+        return await self.single_flight.ado(key, self.api.arun, inp, params)
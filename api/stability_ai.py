@@ -1,22 +1,26 @@
-import io
+import asyncio
+import threading
+from abc import abstractmethod
 from os import environ
-from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 
-import numpy
-import PIL
 import stability_sdk.interfaces.gooseai.generation.generation_pb2 as generation
 import warnings
-from stability_sdk import client as stability_client
 
 from chisel.api.base_api_provider import BaseAPIProvider, APIResult
+from chisel.api.stability_pool import DEFAULT_HOST, get_stability_pool
 from chisel.data_types import Image
+from chisel.model_type import ModelType
+from chisel.util.metrics import get_metrics
+from chisel.util.tracing import bind_context
 
 
 class StabilityAI(BaseAPIProvider):
     api_key_name: str = "CHISEL_API_KEY_STABILITY_AI"
     version: str = "v3"
     base_url: str = ""
+    host: str = DEFAULT_HOST
+    seeded: bool = True
     model_engines: List[str] = [
         "stable-diffusion-xl-beta-v2-2-2",
         "stable-diffusion-v1",
@@ -45,25 +49,93 @@ class StabilityAI(BaseAPIProvider):
 
     def __init__(self) -> None:
         super().__init__()
-        environ["STABILITY_HOST"] = "grpc.stability.ai:443"
+        environ["STABILITY_HOST"] = self.host
         self.api_key = environ.get(self.api_key_name, None)
         if self.api_key is None:
             raise ValueError(
                 f"{self.api_key_name} not set. Please set the env variable "
                 + "before using this class"
             )
-        self.stability_api = stability_client.StabilityInference(
+        # Clients come from a shared pool so new ops reuse warm channels.
+        self.stability_api = get_stability_pool().get_client(
             key=self.api_key,
-            verbose=True,
             engine=self.model_engines[0],
+            host=self.host,
         )
 
-    def _process_results(self, results) -> List[Image]:
+    def get_engine(self) -> str:
+        return self.stability_api.engine
+
+    @abstractmethod
+    def _generate(self, inp: Any) -> Any:
+        """
+        Returns the provider's response stream for `inp` using self.params.
+        """
+        pass
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        self.set_params(params)
+        # generate() is lazy, so consume the stream inside the retried call.
+        return self.resilience.call(
+            self.get_provider_name(),
+            self.get_engine(),
+            lambda: self._process_results(self._generate(inp)),
+        )
+
+    def stream(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Iterator[APIResult]:
+        """
+        Yields a single-image APIResult for each sample the moment it's
+        received, while later samples are still being generated. Unlike run(),
+        a stream isn't retried once started since earlier samples may already
+        have been consumed.
+        """
+        self.set_params(params)
+        yield from self._iter_results(self._generate(inp))
+
+    async def astream(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[APIResult]:
+        # The gRPC stream is blocking, so drain it on a thread and hand each
+        # sample to the event loop as it lands.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce() -> None:
+            try:
+                for api_result in self.stream(inp, params):
+                    loop.call_soon_threadsafe(queue.put_nowait, api_result)
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        producer = loop.run_in_executor(None, bind_context(produce))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+        await producer
+
+    def _iter_results(self, results) -> Iterator[APIResult]:
         # Set up StabilityAPI warning to print to the console if the adult content
         # classifier is tripped. If adult content classifier is not tripped,
         # save generated images.
-        api_result = APIResult()
-
+        metrics = get_metrics()
         for i, resp in enumerate(results):
             for artifact in resp.artifacts:
                 if artifact.finish_reason == generation.FILTER:
@@ -71,16 +143,32 @@ class StabilityAI(BaseAPIProvider):
                         f"For result {i}, your request activated the API's safety filters "
                         + "and couldn't be processed. Please modify the prompt and try again."
                     )
-                if artifact.type == generation.ARTIFACT_IMAGE:
-                    img = PIL.Image.open(io.BytesIO(artifact.binary))
-                    local_filename = self._write_img(
-                        img, filename=str(artifact.seed) + ".png"
+                    metrics.images.inc(
+                        provider=self.get_provider_name(),
+                        model_type=self._get_model_type_name(),
+                        outcome="filtered",
                     )
-                    api_result.add(local_filename, remote_url=None)
+                if artifact.type == generation.ARTIFACT_IMAGE:
+                    self._record_bytes(0, len(artifact.binary))
+                    # The artifact is already an encoded PNG; store it as is
+                    # rather than decoding and re-encoding it. Seeds repeat
+                    # across concurrent calls, so each gets its own file.
+                    local_filename = self._store_img_bytes(artifact.binary, ext=".png")
+                    data = artifact.binary if self.result_mode == "memory" else None
+                    api_result = APIResult()
+                    api_result.add(local_filename, remote_url=None, data=data)
+                    yield api_result
+
+    def _process_results(self, results) -> List[Image]:
+        api_result = APIResult()
+        for sample in self._iter_results(results):
+            api_result.extend(sample)
         return api_result
 
 
 class StabilityAITxtToImg(StabilityAI):
+    model_type: ModelType = ModelType.TXT2IMG
+
     def __init__(self) -> None:
         super().__init__()
         self.params: Dict[str, Any] = {
@@ -93,9 +181,8 @@ class StabilityAITxtToImg(StabilityAI):
             "sampler": self.samplers[-1],
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        self.set_params(params)
-        results = self.stability_api.generate(
+    def _generate(self, inp: Any) -> Any:
+        return self.stability_api.generate(
             prompt=inp,
             seed=self.params["seed"],
             steps=self.params["steps"],
@@ -105,10 +192,11 @@ class StabilityAITxtToImg(StabilityAI):
             samples=self.params["samples"],
             sampler=self.params["sampler"],
         )
-        return self._process_results(results)
 
 
 class StabilityAIImgToImg(StabilityAI):
+    model_type: ModelType = ModelType.IMG2IMG
+
     def __init__(self) -> None:
         super().__init__()
         self.params: Dict[str, Any] = {
@@ -122,10 +210,10 @@ class StabilityAIImgToImg(StabilityAI):
             "sampler": self.samplers[-1],
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        results = self.stability_api.generate(
+    def _generate(self, inp: Any) -> Any:
+        return self.stability_api.generate(
             prompt=inp[0],
-            init_image=inp[1],
+            init_image=Image.coerce(inp[1]).pil,
             seed=self.params["seed"],
             start_schedule=self.params["start_schedule"],
             steps=self.params["steps"],
@@ -135,10 +223,11 @@ class StabilityAIImgToImg(StabilityAI):
             samples=self.params["samples"],
             sampler=self.params["sampler"],
         )
-        return self._process_results(results)
 
 
 class StabilityAIImgEdit(StabilityAI):
+    model_type: ModelType = ModelType.IMG_EDIT
+
     def __init__(self) -> None:
         super().__init__()
         self.params: Dict[str, Any] = {
@@ -152,11 +241,11 @@ class StabilityAIImgEdit(StabilityAI):
             "sampler": self.samplers[-1],
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        results = self.stability_api.generate(
+    def _generate(self, inp: Any) -> Any:
+        return self.stability_api.generate(
             prompt=inp[0],
-            init_image=inp[1],
-            mask_image=inp[2],
+            init_image=Image.coerce(inp[1]).pil,
+            mask_image=Image.coerce(inp[2]).pil,
             seed=self.params["seed"],
             start_schedule=self.params["start_schedule"],
             steps=self.params["steps"],
@@ -166,10 +255,10 @@ class StabilityAIImgEdit(StabilityAI):
             samples=self.params["samples"],
             sampler=self.params["sampler"],
         )
-        return self._process_results(results)
 
 
 class StabilityAISuperRes(StabilityAI):
+    model_type: ModelType = ModelType.SUPER_RES
     upscale_engines: List[str] = [
         "esrgan-v1-x2plus",
         "stable-diffusion-x4-latent-upscaler",
@@ -186,10 +275,10 @@ class StabilityAISuperRes(StabilityAI):
         else:
             self.engine = upscale_engine
 
-        self.stability_upscale_api = stability_client.StabilityInference(
+        self.stability_upscale_api = get_stability_pool().get_client(
             key=self.api_key,
             upscale_engine=self.engine,
-            verbose=True,
+            host=self.host,
         )
         self.params: Dict[str, Any] = {
             "width": 1024,
@@ -202,28 +291,23 @@ class StabilityAISuperRes(StabilityAI):
     def get_upscale_engines(self) -> List[str]:
         return self.upscale_engines
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+    def get_engine(self) -> str:
+        return self.engine
+
+    def _generate(self, inp: Any) -> Any:
         if self.engine == "stable-diffusion-x4-latent-upscaler":
             prompt = self.params.get("prompt", None)
             if inp[0] is not None:
                 prompt = inp[0]
 
-            init_image = inp[1]
-            if isinstance(inp[1], numpy.ndarray):
-                init_image = PIL.Image.fromarray(inp[1])
-            elif isinstance(inp[1], str) or isinstance(inp[1], Path):
-                init_image = PIL.Image.open(inp[1])
-
-            results = self.stability_upscale_api.upscale(
-                init_image=init_image,
+            return self.stability_upscale_api.upscale(
+                init_image=Image.coerce(inp[1]).pil,
                 width=self.params["width"],
                 prompt=prompt,
                 steps=self.params["steps"],
                 cfg_scale=self.params["cfg_scale"],
             )
-        else:
-            results = self.stability_upscale_api.upscale(
-                init_image=inp[1],
-                width=self.params["width"],
-            )
-        return self._process_results(results)
+        return self.stability_upscale_api.upscale(
+            init_image=Image.coerce(inp[1]).pil,
+            width=self.params["width"],
+        )
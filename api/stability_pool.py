@@ -0,0 +1,231 @@
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import grpc
+import stability_sdk.interfaces.gooseai.generation.generation_pb2 as generation
+import stability_sdk.interfaces.gooseai.generation.generation_pb2_grpc as generation_grpc
+from stability_sdk import client as stability_client
+
+from chisel.util.tracing import get_tracer
+from chisel.util.transport import get_transport
+
+
+DEFAULT_HOST = "grpc.stability.ai:443"
+
+
+class _PooledChannel(object):
+    def __init__(self, host: str, key: str) -> None:
+        self.host = host
+        self.in_flight = 0
+        self.state: Optional[grpc.ChannelConnectivity] = None
+        self.channel = self._open(host, key)
+        self.stub = generation_grpc.GenerationServiceStub(self.channel)
+        self.channel.subscribe(self._on_state, try_to_connect=False)
+
+    def _open(self, host: str, key: str) -> grpc.Channel:
+        # Same settings StabilityInference uses for its own channel.
+        max_message_size = int(os.getenv("MAX_MESSAGE_SIZE", 10 * 1024 * 1024))
+        options = [
+            ("grpc.max_send_message_length", max_message_size),
+            ("grpc.max_receive_message_length", max_message_size),
+            # Otherwise gRPC shares one connection between channels to the
+            # same host, and max_channels would not add any connections.
+            ("grpc.use_local_subchannel_pool", 1),
+        ]
+        if host.endswith("443"):
+            if not key:
+                raise ValueError(f"key is required for {host}")
+            credentials = grpc.composite_channel_credentials(
+                grpc.ssl_channel_credentials(),
+                grpc.access_token_call_credentials(key),
+            )
+            return grpc.secure_channel(host, credentials, options=options)
+        return grpc.insecure_channel(host, options=options)
+
+    def _on_state(self, state: grpc.ChannelConnectivity) -> None:
+        self.state = state
+
+    def is_healthy(self) -> bool:
+        return self.state not in (
+            grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+            grpc.ChannelConnectivity.SHUTDOWN,
+        )
+
+    def close(self) -> None:
+        self.channel.unsubscribe(self._on_state)
+        self.channel.close()
+
+
+class _PooledStub(object):
+    """
+    Stands in for a client's GenerationServiceStub and sends every call on
+    a channel borrowed from the pool.
+    """
+
+    def __init__(self, pool: "StabilityClientPool", host: str, key: str) -> None:
+        self.pool = pool
+        self.host = host
+        self.key = key
+
+    def Generate(self, request: Any, **kwargs) -> Iterator[Any]:
+        cassette = get_transport().cassette
+        if cassette is not None:
+            return cassette.grpc_stream(
+                self.host, "Generate", request,
+                lambda: self._generate(request, **kwargs),
+                generation.Answer,
+            )
+        return self._generate(request, **kwargs)
+
+    def _generate(self, request: Any, **kwargs) -> Iterator[Any]:
+        tracer = get_tracer()
+        with tracer.span("grpc Generate", cat="grpc", host=self.host) as span:
+            channel = self.pool._acquire(self.host, self.key)
+            span.set(in_flight=channel.in_flight)
+            responses = 0
+            nbytes = 0
+            try:
+                for response in channel.stub.Generate(request, **kwargs):
+                    responses += 1
+                    if tracer.enabled:
+                        nbytes += response.ByteSize()
+                    yield response
+            except grpc.RpcError as e:
+                if hasattr(e, "code") and e.code() == grpc.StatusCode.UNAVAILABLE:
+                    self.pool._discard(self.host, self.key, channel)
+                raise
+            finally:
+                self.pool._release(channel)
+                span.set(responses=responses, bytes=nbytes)
+
+
+class StabilityClientPool(object):
+    """
+    A process-wide pool of warm gRPC channels to Stability, shared by every
+    StabilityAI op. Clients are cached by (host, engine, upscale_engine, key)
+    and all send their calls through the pool: a call goes to the healthy
+    channel with the fewest streams in flight, and a new channel is only
+    opened once every channel carries `max_streams_per_channel` streams and
+    fewer than `max_channels` exist. Channels that report a transient
+    failure, or fail a call with UNAVAILABLE, are closed and replaced.
+    """
+
+    def __init__(
+        self,
+        max_channels: int = 4,
+        max_streams_per_channel: int = 64,
+        verbose: bool = True,
+    ) -> None:
+        if max_channels < 1:
+            raise ValueError("max_channels must be at least 1.")
+        self.max_channels = max_channels
+        self.max_streams_per_channel = max_streams_per_channel
+        self.verbose = verbose
+        self._channels: Dict[Tuple[str, str], List[_PooledChannel]] = {}
+        self._clients: Dict[Tuple[str, str, str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def get_client(
+        self,
+        key: str,
+        engine: str = "stable-diffusion-xl-beta-v2-2-2",
+        upscale_engine: str = "esrgan-v1-x2plus",
+        host: str = DEFAULT_HOST,
+    ) -> stability_client.StabilityInference:
+        client_key = (host, engine, upscale_engine, key)
+        with self._lock:
+            client = self._clients.get(client_key, None)
+            if client is None:
+                # The client's own channel is never used, and gRPC channels
+                # don't connect until their first call, so it costs nothing.
+                client = stability_client.StabilityInference(
+                    host=host,
+                    key=key,
+                    engine=engine,
+                    upscale_engine=upscale_engine,
+                    verbose=self.verbose,
+                )
+                client.stub = _PooledStub(self, host, key)
+                self._clients[client_key] = client
+        return client
+
+    def _acquire(self, host: str, key: str) -> _PooledChannel:
+        with self._lock:
+            channels = self._channels.setdefault((host, key), [])
+            for channel in [c for c in channels if not c.is_healthy()]:
+                channels.remove(channel)
+                if channel.in_flight == 0:
+                    channel.close()
+
+            best = min(channels, key=lambda c: c.in_flight, default=None)
+            if best is None or (
+                best.in_flight >= self.max_streams_per_channel
+                and len(channels) < self.max_channels
+            ):
+                best = _PooledChannel(host, key)
+                channels.append(best)
+            best.in_flight += 1
+            return best
+
+    def _release(self, channel: _PooledChannel) -> None:
+        with self._lock:
+            channel.in_flight -= 1
+            retired = channel.in_flight == 0 and not any(
+                channel in channels for channels in self._channels.values()
+            )
+        if retired:
+            channel.close()
+
+    def _discard(self, host: str, key: str, channel: _PooledChannel) -> None:
+        with self._lock:
+            channels = self._channels.get((host, key), [])
+            if channel in channels:
+                channels.remove(channel)
+
+    def get_states(self) -> Dict[str, List[Dict[str, Any]]]:
+        states: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for (host, _), channels in self._channels.items():
+                states.setdefault(host, []).extend(
+                    {
+                        "state": c.state.name if c.state is not None else None,
+                        "in_flight": c.in_flight,
+                    }
+                    for c in channels
+                )
+        return states
+
+    def close(self) -> None:
+        with self._lock:
+            channels = [c for cs in self._channels.values() for c in cs]
+            self._channels.clear()
+            self._clients.clear()
+        for channel in channels:
+            channel.close()
+
+
+_stability_pool: Optional[StabilityClientPool] = None
+_stability_pool_lock = threading.Lock()
+
+
+def get_stability_pool() -> StabilityClientPool:
+    global _stability_pool
+    if _stability_pool is None:
+        with _stability_pool_lock:
+            if _stability_pool is None:
+                _stability_pool = StabilityClientPool()
+    return _stability_pool
+
+
+def configure_stability_pool(**kwargs) -> StabilityClientPool:
+    """
+    Replaces the process-wide pool, closing the old one's channels. Takes
+    the same keyword arguments as StabilityClientPool.
+    """
+    global _stability_pool
+    with _stability_pool_lock:
+        if _stability_pool is not None:
+            _stability_pool.close()
+        _stability_pool = StabilityClientPool(**kwargs)
+    return _stability_pool
@@ -1,10 +1,13 @@
+import asyncio
+from abc import abstractmethod
+from concurrent.futures import Future, TimeoutError
 from os.path import join
-import json
-from typing import Any, Dict, Optional
-
-import requests
+from typing import Any, Dict, List, Optional
 
 from chisel.api.base_api_provider import APIResult, BaseAPIProvider
+from chisel.api.job_poller import JobPoller, get_job_poller
+from chisel.api.webhook import WebhookReceiver
+from chisel.data_types import Image
 from chisel.model_type import ModelType
 from chisel.util.files import is_img
 from chisel.util.env_handler import EnvHandler
@@ -14,6 +17,11 @@ class StableDiffusionAPI(BaseAPIProvider):
     api_key_name: str = "CHISEL_API_KEY_STABLE_DIFFUSION"
     version: str = "v3"
     base_url: str = "https://stablediffusionapi.com/api/v3"
+    # How long to wait for a webhook before falling back to polling: the
+    # job's ETA plus webhook_grace, and never more than webhook_timeout.
+    webhook_timeout: float = 600.0
+    webhook_grace: float = 30.0
+    seeded: bool = True
 
     def __init__(self):
         super().__init__()
@@ -24,6 +32,8 @@ class StableDiffusionAPI(BaseAPIProvider):
             )
         self._key = EnvHandler.get(self.api_key_name)
         self.params = {}
+        self.job_poller: JobPoller = None
+        self.webhook_receiver: WebhookReceiver = None
 
     def get_api_endpoint(self) -> str:
         url = self.base_url
@@ -37,7 +47,132 @@ class StableDiffusionAPI(BaseAPIProvider):
             url = join(url, "super_resolution")
         return url
 
-    def _process_response(self, response: Dict[str, Any]) -> APIResult:
+    @abstractmethod
+    def _get_payload(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        pass
+
+    def _get_img_url(self, img: Any) -> str:
+        # The API only takes images by URL.
+        if isinstance(img, str):
+            return img
+        url = Image.coerce(img).url
+        if url is None:
+            raise ValueError(
+                "StableDiffusionAPI needs images by URL, e.g. the result of a "
+                + "previous StableDiffusionAPI op."
+            )
+        return url
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        """
+        " Run a StableDiffusion API job.
+        """
+        payload = self._get_payload(inp, params)
+        webhook_future = self._register_webhook(payload)
+        headers = {"Content-Type": "application/json"}
+        try:
+            response = self._post_with_retry(self.get_api_endpoint(), headers, payload)
+            response_json = self._wait_for_job(response.json(), webhook_future)
+        finally:
+            self._unregister_webhook(payload)
+        return self._process_response(response_json)
+
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        """
+        " Run a StableDiffusion API job without blocking the event loop.
+        """
+        payload = self._get_payload(inp, params)
+        webhook_future = self._register_webhook(payload)
+        headers = {"Content-Type": "application/json"}
+        try:
+            response_json = await self._apost(self.get_api_endpoint(), headers, payload)
+            response_json = await self._await_job(response_json, webhook_future)
+        finally:
+            self._unregister_webhook(payload)
+        return await self._aprocess_response(response_json)
+
+    def set_webhook_receiver(self, receiver: Optional[WebhookReceiver]) -> None:
+        """
+        Has the provider push finished jobs to `receiver` rather than being
+        polled for them.
+        """
+        if receiver is not None:
+            receiver.start()
+        self.webhook_receiver = receiver
+
+    def _register_webhook(self, payload: Dict[str, Any]) -> Optional[Future]:
+        if self.webhook_receiver is None:
+            return None
+        track_id, future = self.webhook_receiver.register()
+        payload["webhook"] = self.webhook_receiver.url
+        payload["track_id"] = track_id
+        return future
+
+    def _unregister_webhook(self, payload: Dict[str, Any]) -> None:
+        if self.webhook_receiver is not None and payload.get("track_id", None):
+            self.webhook_receiver.unregister(payload["track_id"])
+
+    def _get_job_poller(self) -> JobPoller:
+        if self.job_poller is None:
+            return get_job_poller()
+        return self.job_poller
+
+    def _get_fetch_request(self, response: Dict[str, Any]):
+        fetch_url = response.get("fetch_result", None)
+        if not fetch_url:
+            fetch_url = join(self.base_url, "fetch", str(response.get("id")))
+        return fetch_url, {"key": f"{self._key}"}
+
+    def _get_webhook_timeout(self, response: Dict[str, Any]) -> float:
+        try:
+            eta = max(float(response.get("eta", None)), 0.0)
+        except (TypeError, ValueError):
+            return self.webhook_timeout
+        return min(eta + self.webhook_grace, self.webhook_timeout)
+
+    def _wait_for_job(
+        self,
+        response: Dict[str, Any],
+        webhook_future: Optional[Future] = None,
+    ) -> Dict[str, Any]:
+        # Under load the API queues the job and answers "processing" with a
+        # fetch url and an ETA instead of the images.
+        if response.get("status", None) != "processing":
+            return response
+        eta = response.get("eta", None)
+        if webhook_future is not None:
+            try:
+                return webhook_future.result(timeout=self._get_webhook_timeout(response))
+            except TimeoutError:
+                # The ETA has passed by now, so poll right away.
+                eta = None
+        fetch_url, payload = self._get_fetch_request(response)
+        future = self._get_job_poller().submit(fetch_url, payload, eta)
+        return future.result()
+
+    async def _await_job(
+        self,
+        response: Dict[str, Any],
+        webhook_future: Optional[Future] = None,
+    ) -> Dict[str, Any]:
+        if response.get("status", None) != "processing":
+            return response
+        eta = response.get("eta", None)
+        if webhook_future is not None:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.wrap_future(webhook_future), self._get_webhook_timeout(response)
+                )
+            except asyncio.TimeoutError:
+                eta = None
+        fetch_url, payload = self._get_fetch_request(response)
+        return await self._get_job_poller().asubmit(fetch_url, payload, eta)
+
+    def _get_output_urls(self, response: Dict[str, Any]) -> List[str]:
         status = response.get("status", None)
         if status is not None and status == "error":
             message = response.get("message", "")
@@ -46,21 +181,31 @@ class StableDiffusionAPI(BaseAPIProvider):
             )
 
         response_output = response.get("output", [])
-        api_result = APIResult()
-
         if isinstance(response_output, list):
-            for output_url in response_output:
-                if is_img(output_url):
-                    local_filename = self._download_img_from_url(url=output_url)
-                    api_result.add(local_filename, output_url)
+            return [url for url in response_output if is_img(url)]
         elif isinstance(response_output, str):
-            local_filename = self._download_img_from_url(url=output_url)
-            api_result.add(local_filename, output_url)
+            return [response_output]
         else:
             raise ValueError(
                 f'Unexpected value of `response["output"]`: {response_output}'
             )
 
+    def _process_response(self, response: Dict[str, Any]) -> APIResult:
+        api_result = APIResult()
+        for output_url in self._get_output_urls(response):
+            local_filename, data = self._fetch_img(output_url)
+            api_result.add(local_filename, output_url, data=data)
+        return api_result
+
+    async def _aprocess_response(self, response: Dict[str, Any]) -> APIResult:
+        output_urls = self._get_output_urls(response)
+        images = await asyncio.gather(
+            *[self._afetch_img(url) for url in output_urls]
+        )
+
+        api_result = APIResult()
+        for (local_filename, data), output_url in zip(images, output_urls):
+            api_result.add(local_filename, output_url, data=data)
         return api_result
 
 
@@ -88,29 +233,22 @@ class StableDiffusionAPITxtToImg(StableDiffusionAPI):
             "track_id": None,
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        """
-        " Run a StableDiffusion API job.
-        """
+    def _get_payload(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         if params:
             self.set_params(params)
 
-        self.params["key"] = f"{self._key}"
+        payload = dict(self.params)
+        payload["key"] = f"{self._key}"
 
         if isinstance(inp, str):
-            self.params["prompt"] = inp
+            payload["prompt"] = inp
         else:
             raise ValueError("inp must be a str.")
-
-        headers = {"Content-Type": "application/json"}
-        response = requests.request(
-            "POST",
-            self.get_api_endpoint(),
-            headers=headers,
-            data=json.dumps(self.params),
-        )
-        response_json = response.json()
-        return self._process_response(response_json)
+        return payload
 
 
 class StableDiffusionAPIImgToImg(StableDiffusionAPI):
@@ -135,30 +273,23 @@ class StableDiffusionAPIImgToImg(StableDiffusionAPI):
             "track_id": None,
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        """
-        " Run a StableDiffusion API job.
-        """
+    def _get_payload(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         if params:
             self.set_params(params)
 
-        self.params["key"] = f"{self._key}"
+        payload = dict(self.params)
+        payload["key"] = f"{self._key}"
 
         if isinstance(inp, str):
-            self.params["prompt"] = inp
+            payload["prompt"] = inp
         elif isinstance(inp, list):
-            self.params["prompt"] = inp[0]
-            self.params["init_image"] = inp[1]
-
-        headers = {"Content-Type": "application/json"}
-        response = requests.request(
-            "POST",
-            self.get_api_endpoint(),
-            headers=headers,
-            data=json.dumps(self.params),
-        )
-        response_json = response.json()
-        return self._process_response(response_json)
+            payload["prompt"] = inp[0]
+            payload["init_image"] = self._get_img_url(inp[1])
+        return payload
 
 
 class StableDiffusionAPIImgEdit(StableDiffusionAPI):
@@ -182,34 +313,30 @@ class StableDiffusionAPIImgEdit(StableDiffusionAPI):
             "track_id": None,
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        """
-        " Run a StableDiffusion API job.
-        """
+    def _get_payload(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         if params:
             self.set_params(params)
 
-        self.params["key"] = f"{self._key}"
+        payload = dict(self.params)
+        payload["key"] = f"{self._key}"
 
         if isinstance(inp, list) and len(inp) == 3:
-            self.params["prompt"] = inp[0]
-            self.params["init_image"] = inp[1]
-            self.params["mask_image"] = inp[2]
+            payload["prompt"] = inp[0]
+            payload["init_image"] = self._get_img_url(inp[1])
+            payload["mask_image"] = self._get_img_url(inp[2])
         else:
             raise ValueError("inp must be a list of len 3.")
-
-        headers = {"Content-Type": "application/json"}
-        response = requests.request(
-            "POST",
-            self.get_api_endpoint(),
-            headers=headers,
-            data=json.dumps(self.params),
-        )
-        response_json = response.json()
-        return self._process_response(response_json)
+        return payload
 
 
 class StableDiffusionAPISuperRes(StableDiffusionAPI):
+    # Upscaling takes no seed and gives the same image every time.
+    deterministic: bool = True
+
     def __init__(self):
         self.model_type = ModelType.SUPER_RES
         super().__init__()
@@ -221,24 +348,16 @@ class StableDiffusionAPISuperRes(StableDiffusionAPI):
             "face_enhance": False,
         }
 
-    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
-        """
-        " Run a StableDiffusion API job.
-        """
+    def _get_payload(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         if params:
             self.set_params(params)
 
-        self.params["key"] = f"{self._key}"
-
-        if isinstance(inp, str):
-            self.params["url"] = inp[0]
+        payload = dict(self.params)
+        payload["key"] = f"{self._key}"
 
-        headers = {"Content-Type": "application/json"}
-        response = requests.request(
-            "POST",
-            self.get_api_endpoint(),
-            headers=headers,
-            data=json.dumps(self.params),
-        )
-        response_json = response.json()
-        return self._process_response(response_json)
+        payload["url"] = self._get_img_url(inp)
+        return payload
@@ -0,0 +1,265 @@
+import asyncio
+import atexit
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+import PIL.Image
+
+from chisel.api.base_api_provider import APIResult, BaseAPIProvider, WrappedAPIProvider
+from chisel.api.cache import CachedAPIProvider, ResultCache, get_effective_params, request_key
+from chisel.api.stable_diffusion_api import StableDiffusionAPI
+from chisel.data_types import Image
+from chisel.util.tiling import Tile, blend, get_feather_size, get_tiles
+from chisel.util.tracing import bind_context, get_tracer
+
+
+_tile_cache: Optional[ResultCache] = None
+_tile_cache_lock = threading.Lock()
+
+
+def _get_tile_cache() -> ResultCache:
+    # For providers without a result cache: tiles only need to outlive a
+    # retry, so they go in a temporary directory removed at exit.
+    global _tile_cache
+    if _tile_cache is None:
+        with _tile_cache_lock:
+            if _tile_cache is None:
+                storage_dir = tempfile.mkdtemp(prefix="chisel-tiles-")
+                atexit.register(shutil.rmtree, storage_dir, True)
+                _tile_cache = ResultCache(storage_dir, max_bytes=512 * 1024 ** 2)
+    return _tile_cache
+
+
+def _find_cache(api: BaseAPIProvider) -> Optional[ResultCache]:
+    while isinstance(api, WrappedAPIProvider):
+        if isinstance(api, CachedAPIProvider):
+            return api.cache
+        api = api.api
+    return None
+
+
+def _takes_urls(api: BaseAPIProvider) -> bool:
+    if isinstance(api, WrappedAPIProvider):
+        api = api.unwrap()
+    backends = getattr(api, "apis", None)
+    if backends is not None:
+        return any(_takes_urls(backend) for backend in backends)
+    return isinstance(api, StableDiffusionAPI)
+
+
+class TiledSuperRes(WrappedAPIProvider):
+    """
+    Upscales images too large for a super-resolution provider by cutting them
+    into tiles of at most `tile_size` pixels a side, each with `overlap`
+    pixels of context, upscaling up to `concurrency` tiles at a time through
+    the wrapped provider and blending them over their overlap.
+
+    Every upscaled tile is kept in `cache`, so retrying an image after a
+    tile failed only sends the tiles that are still missing. Tiles are
+    cached whatever the provider's seed, as slightly different upscales of a
+    tile still blend cleanly. Without a `cache`, the one enabled on the
+    provider is used, or else a temporary one that lasts the process.
+
+    Each tile is sent through its own fork() of the provider, so tiles never
+    see each other's params and the provider's own are left as they were.
+
+    The provider must take images by value: StableDiffusionAPI, which only
+    takes URLs, can't upscale tiles.
+    """
+
+    def __init__(
+        self,
+        api: BaseAPIProvider,
+        scale: float = 2,
+        tile_size: int = 512,
+        overlap: int = 32,
+        concurrency: int = 4,
+        cache: Optional[ResultCache] = None,
+    ) -> None:
+        super().__init__(api)
+        if _takes_urls(api):
+            raise ValueError("StableDiffusionAPI only takes image URLs and can't upscale tiles.")
+        if tile_size <= 2 * overlap:
+            raise ValueError(f"tile_size ({tile_size}) must be more than twice the overlap ({overlap}).")
+        self.scale = scale
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.concurrency = concurrency
+        if cache is None:
+            cache = _find_cache(api)
+        if cache is None:
+            cache = _get_tile_cache()
+        self.cache = cache
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.concurrency,
+                    thread_name_prefix="chisel-tiles",
+                )
+            return self._pool
+
+    def _split_input(self, inp: Any) -> Tuple[Optional[list], Image]:
+        # StabilityAI takes [prompt, image]; other providers the image alone.
+        if isinstance(inp, (list, tuple)):
+            return list(inp), Image.coerce(inp[-1])
+        return None, Image.coerce(inp)
+
+    def _get_tile_input(self, template: Optional[list], pixels: numpy.ndarray) -> Any:
+        img = Image.from_array(numpy.ascontiguousarray(pixels))
+        if template is None:
+            return img
+        return template[:-1] + [img]
+
+    def _get_tile_params(
+        self,
+        params: Optional[Dict[str, Any]],
+        tile: Tile,
+    ) -> Dict[str, Any]:
+        # Providers take the upscale either as a factor (StableDiffusionAPI,
+        # local) or as the output width (StabilityAI).
+        tile_params = dict(params or {})
+        effective = get_effective_params(self.api, params)
+        if "scale" in effective:
+            tile_params["scale"] = self.scale
+            if "width" in effective:
+                tile_params["width"] = None
+        elif "width" in effective:
+            tile_params["width"] = tile.out_size[0]
+        return tile_params
+
+    def _check_tile(self, tile: Tile, result: APIResult) -> APIResult:
+        if len(result) == 0:
+            raise ValueError(f"The provider returned no image for {tile}.")
+        size = result.get_image(0).size
+        # Providers round output sizes their own way, so allow a pixel.
+        if any(abs(a - b) > 1 for a, b in zip(size, tile.out_size)):
+            raise ValueError(
+                f"The provider returned a {size[0]}x{size[1]} image for {tile}, "
+                f"expected {tile.out_size[0]}x{tile.out_size[1]}."
+            )
+        return result
+
+    def _keep_tile(self, key: str, tile: Tile, result: APIResult) -> APIResult:
+        # Checked before caching so that a wrong-size tile isn't reused.
+        self.cache.put(key, self._check_tile(tile, result))
+        return result
+
+    def _run_tile(self, tile_inp: Any, tile_params: Dict[str, Any], tile: Tile) -> APIResult:
+        key = request_key(self.api, tile_inp, tile_params)
+        result = self.cache.get(key)
+        if result is None:
+            with get_tracer().span("tile", cat="tiling", row=tile.row, col=tile.col):
+                result = self.api.fork().run(tile_inp, tile_params)
+            self._keep_tile(key, tile, result)
+        return result
+
+    async def _arun_tile(
+        self,
+        tile_inp: Any,
+        tile_params: Dict[str, Any],
+        tile: Tile,
+        semaphore: asyncio.Semaphore,
+    ) -> APIResult:
+        key = request_key(self.api, tile_inp, tile_params)
+        result = self.cache.get(key)
+        if result is None:
+            async with semaphore:
+                with get_tracer().span("tile", cat="tiling", row=tile.row, col=tile.col):
+                    result = await self.api.fork().arun(tile_inp, tile_params)
+            # Decoding the tile and copying it into the cache block.
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, bind_context(self._keep_tile), key, tile, result)
+        return result
+
+    def _prepare(
+        self,
+        inp: Any,
+        params: Optional[Dict[str, Any]],
+    ) -> Tuple[Tuple[int, int], List[Tile], List[Tuple[Any, Dict[str, Any]]]]:
+        template, img = self._split_input(inp)
+        pixels = numpy.asarray(img.pil.convert("RGB"))
+        h, w = pixels.shape[:2]
+        out_size = (int(round(w * self.scale)), int(round(h * self.scale)))
+        tiles = get_tiles(w, h, self.tile_size, self.overlap, out_size)
+        calls = []
+        for tile in tiles:
+            x0, y0, x1, y1 = tile.box
+            calls.append((
+                self._get_tile_input(template, pixels[y0:y1, x0:x1]),
+                self._get_tile_params(params, tile),
+            ))
+        return out_size, tiles, calls
+
+    def _stitch(
+        self,
+        out_size: Tuple[int, int],
+        tiles: List[Tile],
+        results: List[APIResult],
+    ) -> APIResult:
+        with get_tracer().span("stitch", cat="tiling", tiles=len(tiles)):
+            out = numpy.zeros((out_size[1], out_size[0], 3), dtype=numpy.float32)
+            feather = get_feather_size(self.overlap, self.scale)
+            for tile, result in zip(tiles, results):
+                img = self._check_tile(tile, result).get_image(0).convert("RGB")
+                if img.size != tile.out_size:
+                    img = img.resize(tile.out_size, PIL.Image.LANCZOS)
+                blend(out, tile, numpy.asarray(img, dtype=numpy.float32) / 255, feather)
+            pixels = numpy.clip(out * 255 + 0.5, 0, 255).astype(numpy.uint8)
+            data = Image.from_array(pixels).png_bytes
+
+        api = self.unwrap()
+        local_filename = api._store_img_bytes(data, ext=".png")
+        api_result = APIResult()
+        api_result.add(
+            local_filename, remote_url=None, data=data if api.result_mode == "memory" else None
+        )
+        return api_result
+
+    def run(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        out_size, tiles, calls = self._prepare(inp, params)
+        if len(tiles) == 1:
+            return self.api.fork().run(inp, calls[0][1])
+
+        pool = self._get_pool()
+        futures = [
+            pool.submit(bind_context(self._run_tile), tile_inp, tile_params, tile)
+            for (tile_inp, tile_params), tile in zip(calls, tiles)
+        ]
+        # Let every tile finish, so that the ones that succeeded are cached
+        # before a failure is raised.
+        errors = [f.exception() for f in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return self._stitch(out_size, tiles, [f.result() for f in futures])
+
+    async def arun(self, inp: Any, params: Optional[Dict[str, str]] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        out_size, tiles, calls = await loop.run_in_executor(
+            None, bind_context(self._prepare), inp, params
+        )
+        if len(tiles) == 1:
+            return await self.api.fork().arun(inp, calls[0][1])
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *[
+                self._arun_tile(tile_inp, tile_params, tile, semaphore)
+                for (tile_inp, tile_params), tile in zip(calls, tiles)
+            ],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return await loop.run_in_executor(
+            None, bind_context(self._stitch), out_size, tiles, results
+        )
@@ -0,0 +1,141 @@
+import json
+import threading
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+_WILDCARD_HOSTS = {"", "0.0.0.0", "::"}
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _reply(self, code: int) -> None:
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        receiver: "WebhookReceiver" = self.server.receiver
+        if self.path.split("?", 1)[0] != receiver.path:
+            self._reply(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(body, dict):
+            self._reply(400)
+            return
+        receiver.complete(body)
+        self._reply(200)
+
+
+class _WebhookServer(ThreadingHTTPServer):
+    # Callbacks for a burst of jobs arrive together; the default backlog of 5
+    # makes the kernel reset connections under that load.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class WebhookReceiver(object):
+    """
+    An embeddable HTTP endpoint for StableDiffusionAPI's webhook callbacks.
+    Each request registers a track_id and gets a Future that completes with
+    the callback payload as soon as the provider pushes it, so no polling is
+    needed.
+
+    `public_url` is the address the provider should call; set it when the
+    receiver sits behind a proxy or tunnel. Otherwise the bound host and
+    port are used, so it's required when binding all interfaces
+    (`host="0.0.0.0"`), which have no address to advertise. The default
+    host only takes callbacks from the same machine.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        path: str = "/chisel/webhook",
+        public_url: Optional[str] = None,
+    ) -> None:
+        if public_url is None and host in _WILDCARD_HOSTS:
+            raise ValueError(f"public_url is required when binding all interfaces ({host!r}).")
+        self.host = host
+        self.port = port
+        self.path = path
+        self.public_url = public_url
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> "WebhookReceiver":
+        if self._server is None:
+            self._server = _WebhookServer((self.host, self.port), _WebhookHandler)
+            self._server.receiver = self
+            self.port = self._server.server_address[1]
+            self._thread = threading.Thread(
+                target=self._server.serve_forever,
+                name="chisel-webhook-receiver",
+                daemon=True,
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread = None
+
+    def __enter__(self) -> "WebhookReceiver":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        if self.public_url is not None:
+            return self.public_url
+        return f"http://{self.host}:{self.port}{self.path}"
+
+    def register(self, track_id: Optional[str] = None) -> Tuple[str, Future]:
+        if track_id is None:
+            track_id = uuid.uuid4().hex
+        future: Future = Future()
+        with self._lock:
+            self._futures[str(track_id)] = future
+        return track_id, future
+
+    def unregister(self, track_id: str) -> None:
+        with self._lock:
+            self._futures.pop(str(track_id), None)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def complete(self, body: Dict) -> bool:
+        """
+        Completes the future registered for the payload's track_id. Returns
+        False for unknown ids and for interim "processing" callbacks.
+        """
+        track_id = body.get("track_id", None)
+        if track_id is None or body.get("status", None) == "processing":
+            return False
+        with self._lock:
+            future = self._futures.pop(str(track_id), None)
+        if future is None or future.done():
+            return False
+        future.set_result(body)
+        return True
@@ -0,0 +1,363 @@
+"""
+Local stand-ins for the providers chisel talks to, for benchmarking without
+a network: StableDiffusionAPI, OpenAI images and HF inference over HTTP, and
+Stability's gRPC generation service. Each server answers with real encoded
+images after a configurable latency, and can inject errors.
+"""
+import io
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from abc import abstractmethod, ABCMeta
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import PIL.Image
+
+
+class Faults(object):
+    """
+    Latency and error injection shared by the fake servers. Each request
+    waits `latency` seconds, plus or minus up to `jitter`; a fraction
+    `error_rate` of requests fails with `error_status` (503 by default, which
+    chisel retries).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+def make_image(width: int = 512, height: int = 512, fmt: str = "PNG") -> bytes:
+    """
+    Encodes an image of random pixels, which compresses about as badly as a
+    generated image does.
+    """
+    img = PIL.Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _reply(self, code: int, body: bytes = b"", content_type: str = "application/json") -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, code: int, obj: Any) -> None:
+        self._reply(code, json.dumps(obj).encode("utf-8"))
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self) -> None:
+        server: FakeHTTPServer = self.server.fake
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/images/"):
+            # Image downloads model a CDN: no injected latency or errors.
+            self._reply(200, server.image, server.image_type)
+        else:
+            self._reply(404)
+
+    def do_POST(self) -> None:
+        server: FakeHTTPServer = self.server.fake
+        body = self._read_body()
+        server.faults.wait()
+        if server.faults.should_fail():
+            self._reply_json(server.faults.error_status, {"error": "injected"})
+            return
+        code, reply = server.handle(self.path.split("?", 1)[0], self.headers, body)
+        if isinstance(reply, bytes):
+            self._reply(code, reply, server.image_type)
+        else:
+            self._reply_json(code, reply)
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeHTTPServer(metaclass=ABCMeta):
+    """
+    Base for the HTTP fakes. Subclasses implement handle(path, headers,
+    body) -> (status, JSON-able reply or image bytes).
+    """
+
+    image_type: str = "image/png"
+
+    def __init__(
+        self,
+        faults: Optional[Faults] = None,
+        image_size: int = 512,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.faults = faults if faults is not None else Faults()
+        self.image = make_image(image_size, image_size, self._get_format())
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._server: Optional[_Server] = None
+
+    def _get_format(self) -> str:
+        return "JPEG" if self.image_type == "image/jpeg" else "PNG"
+
+    def start(self) -> "FakeHTTPServer":
+        if self._server is None:
+            self._server = _Server((self.host, self.port), _Handler)
+            self._server.fake = self
+            self.port = self._server.server_address[1]
+            threading.Thread(
+                target=self._server.serve_forever,
+                name=f"chisel-fake-{type(self).__name__}",
+                daemon=True,
+            ).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeHTTPServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def get_image_url(self) -> str:
+        return f"{self.url}/images/{next(self._ids)}.png"
+
+    @abstractmethod
+    def handle(self, path: str, headers: Any, body: bytes) -> Tuple[int, Any]:
+        pass
+
+
+class FakeStableDiffusionAPI(FakeHTTPServer):
+    """
+    Serves /api/v3/{text2img,img2img,inpaint,super_resolution} and
+    /api/v3/fetch/<id>. A fraction `queued_rate` of jobs first answers
+    "processing" with an ETA of `queue_eta` seconds, like the real API does
+    under load, and completes on a later fetch.
+    """
+
+    endpoints = ("text2img", "img2img", "inpaint", "super_resolution")
+
+    def __init__(
+        self,
+        faults: Optional[Faults] = None,
+        image_size: int = 512,
+        queued_rate: float = 0.0,
+        queue_eta: float = 1.0,
+        **kwargs
+    ) -> None:
+        super().__init__(faults, image_size, **kwargs)
+        self.queued_rate = queued_rate
+        self.queue_eta = queue_eta
+        self._jobs: Dict[int, Tuple[float, list]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/api/v3"
+
+    def handle(self, path: str, headers: Any, body: bytes) -> Tuple[int, Any]:
+        self.requests += 1
+        parts = path.strip("/").split("/")
+        payload = json.loads(body or b"{}")
+        if parts[:2] != ["api", "v3"] or len(parts) < 3:
+            return 404, {"status": "error", "message": "not found"}
+
+        if parts[2] == "fetch" and len(parts) == 4:
+            with self._lock:
+                job = self._jobs.get(int(parts[3]), None)
+            if job is None:
+                return 200, {"status": "error", "message": "unknown job"}
+            ready_at, output = job
+            if time.time() < ready_at:
+                return 200, {"status": "processing", "id": int(parts[3])}
+            with self._lock:
+                self._jobs.pop(int(parts[3]), None)
+            return 200, {"status": "success", "id": int(parts[3]), "output": output}
+
+        if parts[2] not in self.endpoints:
+            return 404, {"status": "error", "message": "not found"}
+        samples = int(payload.get("samples", 1) or 1)
+        output = [self.get_image_url() for _ in range(samples)]
+        job_id = next(self._ids)
+        if random.random() < self.queued_rate:
+            with self._lock:
+                self._jobs[job_id] = (time.time() + self.queue_eta, output)
+            return 200, {
+                "status": "processing",
+                "id": job_id,
+                "eta": self.queue_eta,
+                "fetch_result": f"{self.base_url}/fetch/{job_id}",
+            }
+        return 200, {"status": "success", "id": job_id, "output": output}
+
+
+class FakeOpenAI(FakeHTTPServer):
+    """
+    Serves /v1/images/{generations,variations,edits}. Point the openai
+    package at it with openai.api_base = server.api_base.
+    """
+
+    endpoints = ("generations", "variations", "edits")
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.url}/v1"
+
+    def handle(self, path: str, headers: Any, body: bytes) -> Tuple[int, Any]:
+        self.requests += 1
+        parts = path.strip("/").split("/")
+        if parts[:2] != ["v1", "images"] or len(parts) != 3 or parts[2] not in self.endpoints:
+            return 404, {"error": {"message": "not found", "type": "invalid_request_error"}}
+        n = 1
+        if headers.get("Content-Type", "").startswith("application/json"):
+            n = int(json.loads(body or b"{}").get("n", 1))
+        return 200, {
+            "created": int(time.time()),
+            "data": [{"url": self.get_image_url()} for _ in range(n)],
+        }
+
+
+class FakeHF(FakeHTTPServer):
+    """
+    Serves POST /models/<model_id> with a JPEG, like HF's inference API does
+    for text-to-image models.
+    """
+
+    image_type = "image/jpeg"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/models"
+
+    def handle(self, path: str, headers: Any, body: bytes) -> Tuple[int, Any]:
+        self.requests += 1
+        if not path.startswith("/models/"):
+            return 404, {"error": "not found"}
+        return 200, self.image
+
+
+class FakeStability(object):
+    """
+    Stability's gRPC GenerationService. Generate streams one Answer per
+    requested sample, each after the injected latency; an injected error
+    aborts the call with UNAVAILABLE, which chisel retries. Point StabilityAI
+    ops at it with StabilityAI.host = server.host.
+    """
+
+    def __init__(
+        self,
+        faults: Optional[Faults] = None,
+        image_size: int = 512,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_workers: int = 64,
+    ) -> None:
+        self.faults = faults if faults is not None else Faults()
+        self.image = make_image(image_size, image_size)
+        self.address = f"{host}:{port}"
+        self.max_workers = max_workers
+        self.requests = 0
+        self.host: Optional[str] = None
+        self._server = None
+
+    def start(self) -> "FakeStability":
+        if self._server is not None:
+            return self
+        import grpc
+        import stability_sdk.interfaces.gooseai.generation.generation_pb2 as generation
+        import stability_sdk.interfaces.gooseai.generation.generation_pb2_grpc as generation_grpc
+
+        fake = self
+
+        class Servicer(generation_grpc.GenerationServiceServicer):
+            def Generate(self, request, context):
+                fake.requests += 1
+                if fake.faults.should_fail():
+                    fake.faults.wait()
+                    context.abort(grpc.StatusCode.UNAVAILABLE, "injected")
+                samples = request.image.samples or 1
+                seed = request.image.seed[0] if request.image.seed else 0
+                for i in range(samples):
+                    fake.faults.wait()
+                    answer = generation.Answer(answer_id=str(i), request_id=request.request_id)
+                    answer.artifacts.append(generation.Artifact(
+                        type=generation.ARTIFACT_IMAGE,
+                        mime="image/png",
+                        binary=fake.image,
+                        seed=seed + i,
+                        finish_reason=generation.NULL,
+                    ))
+                    yield answer
+
+        host = self.address.rpartition(":")[0]
+        while True:
+            server = grpc.server(futures.ThreadPoolExecutor(max_workers=self.max_workers))
+            generation_grpc.add_GenerationServiceServicer_to_server(Servicer(), server)
+            port = server.add_insecure_port(self.address)
+            # chisel only uses TLS for hosts ending in 443; keep clear of that
+            # when the port is picked for us.
+            if not str(port).endswith("443") or not self.address.endswith(":0"):
+                break
+            server.stop(0)
+        server.start()
+        self._server = server
+        self.host = f"{host}:{port}"
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop(0)
+            self._server = None
+
+    def __enter__(self) -> "FakeStability":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,76 @@
+"""
+Guards chisel's import time. Each case imports a module in a fresh
+interpreter, times it, and checks that heavy optional dependencies stay
+unloaded until they're actually used. Exits non-zero on a regression.
+
+    python -m chisel.benchmarks.import_time [--budget-ms 750] [--repeat 5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+HEAVY_MODULES = [
+    "langchain",
+    "qdrant_client",
+    "openai",
+    "stability_sdk",
+    "grpc",
+    "aiohttp",
+    "numpy",
+]
+
+# (statement, modules it may load)
+CASES: List[Tuple[str, List[str]]] = [
+    ("import chisel.ops", []),
+    ("import chisel.api", []),
+    ("from chisel.ops import TxtToImg, ImgToImg, ImgEdit, SuperResolution", []),
+    ("from chisel.api.stable_diffusion_api import StableDiffusionAPITxtToImg", []),
+    ("from chisel.api import OpenAITxtToImg", ["openai", "aiohttp", "numpy"]),
+]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+exec({stmt!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(stmt: str) -> Dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(stmt=stmt, heavy=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=750.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for stmt, allowed in CASES:
+        runs = [measure(stmt) for _ in range(args.repeat)]
+        ms = min(r["ms"] for r in runs)
+        unexpected = sorted(set(runs[0]["loaded"]) - set(allowed))
+        ok = ms <= args.budget_ms and not unexpected
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {ms:8.1f} ms  {stmt}")
+        if unexpected:
+            print(f"       unexpectedly loaded: {', '.join(unexpected)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
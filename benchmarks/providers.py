@@ -0,0 +1,296 @@
+"""
+Benchmarks chisel's ops, batches and flows against local fake provider
+servers, so performance work can be measured with no network. Reports
+throughput, p50/p99 latency and peak memory per case.
+
+    python -m chisel.benchmarks.providers [--latency-ms 50] [--jitter-ms 10]
+        [--error-rate 0.0] [--requests 40] [--concurrency 8] [--only sd,flow]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from chisel.benchmarks.fake_servers import (
+    FakeHF, FakeOpenAI, FakeStability, FakeStableDiffusionAPI, Faults, make_image
+)
+
+GROUPS = ("sd", "openai", "hf", "stability", "flow", "local")
+
+# Fake servers don't check keys, but the providers refuse to start without.
+API_KEYS = (
+    "CHISEL_API_KEY_OPEN_AI",
+    "CHISEL_API_KEY_STABILITY_AI",
+    "CHISEL_API_KEY_STABLE_DIFFUSION",
+    "HF_API_KEY",
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Case(object):
+    """
+    Collects per-item latencies and errors for one benchmark case.
+    """
+
+    def __init__(self, name: str, mode: str) -> None:
+        self.name = name
+        self.mode = mode
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.wall = 0.0
+        self.peak_bytes: Optional[int] = None
+
+    def timed(self, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        def call(inp: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return fn(inp)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+        return call
+
+    def atimed(self, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        async def call(inp: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return await fn(inp)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+        return call
+
+    def to_dict(self) -> Dict[str, Any]:
+        n = len(self.latencies)
+        return {
+            "case": self.name,
+            "mode": self.mode,
+            "n": n,
+            "errors": self.errors,
+            "wall_s": self.wall,
+            "per_s": n / self.wall if self.wall > 0 else float("nan"),
+            "p50_ms": percentile(self.latencies, 0.5) * 1000,
+            "p99_ms": percentile(self.latencies, 0.99) * 1000,
+            "peak_mb": self.peak_bytes / 2 ** 20 if self.peak_bytes is not None else None,
+            "max_rss_mb": get_max_rss_mb(),
+        }
+
+
+def get_max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+class Runner(object):
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, case: Case, run: Callable[[], Any]) -> None:
+        if self.args.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            run()
+        finally:
+            case.wall = time.perf_counter() - start
+            if self.args.trace_memory:
+                case.peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        row = case.to_dict()
+        self.results.append(row)
+        print_row(row)
+
+    def bench_op(self, name: str, op: Callable[[Any], Any], inputs: List[Any], modes: Iterable[str]) -> None:
+        """
+        Runs `op` over `inputs` one at a time ("call"), on a thread pool
+        ("batch") and, for ops with acall, concurrently on asyncio ("abatch").
+        """
+        from chisel.ops.batch import amap_concurrent, map_concurrent
+
+        concurrency = self.args.concurrency
+        for mode in modes:
+            case = Case(name, mode)
+            if mode == "call":
+                def run() -> None:
+                    call = case.timed(op)
+                    for inp in inputs:
+                        try:
+                            call(inp)
+                        except Exception:
+                            pass
+            elif mode == "batch":
+                def run() -> None:
+                    for _ in map_concurrent(case.timed(op), inputs, concurrency):
+                        pass
+            elif mode == "abatch":
+                def run() -> None:
+                    async def consume() -> None:
+                        async for _ in amap_concurrent(
+                            case.atimed(op.acall), inputs, concurrency * 4
+                        ):
+                            pass
+                    asyncio.run(consume())
+            else:
+                raise ValueError(f"Unknown mode: {mode}")
+            self.measure(case, run)
+
+    def bench_flow(self, name: str, flow: Any, inputs: List[Any]) -> None:
+        """
+        Streams `inputs` through a LinearFlow; latency is from the moment an
+        input is pulled to the moment its result comes out.
+        """
+        case = Case(name, "stream")
+        started: Dict[int, float] = {}
+
+        def pull() -> Iterable[Any]:
+            for i, inp in enumerate(inputs):
+                started[i] = time.perf_counter()
+                yield inp
+
+        def run() -> None:
+            for item in flow.stream(pull(), workers=self.args.concurrency):
+                case.latencies.append(time.perf_counter() - started.pop(item.index))
+                if not item.ok:
+                    case.errors += 1
+        self.measure(case, run)
+
+
+def print_row(row: Dict[str, Any]) -> None:
+    peak = f"{row['peak_mb']:8.1f}" if row["peak_mb"] is not None else "       -"
+    print(
+        f"{row['case']:<26} {row['mode']:<7} {row['n']:>5} {row['errors']:>6} "
+        f"{row['per_s']:>9.1f} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+        f"{peak} {row['max_rss_mb']:>8.1f}"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--result-mode", choices=("disk", "memory"), default="disk")
+    parser.add_argument("--only", type=str, default=",".join(GROUPS),
+                        help=f"Comma-separated groups out of {', '.join(GROUPS)}.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Report peak Python allocations per case (slows the run).")
+    parser.add_argument("--json", type=str, default=None, help="Also write results here.")
+    args = parser.parse_args()
+
+    groups = [g for g in args.only.split(",") if g]
+    unknown = sorted(set(groups) - set(GROUPS))
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(unknown)}")
+    for name in API_KEYS:
+        os.environ.setdefault(name, "benchmark")
+
+    def faults() -> Faults:
+        return Faults(
+            latency=args.latency_ms / 1000,
+            jitter=args.jitter_ms / 1000,
+            error_rate=args.error_rate,
+            seed=0,
+        )
+
+    sd = FakeStableDiffusionAPI(faults(), args.image_size).start()
+    oai = FakeOpenAI(faults(), args.image_size).start()
+    hf = FakeHF(faults(), args.image_size).start()
+    stability = FakeStability(faults(), args.image_size).start()
+
+    # Point every provider at the fakes.
+    import openai
+    from chisel.api.hf import HF, HFInference
+    from chisel.api.stability_ai import StabilityAI
+    from chisel.api.stable_diffusion_api import StableDiffusionAPI
+    from chisel.flow.linear_flow import LinearFlow
+    from chisel.ops import ImgToImg, SuperResolution, TxtToImg
+    from chisel.ops.provider import Provider
+
+    openai.api_base = oai.api_base
+    HF.base_url = hf.base_url
+    StabilityAI.host = stability.host
+    StableDiffusionAPI.base_url = sd.base_url
+
+    def make(op_cls: Any, provider: Provider) -> Any:
+        op = op_cls(provider)
+        op.set_result_mode(args.result_mode)
+        return op
+
+    n = args.requests
+    prompts = [f"a cute cat #{i}" for i in range(n)]
+    init_image = make_image(args.image_size, args.image_size)
+    runner = Runner(args)
+    print(
+        f"{'case':<26} {'mode':<7} {'n':>5} {'errors':>6} {'per_s':>9} "
+        f"{'p50_ms':>9} {'p99_ms':>9} {'peak_mb':>8} {'rss_mb':>8}"
+    )
+    try:
+        if "sd" in groups:
+            runner.bench_op("sd.txt2img", make(TxtToImg, Provider.STABLE_DIFFUSION_API),
+                            prompts, ("call", "batch", "abatch"))
+            urls = [sd.get_image_url() for _ in range(n)]
+            runner.bench_op("sd.super_res", make(SuperResolution, Provider.STABLE_DIFFUSION_API),
+                            urls, ("call", "batch"))
+        if "openai" in groups:
+            runner.bench_op("openai.txt2img", make(TxtToImg, Provider.OPENAI),
+                            prompts, ("call", "batch", "abatch"))
+            runner.bench_op("openai.img2img", make(ImgToImg, Provider.OPENAI),
+                            [init_image] * n, ("call", "batch"))
+        if "hf" in groups:
+            hf_api = HFInference()
+            params = {"model_id": "stabilityai/stable-diffusion-2-1", "txt_to_img": True}
+            runner.bench_op("hf.txt2img", lambda p: hf_api.run(p, params), prompts, ("call", "batch"))
+        if "stability" in groups:
+            runner.bench_op("stability.txt2img", make(TxtToImg, Provider.STABILITY_AI),
+                            prompts, ("call", "batch", "abatch"))
+            runner.bench_op("stability.img2img", make(ImgToImg, Provider.STABILITY_AI),
+                            [[p, init_image] for p in prompts], ("call", "batch"))
+        if "flow" in groups:
+            flow = LinearFlow([
+                make(TxtToImg, Provider.STABLE_DIFFUSION_API),
+                make(SuperResolution, Provider.STABLE_DIFFUSION_API),
+            ])
+            runner.bench_flow("flow.sd_txt2img>super_res", flow, prompts)
+            flow = LinearFlow([
+                make(TxtToImg, Provider.STABILITY_AI),
+                make(ImgToImg, Provider.OPENAI),
+            ])
+            runner.bench_flow("flow.stability>openai", flow, prompts)
+        if "local" in groups:
+            txt2img = make(TxtToImg, Provider.LOCAL)
+            txt2img.api.set_params({"width": args.image_size, "height": args.image_size})
+            runner.bench_op("local.txt2img", txt2img, prompts, ("call", "batch", "abatch"))
+            flow = LinearFlow([txt2img, make(SuperResolution, Provider.LOCAL)])
+            runner.bench_flow("flow.local_txt2img>super_res", flow, prompts)
+    finally:
+        for server in (sd, oai, hf, stability):
+            server.stop()
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(runner.results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 from pathlib import Path
 from urllib.parse import quote_plus
@@ -41,7 +40,7 @@ class GoogleImages(BaseDataSource):
         search_query = quote_plus(search_phrase)
 
         full_url = self.search_url.format(search_query=search_query)
-        response = requests.get(full_url)
+        response = self.storage.requests_session.get(full_url)
 
         # Create a BeautifulSoup object from the response content
         soup = BeautifulSoup(response.content, "html.parser")
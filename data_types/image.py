@@ -1,3 +1,206 @@
+import base64
+import hashlib
+import io
+import threading
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import PIL.Image
+
+from chisel.util.tracing import get_tracer
+
+
+_FORMAT_EXTS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp", "GIF": ".gif"}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def _get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            from chisel.storage.local_fs import LocalFS
+
+            _storage = LocalFS("~/chisel")
+        return _storage
+
+
+def _is_png(data: bytes) -> bool:
+    return data[:8] == b"\x89PNG\r\n\x1a\n"
+
+
 class Image(object):
-    def __init__(self) -> None:
-        pass
+    """
+    A handle to one image, built from whichever representation is at hand
+    (PIL image, ndarray, encoded bytes, local path or remote URL). Other
+    representations are materialized on first access and cached, so passing
+    an image through a chain of ops decodes and encodes it at most once.
+    """
+
+    def __init__(
+        self,
+        pil: Optional[PIL.Image.Image] = None,
+        array: Any = None,
+        data: Union[bytes, bytearray, memoryview, None] = None,
+        path: Union[str, Path, None] = None,
+        url: Optional[str] = None,
+    ) -> None:
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
+        if all(x is None for x in (pil, array, data, path, url)):
+            raise ValueError("Image needs at least one of pil, array, data, path or url.")
+        self._pil = pil
+        self._array = array
+        self._data = data
+        self._png_bytes: Optional[bytes] = None
+        self._path = Path(path) if path is not None else None
+        self._url = url
+        self._content_hash: Optional[str] = None
+
+    @classmethod
+    def from_pil(cls, img: PIL.Image.Image) -> "Image":
+        return cls(pil=img)
+
+    @classmethod
+    def from_array(cls, array: Any) -> "Image":
+        return cls(array=array)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, bytearray, memoryview]) -> "Image":
+        return cls(data=data)
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path]) -> "Image":
+        return cls(path=path)
+
+    @classmethod
+    def from_url(cls, url: str) -> "Image":
+        return cls(url=url)
+
+    @classmethod
+    def coerce(cls, value: Any) -> "Image":
+        """
+        Wraps any supported representation in an Image. Strings starting with
+        http:// or https:// are URLs, other strings are paths. Results
+        (APIResult, ResultEntry) convert to their first image.
+        """
+        if isinstance(value, Image):
+            return value
+        if hasattr(value, "to_image"):
+            return value.to_image()
+        if isinstance(value, PIL.Image.Image):
+            return cls(pil=value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return cls(data=value)
+        if isinstance(value, Path):
+            return cls(path=value)
+        if isinstance(value, str):
+            if value.startswith(("http://", "https://")):
+                return cls(url=value)
+            return cls(path=value)
+        if hasattr(value, "__array_interface__"):
+            return cls(array=value)
+        raise ValueError(f"Can't make an Image from {type(value).__name__}.")
+
+    @property
+    def url(self) -> Optional[str]:
+        return self._url
+
+    @property
+    def pil(self) -> PIL.Image.Image:
+        if self._pil is None:
+            if self._array is not None:
+                self._pil = PIL.Image.fromarray(self._array)
+            else:
+                data = self.get_bytes()
+                img = PIL.Image.open(io.BytesIO(data))
+                with get_tracer().span("decode", cat="image", format=img.format, bytes=len(data)):
+                    img.load()
+                self._pil = img
+        return self._pil
+
+    @property
+    def array(self) -> Any:
+        if self._array is None:
+            import numpy
+
+            self._array = numpy.asarray(self.pil)
+        return self._array
+
+    @property
+    def png_bytes(self) -> bytes:
+        if self._png_bytes is None:
+            data = self._get_encoded()
+            if data is not None and _is_png(data):
+                self._png_bytes = data
+            else:
+                img = self.pil
+                buf = io.BytesIO()
+                with get_tracer().span("encode", cat="image", format="PNG"):
+                    img.save(buf, format="PNG")
+                self._png_bytes = buf.getvalue()
+        return self._png_bytes
+
+    @property
+    def base64(self) -> str:
+        return base64.b64encode(self.get_bytes()).decode("ascii")
+
+    @property
+    def path(self) -> Path:
+        if self._path is None:
+            data = self.get_bytes()
+            fmt = PIL.Image.open(io.BytesIO(data)).format
+            self._path = _get_storage().write_to_tmp(
+                data, ext=_FORMAT_EXTS.get(fmt, ".png")
+            )
+        return self._path
+
+    @property
+    def content_hash(self) -> str:
+        """
+        A hash of the decoded pixels, so the same image hashes the same
+        whichever representation it came from.
+        """
+        if self._content_hash is None:
+            img = self.pil
+            h = hashlib.sha256(f"{img.mode}:{img.size}".encode())
+            h.update(img.tobytes())
+            self._content_hash = h.hexdigest()
+        return self._content_hash
+
+    def get_bytes(self) -> bytes:
+        """
+        Returns the image encoded in its original format if known, else as
+        PNG.
+        """
+        data = self._get_encoded()
+        if data is None:
+            return self.png_bytes
+        return data
+
+    def has_local(self) -> bool:
+        return any(x is not None for x in (self._pil, self._array, self._data, self._path))
+
+    def _get_encoded(self) -> Optional[bytes]:
+        if self._data is None:
+            if self._path is not None:
+                with open(str(self._path), "rb") as f:
+                    self._data = f.read()
+            elif self._url is not None and self._pil is None and self._array is None:
+                from chisel.util.transport import get_transport
+
+                r = get_transport().session.get(self._url)
+                r.raise_for_status()
+                self._data = r.content
+        return self._data
+
+    def __repr__(self) -> str:
+        have = [
+            name for name, x in (
+                ("pil", self._pil), ("array", self._array), ("data", self._data),
+                ("path", self._path), ("url", self._url),
+            )
+            if x is not None
+        ]
+        return f"Image({', '.join(have)})"
@@ -20,7 +20,7 @@ def run_super_resolution(txt_input, img_input, provider):
     if provider == Provider.STABILITY_AI:
         output = super_resolution([txt_input, img_input])
     elif provider == Provider.STABLE_DIFFUSION_API:
-        output = super_resolution(chisel_result.results[0].get("remote_url", None))
+        output = super_resolution(chisel_result.to_image())
     return output.get_image(0)
 
 
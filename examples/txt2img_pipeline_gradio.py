@@ -17,15 +17,13 @@ def run_txt2img(txt_input, provider):
 
 def run_img2img(txt_input, img_input, provider):
     img2img = ImgToImg(provider=provider)
-    if provider == Provider.STABLE_DIFFUSION_API:
-        img_input = chisel_result.results[0].get("remote_url", None)
-        inputs = [txt_input, img_input]
-    elif provider == Provider.STABILITY_AI:
-        img_input = chisel_result.results[0].get("img", None)
-        inputs = [txt_input, img_input]
-    elif provider == Provider.OPENAI:
-        img_input = chisel_result.results[0].get("local_filename", None)
+    # An Image handle works as input to every provider: each one takes the
+    # representation it needs (URL, PNG bytes or pixels) from it.
+    img_input = chisel_result.to_image()
+    if provider == Provider.OPENAI:
         inputs = img_input
+    else:
+        inputs = [txt_input, img_input]
     output = img2img(inputs)
     return output.get_image(0)
 
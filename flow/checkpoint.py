@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+from chisel.api.cache import hash_input
+from chisel.api.result import APIResult
+from chisel.data_types import Image
+from chisel.storage.local_fs import LocalFS
+from chisel.util.files import get_ext
+
+
+class CheckpointStore(object):
+    """
+    Saves the output of every flow stage under LocalFS, keyed by flow id,
+    input hash and stage index, so a flow re-run after a crash or deploy
+    resumes each input after its last completed stage.
+
+    Entries live in <storage_dir>/checkpoints/<flow_id>/<input hash>/<stage>/.
+    APIResults and Images are stored as image files, other values are
+    pickled. Use a new flow_id (or clear()) when the flow's ops change.
+    """
+
+    manifest_name: str = "manifest.json"
+
+    def __init__(self, flow_id: str, storage_dir: str = "~/chisel") -> None:
+        if not flow_id or os.sep in flow_id:
+            raise ValueError(f"Invalid flow_id: {flow_id!r}")
+        self.flow_id = flow_id
+        self.storage = LocalFS(storage_dir)
+        self.flow_dir = self.storage.get_dir("checkpoints") / flow_id
+        self.flow_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, inp: Any) -> str:
+        blob = json.dumps(hash_input(inp), sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _get_stage_dir(self, key: str, stage: int) -> Path:
+        return self.flow_dir / key / str(stage)
+
+    def has(self, key: str, stage: int) -> bool:
+        return (self._get_stage_dir(key, stage) / self.manifest_name).is_file()
+
+    def get_last_stage(self, key: str, num_stages: int) -> int:
+        """
+        Returns the index of the last completed stage for `key`, or -1.
+        """
+        for stage in range(num_stages - 1, -1, -1):
+            if self.has(key, stage):
+                return stage
+        return -1
+
+    def save(self, key: str, stage: int, value: Any) -> None:
+        stage_dir = self._get_stage_dir(key, stage)
+        tmp_dir = stage_dir.parent / f".{stage}.{uuid.uuid4().hex}"
+        tmp_dir.mkdir(parents=True)
+
+        if isinstance(value, APIResult):
+            files = []
+            for i, entry in enumerate(value):
+                filename = None
+                if entry.local_filename is not None:
+                    src = Path(str(entry.local_filename))
+                    filename = f"{i}{src.suffix}"
+                    shutil.copyfile(str(src), str(tmp_dir / filename))
+                elif entry.data is not None:
+                    ext = get_ext(entry.remote_url) if entry.remote_url else None
+                    filename = f"{i}{ext or '.png'}"
+                    with open(str(tmp_dir / filename), "wb") as f:
+                        f.write(entry.data)
+                files.append({"filename": filename, "remote_url": entry.remote_url})
+            manifest = {"kind": "api_result", "files": files}
+        elif isinstance(value, Image):
+            filename = None
+            if value.has_local():
+                filename = "0" + value.path.suffix
+                shutil.copyfile(str(value.path), str(tmp_dir / filename))
+            manifest = {"kind": "image", "filename": filename, "url": value.url}
+        else:
+            with open(str(tmp_dir / "value.pickle"), "wb") as f:
+                pickle.dump(value, f)
+            manifest = {"kind": "pickle"}
+
+        with open(str(tmp_dir / self.manifest_name), "w") as f:
+            json.dump(manifest, f)
+        if stage_dir.exists():
+            shutil.rmtree(str(stage_dir), ignore_errors=True)
+        os.replace(str(tmp_dir), str(stage_dir))
+
+    def load(self, key: str, stage: int) -> Any:
+        stage_dir = self._get_stage_dir(key, stage)
+        with open(str(stage_dir / self.manifest_name), "r") as f:
+            manifest = json.load(f)
+
+        kind = manifest["kind"]
+        if kind == "api_result":
+            api_result = APIResult()
+            for x in manifest["files"]:
+                path = stage_dir / x["filename"] if x["filename"] is not None else None
+                api_result.add(path, remote_url=x["remote_url"])
+            return api_result
+        if kind == "image":
+            path = manifest["filename"]
+            return Image(
+                path=stage_dir / path if path is not None else None,
+                url=manifest["url"],
+            )
+        with open(str(stage_dir / "value.pickle"), "rb") as f:
+            return pickle.load(f)
+
+    def clear(self, inp: Optional[Any] = None) -> None:
+        """
+        Removes the checkpoints of one input, or of the whole flow.
+        """
+        if inp is None:
+            shutil.rmtree(str(self.flow_dir), ignore_errors=True)
+            self.flow_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            shutil.rmtree(str(self.flow_dir / self.get_key(inp)), ignore_errors=True)
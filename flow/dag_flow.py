@@ -0,0 +1,148 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from chisel.ops.base_chisel import BaseChisel
+from chisel.util.tracing import bind_context, get_tracer
+
+
+class _Node(object):
+    def __init__(self, name: str, op: Callable[[Any], Any], inputs: List[str]) -> None:
+        self.name = name
+        self.op = op
+        self.inputs = inputs
+        self.children: List[str] = []
+
+
+class DAGFlow(object):
+    """
+    A flow whose ops form a DAG. A node takes the flow input, or the output
+    of the nodes it names in `inputs`: a single parent's output is passed as
+    is, several parents' outputs as a list in the given order (fan-in). A
+    node can feed any number of children (fan-out).
+
+    On each call, independent branches run concurrently, every node runs
+    exactly once however many children consume it, and each intermediate
+    output is dropped as soon as its last consumer has finished.
+
+        flow = DAGFlow()
+        flow.add("cat", txt2img)
+        flow.add("big", super_res, inputs=["cat"])
+        for i in range(3):
+            flow.add(f"var{i}", lambda r: img2img(["watercolor", r]), inputs=["cat"])
+        outputs = flow("a cute cat")  # {"big": ..., "var0": ..., ...}
+    """
+
+    # Names the flow's own input in a node's `inputs`.
+    INPUT = "input"
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self.max_workers = max_workers
+        self.nodes: Dict[str, _Node] = {}
+
+    def add(
+        self,
+        name: str,
+        op: Union[BaseChisel, Callable[[Any], Any]],
+        inputs: Optional[Sequence[str]] = None,
+    ) -> str:
+        """
+        Adds a node and returns its name. `inputs` must name nodes that were
+        already added (or DAGFlow.INPUT), which keeps the graph acyclic.
+        """
+        if name in self.nodes or name == self.INPUT:
+            raise ValueError(f"A node named {name!r} already exists.")
+        inputs = list(inputs) if inputs is not None else [self.INPUT]
+        if not inputs:
+            raise ValueError("inputs can't be empty.")
+        for parent in inputs:
+            if parent != self.INPUT and parent not in self.nodes:
+                raise ValueError(f"Unknown input node {parent!r} for {name!r}.")
+
+        self.nodes[name] = _Node(name, op, inputs)
+        for parent in set(inputs):
+            if parent != self.INPUT:
+                self.nodes[parent].children.append(name)
+        return name
+
+    def get_sinks(self) -> List[str]:
+        return [name for name, node in self.nodes.items() if not node.children]
+
+    def __call__(self, inp: Any, outputs: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Runs the flow on `inp` and returns {node name: output} for `outputs`,
+        by default every node without children. Raises the first error a
+        node raises; nodes that haven't started yet are skipped.
+        """
+        outputs = list(outputs) if outputs is not None else self.get_sinks()
+        for name in outputs:
+            if name not in self.nodes:
+                raise ValueError(f"Unknown output node {name!r}.")
+
+        # Only run the nodes the requested outputs depend on.
+        needed = set()
+        stack = list(outputs)
+        while stack:
+            name = stack.pop()
+            if name not in needed and name != self.INPUT:
+                needed.add(name)
+                stack.extend(self.nodes[name].inputs)
+
+        # How many unfinished consumers each value still has; a requested
+        # output counts as one more so it's kept until the end.
+        consumers = {self.INPUT: 0}
+        for name in needed:
+            consumers.setdefault(name, 0)
+            for parent in set(self.nodes[name].inputs):
+                consumers[parent] = consumers.get(parent, 0) + 1
+        for name in outputs:
+            consumers[name] += 1
+
+        values: Dict[str, Any] = {self.INPUT: inp}
+        waiting = {
+            name: len(set(self.nodes[name].inputs) - {self.INPUT}) for name in needed
+        }
+        lock = threading.Lock()
+
+        def run(node: _Node) -> Any:
+            with lock:
+                args = [values[parent] for parent in node.inputs]
+            with get_tracer().span(node.name, cat="flow"):
+                return node.op(args[0] if len(args) == 1 else args)
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="chisel-dag"
+        ) as pool:
+            pending: Dict[Future, str] = {}
+
+            def submit_ready() -> None:
+                for name in [n for n, count in waiting.items() if count == 0]:
+                    del waiting[name]
+                    pending[pool.submit(bind_context(run), self.nodes[name])] = name
+
+            submit_ready()
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = pending.pop(future)
+                        value = future.result()
+                        node = self.nodes[name]
+                        with lock:
+                            values[name] = value
+                            for parent in set(node.inputs):
+                                consumers[parent] -= 1
+                                if consumers[parent] == 0:
+                                    # Nothing else reads it; let it be freed.
+                                    values.pop(parent, None)
+                            if consumers[name] == 0:
+                                values.pop(name, None)
+                        for child in node.children:
+                            if child in waiting:
+                                waiting[child] -= 1
+                    submit_ready()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        return {name: values[name] for name in outputs}
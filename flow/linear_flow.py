@@ -1,24 +1,235 @@
-from typing import List, Union
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
+from chisel.flow.checkpoint import CheckpointStore
 from chisel.ops.base_chisel import BaseChisel
+from chisel.ops.batch import BatchItem
+from chisel.util.tracing import bind_context, get_tracer
+
+
+# Marks the end of the input on a stage's queue.
+_DONE = object()
+
+
+class _Stage(object):
+    def __init__(self, op: BaseChisel, workers: int, queue_size: int) -> None:
+        self.op = op
+        self.workers = workers
+        self.inbox: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.remaining = workers
+        self.lock = threading.Lock()
 
 
 class LinearFlow(object):
-    def __init__(self, ops: List[BaseChisel] = []):
-        self.ops: List[BaseChisel] = ops
+    def __init__(self, ops: Optional[List[BaseChisel]] = None):
+        self.ops: List[BaseChisel] = list(ops) if ops is not None else []
+        self.checkpoints: Optional[CheckpointStore] = None
 
     def add(self, ops: Union[BaseChisel, List[BaseChisel]]) -> None:
         if isinstance(ops, BaseChisel):
             self.ops.append(ops)
-        elif isinstance(ops, List[BaseChisel]):
+        elif isinstance(ops, (list, tuple)) and all(isinstance(op, BaseChisel) for op in ops):
             self.ops += ops
         else:
-            raise ValueError("ops should be either a BaseChisel or a Union " +
+            raise ValueError("ops should be either a BaseChisel or a list " +
                              "of BaseChisels.")
 
+    def enable_checkpoints(
+        self,
+        flow_id: str,
+        storage_dir: str = "~/chisel",
+    ) -> CheckpointStore:
+        """
+        Saves the output of every op to LocalFS under `flow_id`. Re-running
+        the flow on an input it has seen before (after a crash or deploy)
+        starts after the last op that completed for that input.
+        """
+        self.checkpoints = CheckpointStore(flow_id, storage_dir)
+        return self.checkpoints
+
     def __call__(self, *args):
-        x = args
-        for op in self.ops:
-            x = op(x)
-            # TODO: add logging/storage of results at each step.
+        """
+        Runs the ops in turn. A single argument reaches the first op as is,
+        the way stream() passes each input; several are passed as a tuple.
+        """
+        x = args[0] if len(args) == 1 else args
+        store = self.checkpoints
+        if store is None:
+            for op in self.ops:
+                x = op(x)
+            return x
+
+        key = store.get_key(x)
+        last = store.get_last_stage(key, len(self.ops))
+        if last >= 0:
+            x = store.load(key, last)
+        for i in range(last + 1, len(self.ops)):
+            x = self.ops[i](x)
+            store.save(key, i, x)
         return x
+
+    def stream(
+        self,
+        inputs: Iterable[Any],
+        workers: Union[int, Sequence[int]] = 4,
+        queue_size: int = None,
+        ordered: bool = True,
+    ) -> Iterator[BatchItem]:
+        """
+        Runs many inputs through the flow as a pipeline: each op gets its own
+        pool of `workers` threads (an int for all ops, or one per op) and
+        consecutive ops are connected by queues of `queue_size` items, so
+        different inputs occupy different ops at the same time. When a queue
+        fills up, the ops before it wait, and inputs are pulled lazily.
+
+        Yields a BatchItem per input, in input order unless `ordered=False`.
+        An item that fails at some op skips the ops after it. With
+        checkpoints enabled, each input skips the ops it already completed
+        in an earlier run.
+        """
+        if isinstance(workers, int):
+            workers = [workers] * len(self.ops)
+        if len(workers) != len(self.ops):
+            raise ValueError("workers needs one entry per op.")
+        if any(w < 1 for w in workers):
+            raise ValueError("workers must be >= 1.")
+        if not self.ops:
+            for index, inp in enumerate(inputs):
+                yield BatchItem(index, inp, result=inp)
+            return
+
+        stages = [
+            _Stage(op, w, queue_size if queue_size is not None else 2 * w)
+            for op, w in zip(self.ops, workers)
+        ]
+        outbox: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        store = self.checkpoints
+        # Checkpoint key and last completed op of each item, by index.
+        resume: Dict[int, Tuple[str, int]] = {}
+        tracer = get_tracer()
+        # When each item was queued for its next op, to trace queue waits.
+        queued_at: Dict[int, int] = {}
+        # Caps the items between the input and the consumer, so an ordered
+        # stream waiting on one slow item can't buffer without bound.
+        in_flight = threading.BoundedSemaphore(
+            sum(s.inbox.maxsize + s.workers for s in stages)
+        )
+
+        def put(q: queue.Queue, item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def feed() -> None:
+            try:
+                for index, inp in enumerate(inputs):
+                    while not in_flight.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if tracer.enabled:
+                        queued_at[index] = time.perf_counter_ns()
+                    if not put(stages[0].inbox, BatchItem(index, inp, result=inp)):
+                        return
+            except Exception as e:
+                put(outbox, e)
+            for _ in range(stages[0].workers):
+                put(stages[0].inbox, _DONE)
+
+        def run_op(i: int, item: BatchItem) -> None:
+            op = stages[i].op
+            if store is None:
+                item.result = op(item.result)
+                return
+            if i == 0:
+                key = store.get_key(item.inp)
+                resume[item.index] = (key, store.get_last_stage(key, len(stages)))
+            key, last = resume[item.index]
+            # Ops before the last completed one pass the item through
+            # untouched; it's loaded at that op.
+            if i == last:
+                item.result = store.load(key, i)
+            elif i > last:
+                item.result = op(item.result)
+                store.save(key, i, item.result)
+
+        def work(i: int) -> None:
+            stage = stages[i]
+            target = stages[i + 1].inbox if i + 1 < len(stages) else outbox
+            while not stop.is_set():
+                try:
+                    item = stage.inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                if item.ok:
+                    try:
+                        if tracer.enabled:
+                            wait_ns = time.perf_counter_ns() - queued_at.pop(item.index, 0)
+                            with tracer.span(
+                                f"stage {i}", cat="flow", op=type(stage.op).__name__,
+                                index=item.index, queue_wait_ms=wait_ns / 1e6,
+                            ):
+                                run_op(i, item)
+                        else:
+                            run_op(i, item)
+                    except Exception as e:
+                        item.result = None
+                        item.error = e
+                if tracer.enabled and i + 1 < len(stages):
+                    queued_at[item.index] = time.perf_counter_ns()
+                if not put(target, item):
+                    return
+
+            with stage.lock:
+                stage.remaining -= 1
+                last = stage.remaining == 0
+            if last:
+                # The last worker out passes the end of input downstream.
+                downstream = stages[i + 1].workers if i + 1 < len(stages) else 1
+                for _ in range(downstream):
+                    put(target, _DONE)
+
+        # Threads run in a copy of the caller's context to keep their spans
+        # in the caller's trace run.
+        threads = [
+            threading.Thread(target=bind_context(feed), name="chisel-flow-feed", daemon=True)
+        ]
+        for i, stage in enumerate(stages):
+            threads += [
+                threading.Thread(
+                    target=bind_context(work), args=(i,), name=f"chisel-flow-{i}", daemon=True
+                )
+                for _ in range(stage.workers)
+            ]
+        for t in threads:
+            t.start()
+
+        next_index = 0
+        buffered: Dict[int, BatchItem] = {}
+        try:
+            while True:
+                item = outbox.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                resume.pop(item.index, None)
+                if not ordered:
+                    in_flight.release()
+                    yield item
+                    continue
+                buffered[item.index] = item
+                while next_index in buffered:
+                    in_flight.release()
+                    yield buffered.pop(next_index)
+                    next_index += 1
+        finally:
+            stop.set()
@@ -1,5 +1,26 @@
-from chisel.ops.txt_to_txt import TxtToTxt
-from chisel.ops.txt_to_img import TxtToImg
-from chisel.ops.img_to_img import ImgToImg
-from chisel.ops.img_edit import ImgEdit
-from chisel.ops.super_res import SuperResolution
+import importlib
+from typing import Any
+
+# Ops are imported on first access; TxtToTxt in particular pulls in
+# langchain and qdrant_client.
+_lazy_imports = {
+    "TxtToTxt": "chisel.ops.txt_to_txt",
+    "TxtToImg": "chisel.ops.txt_to_img",
+    "ImgToImg": "chisel.ops.img_to_img",
+    "ImgEdit": "chisel.ops.img_edit",
+    "SuperResolution": "chisel.ops.super_res",
+}
+
+__all__ = list(_lazy_imports)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy_imports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
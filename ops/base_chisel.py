@@ -1,25 +1,130 @@
+import functools
 from abc import abstractmethod, ABCMeta
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Union
 
 from chisel.api.base_api_provider import BaseAPIProvider
+from chisel.api.cache import CachedAPIProvider, ResultCache, get_result_cache
+from chisel.api.router import RoutingProvider
+from chisel.api.single_flight import CoalescingAPIProvider, SingleFlight
+from chisel.ops.batch import BatchItem, amap_concurrent, map_concurrent
 from chisel.ops.provider import Provider
+from chisel.util.tracing import get_tracer
+
+
+def _traced(call: Any, name: str) -> Any:
+    @functools.wraps(call)
+    def traced_call(self, *args, **kwargs):
+        with get_tracer().span(name, cat="op"):
+            return call(self, *args, **kwargs)
+    return traced_call
 
 
 class BaseChisel(metaclass=ABCMeta):
-    def __init__(self, provider: Provider) -> None:
+    def __init__(self, provider: Union[Provider, Sequence[Provider]]) -> None:
         self.provider = provider
-        self.api = self._get_api(provider)
+        if isinstance(provider, (list, tuple)):
+            # Several providers: route each call to the fastest healthy one.
+            self.api = RoutingProvider([self._get_api(p) for p in provider])
+        else:
+            self.api = self._get_api(provider)
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # Every op's __call__ records a span named after the op.
+        call = cls.__dict__.get("__call__", None)
+        if call is not None and not getattr(call, "__isabstractmethod__", False):
+            cls.__call__ = _traced(call, cls.__name__)
 
     @abstractmethod
     def _get_api(self, provider: Provider) -> BaseAPIProvider:
+        """
+        Builds the provider's API. Implementations import the provider module
+        here, so only the SDK of the chosen provider gets loaded.
+        """
         pass
 
     def get_params(self) -> Dict[str, Any]:
         return self.api.get_params()
 
-    def set_params(self) -> Dict[str, Any]:
-        return self.api.set_params()
+    def set_params(self, params: Dict[str, Any]) -> Any:
+        return self.api.set_params(params)
+
+    def set_result_mode(self, mode: str, persist: bool = True) -> None:
+        """
+        "memory" keeps result images as encoded bytes and decodes them on
+        first access, skipping the disk round trip; with `persist` they're
+        also written to LocalFS in the background. "disk" is the default.
+        """
+        self.api.set_result_mode(mode, persist)
+
+    def enable_cache(self, cache: ResultCache = None) -> ResultCache:
+        """
+        Serves repeated calls with the same input, seed and params from an
+        on-disk result cache instead of the provider.
+        """
+        if cache is None:
+            cache = get_result_cache()
+        self.api = CachedAPIProvider(self.api, cache)
+        return cache
+
+    def enable_coalescing(self, single_flight: SingleFlight = None) -> SingleFlight:
+        """
+        Makes identical concurrent calls (same input, seed and params) share
+        a single provider call.
+        """
+        self.api = CoalescingAPIProvider(self.api, single_flight)
+        return self.api.single_flight
 
     @abstractmethod
     def __call__(self, *args):
         return None
+
+    async def acall(self, inp: Any, params: Optional[Dict[str, Any]] = None) -> Any:
+        with get_tracer().span(type(self).__name__, cat="op"):
+            return await self.api.arun(inp, params)
+
+    def stream(self, inp: Any, params: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        Yields results as the provider produces them, e.g. one image at a time
+        for StabilityAI, so work on the first sample can start early.
+        """
+        return self.api.stream(inp, params)
+
+    def astream(self, inp: Any, params: Optional[Dict[str, Any]] = None) -> AsyncIterator[Any]:
+        return self.api.astream(inp, params)
+
+    def map(
+        self,
+        inputs: Iterable[Any],
+        concurrency: int = 8,
+        ordered: bool = True,
+    ) -> Iterator[BatchItem]:
+        """
+        Lazily runs this op over `inputs`, at most `concurrency` at a time.
+        Yields a BatchItem per input, in input order unless `ordered=False`.
+        """
+        return map_concurrent(self, inputs, concurrency, ordered)
+
+    def batch(
+        self,
+        inputs: Iterable[Any],
+        concurrency: int = 8,
+        ordered: bool = True,
+    ) -> List[BatchItem]:
+        return list(self.map(inputs, concurrency, ordered))
+
+    def amap(
+        self,
+        inputs: Iterable[Any],
+        concurrency: int = 64,
+        ordered: bool = True,
+    ) -> AsyncIterator[BatchItem]:
+        return amap_concurrent(self.acall, inputs, concurrency, ordered)
+
+    async def abatch(
+        self,
+        inputs: Iterable[Any],
+        concurrency: int = 64,
+        ordered: bool = True,
+    ) -> List[BatchItem]:
+        return [item async for item in self.amap(inputs, concurrency, ordered)]
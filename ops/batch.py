@@ -0,0 +1,160 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Optional
+)
+
+from chisel.util.tracing import bind_context
+
+
+class BatchItem(object):
+    """
+    The outcome of one input in a batch. Exactly one of `result` and `error`
+    is set, so a failing item never aborts the rest of the batch.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        inp: Any,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self.index = index
+        self.inp = inp
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"BatchItem(index={self.index}, {status})"
+
+
+def _call(fn: Callable[[Any], Any], index: int, inp: Any) -> BatchItem:
+    try:
+        return BatchItem(index, inp, result=fn(inp))
+    except Exception as e:
+        return BatchItem(index, inp, error=e)
+
+
+async def _acall(
+    fn: Callable[[Any], Awaitable[Any]],
+    index: int,
+    inp: Any,
+) -> BatchItem:
+    try:
+        return BatchItem(index, inp, result=await fn(inp))
+    except Exception as e:
+        return BatchItem(index, inp, error=e)
+
+
+def map_concurrent(
+    fn: Callable[[Any], Any],
+    inputs: Iterable[Any],
+    concurrency: int = 8,
+    ordered: bool = True,
+) -> Iterator[BatchItem]:
+    """
+    Runs `fn` over `inputs` on a pool of `concurrency` threads. Inputs are
+    pulled lazily, so arbitrarily long iterables never sit in memory at once.
+    With `ordered=False`, items are yielded as they complete.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be >= 1.")
+
+    # Bounds how many finished items can wait behind a slow head-of-line
+    # item in ordered mode before we stop submitting new work.
+    max_buffered = 4 * concurrency
+    inputs = enumerate(inputs)
+    exhausted = False
+    next_index = 0
+    buffered: Dict[int, BatchItem] = {}
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            while (
+                not exhausted
+                and len(pending) < concurrency
+                and len(buffered) < max_buffered
+            ):
+                try:
+                    index, inp = next(inputs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(bind_context(_call), fn, index, inp))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = future.result()
+                if ordered:
+                    buffered[item.index] = item
+                else:
+                    yield item
+
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+
+
+async def amap_concurrent(
+    fn: Callable[[Any], Awaitable[Any]],
+    inputs: Iterable[Any],
+    concurrency: int = 8,
+    ordered: bool = True,
+) -> AsyncIterator[BatchItem]:
+    """
+    The asyncio counterpart of map_concurrent: at most `concurrency`
+    coroutines from `fn` are in flight at any time.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be >= 1.")
+
+    max_buffered = 4 * concurrency
+    inputs = enumerate(inputs)
+    exhausted = False
+    next_index = 0
+    buffered: Dict[int, BatchItem] = {}
+    pending = set()
+
+    try:
+        while True:
+            while (
+                not exhausted
+                and len(pending) < concurrency
+                and len(buffered) < max_buffered
+            ):
+                try:
+                    index, inp = next(inputs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(_acall(fn, index, inp)))
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                item = task.result()
+                if ordered:
+                    buffered[item.index] = item
+                else:
+                    yield item
+
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,4 +1,5 @@
-from chisel.api import OpenAIImgEdit, StabilityAIImgEdit, StableDiffusionAPIImgEdit
+from typing import Any, Dict, Optional
+
 from chisel.api.base_api_provider import BaseAPIProvider
 from chisel.data_types import Image
 from chisel.ops.base_chisel import BaseChisel
@@ -11,11 +12,21 @@ class ImgEdit(BaseChisel):
 
     def _get_api(self, provider: Provider) -> BaseAPIProvider:
         if provider == Provider.OPENAI:
+            from chisel.api.openai import OpenAIImgEdit
+
             return OpenAIImgEdit()
         if provider == Provider.STABILITY_AI:
+            from chisel.api.stability_ai import StabilityAIImgEdit
+
             return StabilityAIImgEdit()
         if provider == Provider.STABLE_DIFFUSION_API:
+            from chisel.api.stable_diffusion_api import StableDiffusionAPIImgEdit
+
             return StableDiffusionAPIImgEdit()
+        if provider == Provider.LOCAL:
+            from chisel.api.local import LocalImgEdit
+
+            return LocalImgEdit()
 
-    def __call__(self, img: Image) -> Image:
-        return self.api.run(img)
+    def __call__(self, img: Image, params: Optional[Dict[str, Any]] = None) -> Image:
+        return self.api.run(img, params)
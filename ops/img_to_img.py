@@ -1,4 +1,5 @@
-from chisel.api import OpenAIImgToImg, StabilityAIImgToImg, StableDiffusionAPIImgToImg
+from typing import Any, Dict, Optional
+
 from chisel.api.base_api_provider import BaseAPIProvider
 from chisel.data_types import Image
 from chisel.ops.base_chisel import BaseChisel
@@ -11,11 +12,21 @@ class ImgToImg(BaseChisel):
 
     def _get_api(self, provider: Provider) -> BaseAPIProvider:
         if provider == Provider.OPENAI:
+            from chisel.api.openai import OpenAIImgToImg
+
             return OpenAIImgToImg()
         if provider == Provider.STABILITY_AI:
+            from chisel.api.stability_ai import StabilityAIImgToImg
+
             return StabilityAIImgToImg()
         if provider == Provider.STABLE_DIFFUSION_API:
+            from chisel.api.stable_diffusion_api import StableDiffusionAPIImgToImg
+
             return StableDiffusionAPIImgToImg()
+        if provider == Provider.LOCAL:
+            from chisel.api.local import LocalImgToImg
+
+            return LocalImgToImg()
 
-    def __call__(self, img: Image) -> Image:
-        return self.api.run(img)
+    def __call__(self, img: Image, params: Optional[Dict[str, Any]] = None) -> Image:
+        return self.api.run(img, params)
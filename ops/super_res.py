@@ -1,6 +1,6 @@
-from typing import List, Union
-from chisel.api import StabilityAISuperRes, StableDiffusionAPISuperRes
+from typing import Any, Dict, List, Optional, Union
 from chisel.api.base_api_provider import BaseAPIProvider
+from chisel.api.cache import ResultCache
 from chisel.data_types import Image
 from chisel.ops.base_chisel import BaseChisel
 from chisel.ops.provider import Provider
@@ -12,11 +12,39 @@ class SuperResolution(BaseChisel):
 
     def _get_api(self, provider: Provider) -> BaseAPIProvider:
         if provider == Provider.STABILITY_AI:
+            from chisel.api.stability_ai import StabilityAISuperRes
+
             return StabilityAISuperRes()
         elif provider == Provider.STABLE_DIFFUSION_API:
+            from chisel.api.stable_diffusion_api import StableDiffusionAPISuperRes
+
             return StableDiffusionAPISuperRes()
+        elif provider == Provider.LOCAL:
+            from chisel.api.local import LocalSuperRes
+
+            return LocalSuperRes()
         else:
             raise ValueError(f"Invalid provider: {provider}")
 
-    def __call__(self, inputs: Union[Image, List[str]]) -> Image:
-        return self.api.run(inputs)
+    def __call__(self, inputs: Union[Image, List[str]], params: Optional[Dict[str, Any]] = None) -> Image:
+        return self.api.run(inputs, params)
+
+    def enable_tiling(
+        self,
+        scale: float = 2,
+        tile_size: int = 512,
+        overlap: int = 32,
+        concurrency: int = 4,
+        cache: Optional[ResultCache] = None,
+    ) -> BaseAPIProvider:
+        """
+        Upscales images larger than `tile_size` in overlapping tiles, sent to
+        the provider concurrently and blended back together, so images past
+        the provider's size limit can be upscaled. Finished tiles are cached
+        and reused when a call is retried. StableDiffusionAPI, which only
+        takes image URLs, raises a ValueError.
+        """
+        from chisel.api.tiled import TiledSuperRes
+
+        self.api = TiledSuperRes(self.api, scale, tile_size, overlap, concurrency, cache)
+        return self.api
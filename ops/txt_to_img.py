@@ -1,4 +1,5 @@
-from chisel.api import OpenAITxtToImg, StabilityAITxtToImg, StableDiffusionAPITxtToImg
+from typing import Any, Dict, Optional
+
 from chisel.api.base_api_provider import BaseAPIProvider
 from chisel.data_types import Text, Image
 from chisel.ops.base_chisel import BaseChisel
@@ -11,13 +12,23 @@ class TxtToImg(BaseChisel):
 
     def _get_api(self, provider: Provider) -> BaseAPIProvider:
         if provider == Provider.OPENAI:
+            from chisel.api.openai import OpenAITxtToImg
+
             return OpenAITxtToImg()
         elif provider == Provider.STABILITY_AI:
+            from chisel.api.stability_ai import StabilityAITxtToImg
+
             return StabilityAITxtToImg()
         elif provider == Provider.STABLE_DIFFUSION_API:
+            from chisel.api.stable_diffusion_api import StableDiffusionAPITxtToImg
+
             return StableDiffusionAPITxtToImg()
+        elif provider == Provider.LOCAL:
+            from chisel.api.local import LocalTxtToImg
+
+            return LocalTxtToImg()
         else:
             raise ValueError(f"Invalid provider: {provider}")
 
-    def __call__(self, txt: Text) -> Image:
-        return self.api.run(txt)
+    def __call__(self, txt: Text, params: Optional[Dict[str, Any]] = None) -> Image:
+        return self.api.run(txt, params)
@@ -1,14 +1,26 @@
 import os
+import threading
+from typing import TYPE_CHECKING, Optional
 
-from qdrant_client import QdrantClient
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
 
 
 class QdrantDBFactory(object):
-    client: QdrantClient = QdrantClient(
-        "https://d638b054-362e-411d-90e3-88e0f9e35b59.eu-central-1-0.aws.cloud.qdrant.io",
-        prefer_grpc=True,
-        api_key=os.environ["QDRANT_API_KEY"],
-    )
-
-    def get_client(self) -> QdrantClient:
-        return self.client
+    url: str = "https://d638b054-362e-411d-90e3-88e0f9e35b59.eu-central-1-0.aws.cloud.qdrant.io"
+    client: Optional["QdrantClient"] = None
+    _lock = threading.Lock()
+
+    def get_client(self) -> "QdrantClient":
+        # Connect on first use rather than at import, and share the client.
+        if QdrantDBFactory.client is None:
+            with QdrantDBFactory._lock:
+                if QdrantDBFactory.client is None:
+                    from qdrant_client import QdrantClient
+
+                    QdrantDBFactory.client = QdrantClient(
+                        self.url,
+                        prefer_grpc=True,
+                        api_key=os.environ["QDRANT_API_KEY"],
+                    )
+        return QdrantDBFactory.client
@@ -1,15 +1,31 @@
+import os
 import random
+import shutil
 import string
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import listdir, unlink
 from os.path import expanduser, isfile, join
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
-import requests
 from PIL import Image
-from requests.adapters import HTTPAdapter, Retry
 
 from chisel.util.files import get_ext
+from chisel.util.tracing import bind_context, get_tracer
+from chisel.util.transport import get_transport
+
+
+_writer: Optional[ThreadPoolExecutor] = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> ThreadPoolExecutor:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chisel-localfs")
+        return _writer
 
 
 class LocalFS(object):
@@ -17,17 +33,12 @@ class LocalFS(object):
         self.storage_dir = expanduser(storage_dir)
         self.tmp_storage = Path(join(self.storage_dir, "tmp"))
         self.tmp_storage.mkdir(parents=True, exist_ok=True)
+        self.requests_session = get_transport().session
 
-        s = requests.Session()
-        retries = Retry(
-            total=5,
-            backoff_factor=0.1,
-            status_forcelist=[404, 500, 502, 503, 504]
-        )
-        s.mount('http://', HTTPAdapter(max_retries=retries))
-        s.mount('https://', HTTPAdapter(max_retries=retries))
-        self.requests_session = s
-
+    def get_dir(self, name: str) -> Path:
+        path = Path(join(self.storage_dir, name))
+        path.mkdir(parents=True, exist_ok=True)
+        return path
 
     def download_img_from_url(
         self,
@@ -56,8 +67,36 @@ class LocalFS(object):
             filename = self._get_random_tmp_filename(ext)
 
         full_path = self.tmp_storage / filename
-        with open(str(full_path), "wb") as f:
-            f.write(obj)
+        with get_tracer().span("write_to_tmp", cat="disk", bytes=len(obj)):
+            with open(str(full_path), "wb") as f:
+                f.write(obj)
+        return full_path
+
+    def write_to_tmp_async(
+        self,
+        obj: Any,
+        filename: Path = None,
+        ext: str = None,
+    ) -> Future:
+        """
+        Like write_to_tmp, but writes on a background thread and returns a
+        Future of the path.
+        """
+        return _get_writer().submit(bind_context(self.write_to_tmp), obj, filename, ext)
+
+    def link_to_tmp(self, src: Path) -> Path:
+        """
+        Gives a file a new name in tmp storage, sharing its contents through
+        a hard link where possible, so it outlives the original's removal.
+        """
+        full_path = self.tmp_storage / self._get_random_tmp_filename(Path(src).suffix)
+        try:
+            os.link(str(src), str(full_path))
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # Not on the same filesystem, or links aren't supported.
+            shutil.copyfile(str(src), str(full_path))
         return full_path
 
     def write_img_to_tmp(self, img: Image, filename: str) -> Path:
@@ -75,9 +114,32 @@ class LocalFS(object):
             filename = self._get_random_tmp_filename(ext)
 
         full_path = self.tmp_storage / Path(filename).with_suffix(ext)
-        with open(str(full_path), "wb") as f:
-            for chunk in requests_result.iter_content(4096):
-                f.write(chunk)
+        with get_tracer().span("stream_to_tmp", cat="disk") as span:
+            nbytes = 0
+            with open(str(full_path), "wb") as f:
+                for chunk in requests_result.iter_content(4096):
+                    f.write(chunk)
+                    nbytes += len(chunk)
+            span.set(bytes=nbytes)
+        return full_path
+
+    async def astream_to_tmp(
+        self,
+        response=None,
+        filename: Path = None,
+        ext: str = None,
+    ) -> Path:
+        if filename is None:
+            filename = self._get_random_tmp_filename(ext)
+
+        full_path = self.tmp_storage / Path(filename).with_suffix(ext)
+        with get_tracer().span("stream_to_tmp", cat="disk") as span:
+            nbytes = 0
+            with open(str(full_path), "wb") as f:
+                async for chunk in response.content.iter_chunked(4096):
+                    f.write(chunk)
+                    nbytes += len(chunk)
+            span.set(bytes=nbytes)
         return full_path
 
     def _get_random_tmp_filename(self, ext: str) -> Path:
@@ -0,0 +1,27 @@
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+# The repository root is the chisel package. Unless it's installed or checked
+# out as a directory named chisel, import it through a link with that name.
+ROOT = Path(__file__).resolve().parent.parent
+
+try:
+    import chisel  # noqa: F401
+except ImportError:
+    if ROOT.name == "chisel":
+        sys.path.insert(0, str(ROOT.parent))
+    else:
+        link_dir = Path(tempfile.mkdtemp(prefix="chisel-test-"))
+        (link_dir / "chisel").symlink_to(ROOT)
+        sys.path.insert(0, str(link_dir))
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    # Providers store results under ~/chisel; keep each test's apart.
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
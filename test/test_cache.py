@@ -0,0 +1,77 @@
+import io
+
+import PIL.Image
+
+from chisel.api.cache import ResultCache, hash_input
+from chisel.api.result import APIResult
+from chisel.data_types import Image
+
+
+def make_result(tmp_path, name, color="red", size=(8, 8)):
+    path = tmp_path / f"{name}.png"
+    PIL.Image.new("RGB", size, color).save(str(path))
+    api_result = APIResult()
+    api_result.add(path, remote_url=None)
+    return api_result
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = ResultCache(str(tmp_path / "store"))
+    assert cache.get("k") is None
+    assert cache.put("k", make_result(tmp_path, "a", size=(5, 7)))
+    assert cache.get("k").get_image(0).size == (5, 7)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    results = [make_result(tmp_path, name) for name in "abc"]
+    size = (tmp_path / "a.png").stat().st_size
+    cache = ResultCache(str(tmp_path / "store"), max_bytes=2 * size)
+    cache.put("a", results[0])
+    cache.put("b", results[1])
+    assert cache.get("a") is not None
+    cache.put("c", results[2])
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert not (cache.cache_dir / "b").exists()
+
+
+def test_hit_outlives_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "store"), max_bytes=1)
+    cache.put("k1", make_result(tmp_path, "a", size=(3, 4)))
+    hit = cache.get("k1")
+    cache.put("k2", make_result(tmp_path, "b"))
+    assert "k1" not in cache
+    assert hit.get_image(0).size == (3, 4)
+
+
+def test_put_of_memory_result(tmp_path):
+    buf = io.BytesIO()
+    PIL.Image.new("RGB", (6, 2), "blue").save(buf, format="PNG")
+    api_result = APIResult()
+    api_result.add(None, remote_url=None, data=buf.getvalue())
+    cache = ResultCache(str(tmp_path / "store"))
+    assert cache.put("k", api_result)
+    assert cache.get("k").get_image(0).size == (6, 2)
+
+
+def test_instances_share_a_directory(tmp_path):
+    first = ResultCache(str(tmp_path / "store"))
+    second = ResultCache(str(tmp_path / "store"))
+    assert first.put("k", make_result(tmp_path, "a"))
+    assert second.put("k", make_result(tmp_path, "a"))
+    assert second.get("k") is not None
+    assert not [p for p in first.cache_dir.iterdir() if p.name.startswith(".")]
+    assert ResultCache(str(tmp_path / "store")).get("k") is not None
+
+
+def test_image_hashes_the_same_however_it_is_passed(tmp_path):
+    img = PIL.Image.new("RGB", (4, 3), "green")
+    path = tmp_path / "a.png"
+    img.save(str(path))
+    data = path.read_bytes()
+    keys = {
+        hash_input(x)
+        for x in (img, data, str(path), path, Image.from_pil(img), Image.from_bytes(data))
+    }
+    assert len(keys) == 1
+    assert hash_input(b"not an image") != hash_input(b"also not an image")
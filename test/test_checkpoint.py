@@ -0,0 +1,53 @@
+import PIL.Image
+import pytest
+
+from chisel.api.result import APIResult
+from chisel.flow.linear_flow import LinearFlow
+
+
+class Counted(object):
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+
+    def __call__(self, x):
+        self.calls += 1
+        return self.fn(x)
+
+
+def make_result(tmp_path, x):
+    path = tmp_path / f"{x}.png"
+    PIL.Image.new("RGB", (x, x), "red").save(str(path))
+    api_result = APIResult()
+    api_result.add(path, remote_url=None)
+    return api_result
+
+
+def test_rerun_resumes_after_the_last_completed_op(tmp_path):
+    state = {"fail": True}
+
+    def flaky(result):
+        if state["fail"]:
+            raise RuntimeError("crashed")
+        return result.get_image(0).size[0] * 10
+
+    first = Counted(lambda x: make_result(tmp_path, x))
+    second = Counted(flaky)
+    third = Counted(lambda x: x + 1)
+    flow = LinearFlow([first, second, third])
+    flow.enable_checkpoints("test", storage_dir=str(tmp_path / "store"))
+
+    with pytest.raises(RuntimeError):
+        flow(4)
+    state["fail"] = False
+    assert flow(4) == 41
+    assert (first.calls, second.calls, third.calls) == (1, 2, 1)
+
+    # Everything is checkpointed now, for calls and streams alike.
+    assert flow(4) == 41
+    assert [item.result for item in flow.stream([4, 5])] == [41, 51]
+    assert (first.calls, second.calls, third.calls) == (2, 3, 2)
+
+    flow.checkpoints.clear(4)
+    assert flow(4) == 41
+    assert first.calls == 3
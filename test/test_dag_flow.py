@@ -0,0 +1,68 @@
+import gc
+import threading
+import weakref
+
+import pytest
+
+from chisel.flow.dag_flow import DAGFlow
+
+
+class Value(object):
+    def __init__(self, x):
+        self.x = x
+
+
+def test_nodes_run_after_their_inputs_and_only_once():
+    order = []
+    lock = threading.Lock()
+
+    def step(name, fn):
+        def run(x):
+            with lock:
+                order.append(name)
+            return fn(x)
+        return run
+
+    flow = DAGFlow()
+    flow.add("a", step("a", lambda x: x + 1))
+    flow.add("b", step("b", lambda x: x * 2), inputs=["a"])
+    flow.add("c", step("c", lambda x: x * 3), inputs=["a"])
+    flow.add("d", step("d", lambda xs: xs), inputs=["c", "b", DAGFlow.INPUT])
+    flow.add("unused", step("unused", lambda x: x), inputs=["a"])
+
+    assert flow(1, outputs=["d"]) == {"d": [6, 4, 1]}
+    assert sorted(order) == ["a", "b", "c", "d"]
+    assert order[0] == "a" and order[-1] == "d"
+
+
+def test_first_error_is_raised_and_dependents_are_skipped():
+    ran = []
+
+    def fail(x):
+        raise RuntimeError("boom")
+
+    flow = DAGFlow()
+    flow.add("a", fail)
+    flow.add("b", lambda x: ran.append(x), inputs=["a"])
+    with pytest.raises(RuntimeError, match="boom"):
+        flow(1)
+    assert ran == []
+
+
+def test_intermediates_are_freed_after_their_last_consumer():
+    refs = {}
+
+    def make(x):
+        value = Value(x)
+        refs["a"] = weakref.ref(value)
+        return value
+
+    def check(value):
+        gc.collect()
+        return refs["a"]() is None
+
+    flow = DAGFlow()
+    flow.add("a", make)
+    flow.add("b", lambda value: Value(value.x + 1), inputs=["a"])
+    flow.add("c", check, inputs=["b"])
+    assert flow(1) == {"c": True}
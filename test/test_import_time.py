@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import chisel
+from chisel.benchmarks.import_time import CASES, measure
+
+
+@pytest.mark.parametrize("stmt, allowed", CASES, ids=[stmt for stmt, _ in CASES])
+def test_heavy_modules_stay_unloaded(stmt, allowed, monkeypatch):
+    # The probe runs in a fresh interpreter, which must find chisel the way
+    # this one did.
+    path = str(Path(chisel.__file__).parent.parent)
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [path, os.environ.get("PYTHONPATH")])))
+    unexpected = sorted(set(measure(stmt)["loaded"]) - set(allowed))
+    assert not unexpected, f"{stmt} loaded {', '.join(unexpected)}"
@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from chisel.api.job_poller import JobFetchError, JobPoller, JobTimeoutError
+from chisel.benchmarks.fake_servers import FakeStableDiffusionAPI, Faults
+
+
+@pytest.fixture
+def fake():
+    with FakeStableDiffusionAPI(image_size=16, queued_rate=1.0, queue_eta=0.3) as server:
+        yield server
+
+
+@pytest.fixture
+def api(fake, monkeypatch):
+    monkeypatch.setenv("CHISEL_API_KEY_STABLE_DIFFUSION", "key")
+    from chisel.api.stable_diffusion_api import StableDiffusionAPITxtToImg
+
+    api = StableDiffusionAPITxtToImg()
+    api.base_url = fake.base_url
+    api.job_poller = JobPoller(min_interval=0.05, max_interval=0.2, timeout=5.0)
+    return api
+
+
+def test_queued_job_completes(api, fake):
+    result = api.run("a cat")
+    assert len(result) == 1
+    assert result.get_image(0).size == (16, 16)
+    # The submit, then one fetch once the job's ETA has passed.
+    assert fake.requests == 2
+    assert api.job_poller.pending() == 0
+
+
+def test_queued_job_completes_async(api):
+    result = asyncio.run(api.arun("a cat"))
+    assert result.get_image(0).size == (16, 16)
+
+
+def test_deadline_expires(api, fake):
+    fake.queue_eta = 30.0
+    api.job_poller.timeout = 0.3
+    with pytest.raises(JobTimeoutError):
+        api.run("a cat")
+
+
+def test_transient_fetch_errors_are_retried(fake):
+    poller = JobPoller(min_interval=0.05, max_interval=0.1, timeout=5.0)
+    fake.faults = Faults(error_rate=1.0, error_status=503)
+    future = poller.submit(f"{fake.base_url}/fetch/1", {})
+    with pytest.raises(TimeoutError):
+        future.result(timeout=0.3)
+    # Recovering servers answer the next fetch, here with the unknown job.
+    fake.faults = Faults()
+    assert future.result(timeout=2.0)["status"] == "error"
+
+
+def test_client_error_fails_the_job(fake):
+    poller = JobPoller(min_interval=0.05, timeout=5.0)
+    future = poller.submit(f"{fake.url}/missing", {})
+    with pytest.raises(JobFetchError):
+        future.result(timeout=2.0)
+
+
+def test_error_status_raises(api, fake):
+    fake.queue_eta = 30.0
+    # The job finishes as an error, as the API reports failed generations.
+    api._get_fetch_request = lambda response: (f"{fake.base_url}/fetch/0", {})
+    with pytest.raises(Exception, match="status: error"):
+        api.run("a cat")
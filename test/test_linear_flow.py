@@ -0,0 +1,8 @@
+from chisel.flow.linear_flow import LinearFlow
+
+
+def test_call_matches_stream():
+    flow = LinearFlow([lambda x: x + 1, lambda x: x * 2])
+    assert flow(3) == 8
+    assert [item.result for item in flow.stream([3, 4])] == [8, 10]
+    assert LinearFlow([lambda x: x])(1, 2) == (1, 2)
@@ -0,0 +1,20 @@
+import os
+from types import SimpleNamespace
+
+import numpy
+
+from chisel.util import resample
+
+
+def test_tiles_in_process_when_shared_memory_is_full(monkeypatch):
+    monkeypatch.setattr(os, "statvfs", lambda path: SimpleNamespace(f_bavail=0, f_frsize=4096))
+    rng = numpy.random.default_rng(0)
+    pixels = (rng.random((40, 60, 3)) * 255).astype(numpy.uint8)
+
+    class NoPool(object):
+        def submit(self, *args):
+            raise AssertionError("used the pool")
+
+    tiled = resample.upscale(pixels, 120, 80, tile_size=32, overlap=8, pool=NoPool())
+    whole = resample.upscale(pixels, 120, 80, tile_size=512)
+    assert numpy.abs(tiled - whole).max() < 1e-5
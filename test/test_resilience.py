@@ -0,0 +1,118 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from chisel.api.resilience import (
+    CircuitBreaker, CircuitOpenError, Resilience, RetryableError, RetryBudget, parse_retry_after
+)
+
+
+class Flaky(object):
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_breaker_opens_then_half_opens():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.1)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.15)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial call at a time.
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.times_opened == 2
+
+
+def test_open_breaker_fails_calls_fast():
+    resilience = Resilience(max_attempts=1, failure_threshold=2, reset_timeout=60.0)
+    fn = Flaky([RetryableError("down")] * 2)
+    for _ in range(2):
+        with pytest.raises(RetryableError):
+            resilience.call("p", "e", fn)
+    with pytest.raises(CircuitOpenError):
+        resilience.call("p", "e", fn)
+    assert fn.calls == 2
+
+
+def test_retries_transient_errors():
+    resilience = Resilience(max_attempts=4, base_delay=0.0)
+    fn = Flaky([RetryableError("busy")] * 2)
+    assert resilience.call("p", "e", fn) == "ok"
+    assert fn.calls == 3
+    assert resilience.get_breaker("p", "e").state == CircuitBreaker.CLOSED
+
+
+def test_other_errors_arent_retried_or_counted():
+    resilience = Resilience(max_attempts=4, failure_threshold=1)
+    fn = Flaky([ValueError("bad input")])
+    with pytest.raises(ValueError):
+        resilience.call("p", "e", fn)
+    assert fn.calls == 1
+    assert resilience.get_breaker("p", "e").state == CircuitBreaker.CLOSED
+
+
+def test_retry_budget_caps_retries():
+    resilience = Resilience(max_attempts=10, base_delay=0.0, failure_threshold=100)
+    resilience.budget = RetryBudget(ratio=0.0, min_tokens=2.0)
+    fn = Flaky([RetryableError("busy")] * 10)
+    with pytest.raises(RetryableError):
+        resilience.call("p", "e", fn)
+    assert fn.calls == 3
+    assert resilience.budget.retries == 2
+    assert resilience.budget.rejected == 1
+
+
+def test_honors_retry_after():
+    resilience = Resilience(max_attempts=2, base_delay=0.0, max_delay=1.0)
+    fn = Flaky([RetryableError("throttled", retry_after=0.2)])
+    start = time.monotonic()
+    assert resilience.call("p", "e", fn) == "ok"
+    assert time.monotonic() - start >= 0.2
+
+    # Longer than max_delay: give up rather than block.
+    fn = Flaky([RetryableError("throttled", retry_after=5.0)])
+    with pytest.raises(RetryableError):
+        resilience.call("p", "e", fn)
+    assert fn.calls == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after("soon") is None
+
+
+def test_async_retries():
+    resilience = Resilience(max_attempts=3, base_delay=0.0)
+    fn = Flaky([RetryableError("busy")])
+
+    async def call():
+        return fn()
+
+    assert asyncio.run(resilience.acall("p", "e", call)) == "ok"
+    assert fn.calls == 2
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from chisel.api.base_api_provider import BaseAPIProvider
+from chisel.api.resilience import RetryableError
+from chisel.api.router import RoutingProvider
+
+
+class Backend(BaseAPIProvider):
+    def __init__(self, name, delay=0.0, error=None):
+        super().__init__()
+        self.params = {}
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def run(self, inp, params=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+    async def arun(self, inp, params=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+
+def prime(router, *latencies):
+    # Makes the backends' latencies known, so the first is chosen first.
+    for stats, latency in zip(router.stats, latencies):
+        stats.record(latency, ok=True)
+
+
+def test_fails_over_on_transient_errors():
+    a, b = Backend("a", error=RetryableError("overloaded")), Backend("b")
+    router = RoutingProvider([a, b])
+    prime(router, 0.01, 0.02)
+    assert router.run("x") == "b"
+    assert router.stats[0].errors == 1
+
+
+def test_other_errors_are_raised_without_failing_over():
+    a, b = Backend("a", error=ValueError("bad input")), Backend("b")
+    router = RoutingProvider([a, b])
+    prime(router, 0.01, 0.02)
+    with pytest.raises(ValueError):
+        router.run("x")
+    assert b.calls == 0
+    assert router.stats[0].errors == 0
+
+
+def test_async_fails_over_on_transient_errors_only():
+    a, b = Backend("a", error=RetryableError("overloaded")), Backend("b")
+    router = RoutingProvider([a, b])
+    prime(router, 0.01, 0.02)
+    assert asyncio.run(router.arun("x")) == "b"
+    a.error = ValueError("bad input")
+    router = RoutingProvider([a, b])
+    prime(router, 0.01, 0.02)
+    with pytest.raises(ValueError):
+        asyncio.run(router.arun("x"))
+    assert b.calls == 1
+
+
+def test_routes_to_the_fastest_backend():
+    a, b = Backend("a"), Backend("b")
+    router = RoutingProvider([a, b])
+    prime(router, 0.05, 0.01)
+    assert router.run("x") == "b"
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_hedges_a_slow_backend(use_async):
+    a, b = Backend("a", delay=1.0), Backend("b")
+    router = RoutingProvider([a, b], hedge=True, min_hedge_samples=1, min_hedge_delay=0.05)
+    prime(router, 0.01, 0.02)
+    start = time.monotonic()
+    result = asyncio.run(router.arun("x")) if use_async else router.run("x")
+    assert result == "b"
+    assert time.monotonic() - start < 0.5
+    assert router.hedges == 1
+
+
+def test_hedging_doesnt_resend_bad_requests():
+    a, b = Backend("a", error=ValueError("bad input")), Backend("b")
+    router = RoutingProvider([a, b], hedge=True, min_hedge_samples=1, min_hedge_delay=0.2)
+    prime(router, 0.01, 0.02)
+    with pytest.raises(ValueError):
+        router.run("x")
+    assert b.calls == 0
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from chisel.api.base_api_provider import BaseAPIProvider
+from chisel.api.single_flight import CoalescingAPIProvider, SingleFlight
+
+
+class SlowProvider(BaseAPIProvider):
+    seeded = True
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.params = {"seed": 1}
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def run(self, inp, params=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.2)
+        if self.error is not None:
+            raise self.error
+        return {"inp": inp}
+
+    async def arun(self, inp, params=None):
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        return {"inp": inp}
+
+
+def run_concurrently(api, inputs, params=None):
+    results = [None] * len(inputs)
+    errors = [None] * len(inputs)
+
+    def call(i):
+        try:
+            results[i] = api.run(inputs[i], params)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_identical_calls_share_one_call():
+    provider = SlowProvider()
+    api = CoalescingAPIProvider(provider)
+    results, _ = run_concurrently(api, ["cat"] * 4)
+    assert provider.calls == 1
+    assert all(result is results[0] for result in results)
+    assert api.single_flight.shared == 3
+    assert api.single_flight.in_flight() == 0
+
+
+def test_different_inputs_are_not_shared():
+    provider = SlowProvider()
+    results, _ = run_concurrently(CoalescingAPIProvider(provider), ["cat", "dog", "cat"])
+    assert provider.calls == 2
+    assert results[0] is results[2]
+    assert results[1] == {"inp": "dog"}
+
+
+def test_unseeded_calls_are_not_shared():
+    provider = SlowProvider()
+    run_concurrently(CoalescingAPIProvider(provider), ["cat"] * 3, {"seed": None})
+    assert provider.calls == 3
+
+
+def test_waiters_get_the_error():
+    provider = SlowProvider(error=RuntimeError("down"))
+    _, errors = run_concurrently(CoalescingAPIProvider(provider), ["cat"] * 3)
+    assert provider.calls == 1
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_async_identical_calls_share_one_call():
+    provider = SlowProvider()
+    api = CoalescingAPIProvider(provider, SingleFlight())
+
+    async def main():
+        return await asyncio.gather(*[api.arun("cat") for _ in range(4)])
+
+    results = asyncio.run(main())
+    assert provider.calls == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_cancelled_waiter_leaves_the_call_running():
+    provider = SlowProvider()
+    api = CoalescingAPIProvider(provider)
+
+    async def main():
+        first = asyncio.ensure_future(api.arun("cat"))
+        second = asyncio.ensure_future(api.arun("cat"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == {"inp": "cat"}
+    assert provider.calls == 1
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pytest
+
+from chisel.benchmarks.fake_servers import Faults, FakeStability
+from chisel.data_types import Image
+
+
+@pytest.fixture
+def stability(monkeypatch):
+    from chisel.api.stability_ai import StabilityAI
+
+    monkeypatch.setenv("CHISEL_API_KEY_STABILITY_AI", "x")
+    with FakeStability(Faults(latency=0.05), image_size=16) as fake:
+        monkeypatch.setattr(StabilityAI, "host", fake.host)
+        yield fake
+
+
+def test_concurrent_calls_write_their_own_files(stability):
+    from chisel.api.stability_ai import StabilityAITxtToImg
+
+    api = StabilityAITxtToImg()
+    api.set_params({"seed": 7, "samples": 1})
+
+    # Every call gets seed 7 back, which once gave them all the same file.
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: api.fork().run(f"prompt {i}"), range(4)))
+    paths = {result[0].local_filename for result in results}
+    assert len(paths) == 4
+    assert all(path.exists() for path in paths)
+    assert all(result.get_image(0).size == (16, 16) for result in results)
+
+
+def test_concurrent_tiles_write_their_own_files(stability):
+    from chisel.api.stability_ai import StabilityAISuperRes
+
+    api = StabilityAISuperRes()
+    tile = Image.from_array(numpy.zeros((8, 8, 3), dtype=numpy.uint8))
+
+    # Upscales all come back as seed 0, as the tiles of one image do.
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: api.fork().run(["", tile], {"width": 16}), range(4)))
+    paths = {result[0].local_filename for result in results}
+    assert len(paths) == 4
+    assert all(path.exists() for path in paths)
@@ -0,0 +1,52 @@
+import numpy
+import PIL.Image
+import pytest
+
+from chisel.api.cache import ResultCache
+from chisel.data_types import Image
+from chisel.ops import SuperResolution
+from chisel.ops.provider import Provider
+
+
+def make_pixels(width, height):
+    # Smooth content, like a real photo, so tiles blend back without seams.
+    rng = numpy.random.default_rng(1)
+    base = (rng.random((height // 16, width // 16, 3)) * 255).astype(numpy.uint8)
+    return numpy.asarray(PIL.Image.fromarray(base).resize((width, height), PIL.Image.BICUBIC))
+
+
+def test_tiles_stitch_back_into_the_whole_upscale(tmp_path):
+    pixels = make_pixels(200, 150)
+    whole = numpy.asarray(SuperResolution(Provider.LOCAL)(Image.from_array(pixels)).get_image(0))
+
+    op = SuperResolution(Provider.LOCAL)
+    cache = ResultCache(str(tmp_path / "tiles"))
+    op.enable_tiling(scale=2, tile_size=96, overlap=16, cache=cache)
+    calls = []
+    inner = op.api.api
+    run = inner.run
+
+    def flaky(inp, params=None):
+        calls.append(inp)
+        if len(calls) == 3:
+            raise RuntimeError("tile failed")
+        return run(inp, params)
+
+    inner.run = flaky
+    with pytest.raises(RuntimeError):
+        op(Image.from_array(pixels))
+    # The other tiles finish and are cached, so a retry only sends the one
+    # that failed.
+    assert len(calls) > 3 and len(cache) == len(calls) - 1
+    calls.clear()
+    tiled = numpy.asarray(op(Image.from_array(pixels)).get_image(0))
+    assert len(calls) == 1
+    assert tiled.shape == whole.shape == (300, 400, 3)
+    assert numpy.abs(tiled.astype(int) - whole.astype(int)).max() <= 2
+
+
+def test_rejects_providers_that_only_take_urls(monkeypatch):
+    monkeypatch.setenv("CHISEL_API_KEY_STABLE_DIFFUSION", "x")
+    op = SuperResolution(Provider.STABLE_DIFFUSION_API)
+    with pytest.raises(ValueError):
+        op.enable_tiling()
@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+from chisel.util.tracing import Tracer
+
+
+def get_track_names(tracer):
+    events = tracer.get_events()
+    names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+    return [(e["name"], names[e["tid"]]) for e in events if e["ph"] == "X"]
+
+
+def test_spans_are_named_after_their_thread_or_task():
+    tracer = Tracer(enabled=True)
+
+    def work():
+        with tracer.span("thread span"):
+            pass
+
+    thread = threading.Thread(target=work, name="worker")
+    thread.start()
+    thread.join()
+
+    async def task(i):
+        with tracer.span(f"task span {i}"):
+            await asyncio.sleep(0)
+
+    async def main():
+        # Tasks that finish first free their ids for later ones to reuse.
+        for i in range(20):
+            await asyncio.create_task(task(i), name=f"task {i}")
+
+    asyncio.run(main())
+    assert get_track_names(tracer) == (
+        [("thread span", "worker")] + [(f"task span {i}", f"task {i}") for i in range(20)]
+    )
@@ -0,0 +1,62 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from chisel.api.job_poller import JobPoller
+from chisel.api.webhook import WebhookReceiver
+from chisel.benchmarks.fake_servers import FakeStableDiffusionAPI
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=body, method="POST")
+    try:
+        with urllib.request.urlopen(request) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_defaults_to_loopback():
+    with WebhookReceiver() as receiver:
+        assert receiver.url.startswith("http://127.0.0.1:")
+
+
+def test_wildcard_host_needs_public_url():
+    with pytest.raises(ValueError):
+        WebhookReceiver(host="0.0.0.0")
+    receiver = WebhookReceiver(host="0.0.0.0", public_url="https://example.com/hook")
+    assert receiver.url == "https://example.com/hook"
+
+
+def test_callback_completes_its_request():
+    with WebhookReceiver() as receiver:
+        track_id, future = receiver.register()
+        assert post(receiver.url, b"[1, 2]") == 400
+        assert post(receiver.url, json.dumps({"track_id": track_id, "status": "processing"}).encode()) == 200
+        assert not future.done()
+        body = {"track_id": track_id, "status": "success", "output": []}
+        assert post(receiver.url, json.dumps(body).encode()) == 200
+        assert future.result(timeout=1.0) == body
+        assert receiver.pending() == 0
+
+
+def test_lost_callback_falls_back_after_eta(monkeypatch):
+    monkeypatch.setenv("CHISEL_API_KEY_STABLE_DIFFUSION", "key")
+    from chisel.api.stable_diffusion_api import StableDiffusionAPITxtToImg
+
+    with FakeStableDiffusionAPI(image_size=16, queued_rate=1.0, queue_eta=0.2) as fake:
+        api = StableDiffusionAPITxtToImg()
+        api.base_url = fake.base_url
+        api.job_poller = JobPoller(min_interval=0.05, timeout=5.0)
+        api.webhook_grace = 0.2
+        # The fake never calls back, as if the callback was lost.
+        with WebhookReceiver() as receiver:
+            api.set_webhook_receiver(receiver)
+            start = time.monotonic()
+            result = api.run("a cat")
+            assert time.monotonic() - start < 2.0
+            assert result.get_image(0).size == (16, 16)
+            assert receiver.pending() == 0
@@ -0,0 +1,407 @@
+import asyncio
+import hashlib
+import io
+import json
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+CASSETTE_MODES = ("record", "replay")
+INDEX_NAME = "index.json"
+
+# Recorded bodies are stored decoded, so these no longer describe them.
+_DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+
+class CassetteMissError(Exception):
+    pass
+
+
+def _hash_body(body: Any) -> Optional[str]:
+    if body is None:
+        return None
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if not isinstance(body, (bytes, bytearray, memoryview)):
+        return None
+    return hashlib.sha256(body).hexdigest()
+
+
+class _Interaction(object):
+    __slots__ = ("key", "body_hash", "status", "headers", "messages", "used")
+
+    def __init__(
+        self,
+        key: str,
+        body_hash: Optional[str],
+        status: int,
+        headers: Dict[str, str],
+        messages: List[Tuple[str, float]],
+    ) -> None:
+        self.key = key
+        self.body_hash = body_hash
+        self.status = status
+        self.headers = headers
+        # (blob name, seconds since the previous message or the request)
+        self.messages = messages
+        self.used = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "body_hash": self.body_hash,
+            "status": self.status,
+            "headers": self.headers,
+            "messages": self.messages,
+        }
+
+
+class Cassette(object):
+    """
+    Records provider traffic to a file, or replays it without any network.
+    Covers the shared HTTP transport (sync and aiohttp, so REST calls and
+    image downloads) and Stability's gRPC streams.
+
+    A cassette is a zip holding index.json and one member per distinct body,
+    so an image downloaded many times is stored once. On replay, a request
+    gets the first unplayed recording with the same method, URL and body,
+    else the next unplayed one with the same method and URL (bodies that
+    embed random seeds or multipart boundaries differ between runs), and once
+    everything is played, recordings are reused. With `timing`, replies are
+    delayed by the originally measured time.
+
+    Use it as a context manager to route the process-wide transport through
+    it:
+
+        with Cassette("txt2img.cassette", mode="record"):
+            txt2img("a cute cat")
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        mode: str = "replay",
+        timing: bool = False,
+    ) -> None:
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Invalid cassette mode: {mode}. Expected one of {CASSETTE_MODES}.")
+        self.path = Path(path).expanduser()
+        self.mode = mode
+        self.timing = timing
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._interactions: Dict[str, List[_Interaction]] = {}
+        self._blobs: set = set()
+        if mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._zip = zipfile.ZipFile(str(self.path), "w", compression=zipfile.ZIP_STORED)
+        else:
+            self._zip = zipfile.ZipFile(str(self.path), "r")
+            with self._zip.open(INDEX_NAME) as f:
+                for x in json.load(f):
+                    interaction = _Interaction(
+                        x["key"], x["body_hash"], x["status"], x["headers"],
+                        [tuple(m) for m in x["messages"]],
+                    )
+                    self._interactions.setdefault(x["key"], []).append(interaction)
+        self._transport = None
+
+    def __len__(self) -> int:
+        return sum(len(x) for x in self._interactions.values())
+
+    def _put_blob(self, data: bytes) -> str:
+        name = "blobs/" + hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if name not in self._blobs:
+                self._zip.writestr(name, data)
+                self._blobs.add(name)
+        return name
+
+    def _get_blob(self, name: str) -> bytes:
+        with self._lock:
+            return self._zip.read(name)
+
+    def record(
+        self,
+        key: str,
+        body: Any,
+        status: int,
+        headers: Dict[str, str],
+        messages: List[Tuple[bytes, float]],
+    ) -> None:
+        interaction = _Interaction(
+            key,
+            _hash_body(body),
+            status,
+            {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS},
+            [(self._put_blob(data), delay) for data, delay in messages],
+        )
+        with self._lock:
+            self._interactions.setdefault(key, []).append(interaction)
+
+    def find(self, key: str, body: Any) -> _Interaction:
+        body_hash = _hash_body(body)
+        with self._lock:
+            candidates = self._interactions.get(key, None)
+            if not candidates:
+                raise CassetteMissError(f"Nothing recorded for {key} in {self.path}.")
+            match = (
+                next((x for x in candidates if not x.used and x.body_hash == body_hash), None)
+                or next((x for x in candidates if not x.used), None)
+                or next((x for x in candidates if x.body_hash == body_hash), None)
+                or candidates[0]
+            )
+            match.used = True
+            self.hits += 1
+        return match
+
+    def iter_messages(self, interaction: _Interaction) -> Iterator[bytes]:
+        for name, delay in interaction.messages:
+            if self.timing and delay > 0:
+                time.sleep(delay)
+            yield self._get_blob(name)
+
+    async def aread_messages(self, interaction: _Interaction) -> bytes:
+        data = b""
+        for name, delay in interaction.messages:
+            if self.timing and delay > 0:
+                await asyncio.sleep(delay)
+            data += self._get_blob(name)
+        return data
+
+    def close(self) -> None:
+        if self._zip is None:
+            return
+        if self.mode == "record":
+            with self._lock:
+                index = [x.to_dict() for xs in self._interactions.values() for x in xs]
+                self._zip.writestr(
+                    INDEX_NAME, json.dumps(index), compress_type=zipfile.ZIP_DEFLATED
+                )
+        self._zip.close()
+        self._zip = None
+
+    def __enter__(self) -> "Cassette":
+        from chisel.util.transport import get_transport
+
+        self._transport = get_transport()
+        self._transport.set_cassette(self)
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self._transport is not None:
+            self._transport.set_cassette(None)
+            self._transport = None
+        self.close()
+
+    def grpc_stream(
+        self,
+        host: str,
+        method: str,
+        request: Any,
+        call: Callable[[], Iterator[Any]],
+        response_cls: Any,
+    ) -> Iterator[Any]:
+        """
+        Records or replays a server-streaming gRPC call.
+        """
+        key = f"GRPC grpc://{host}/{method}"
+        body = request.SerializeToString(deterministic=True)
+        if self.mode == "replay":
+            for data in self.iter_messages(self.find(key, body)):
+                yield response_cls.FromString(data)
+            return
+
+        messages = []
+        last = time.perf_counter()
+        for response in call():
+            now = time.perf_counter()
+            messages.append((response.SerializeToString(), now - last))
+            last = now
+            yield response
+        self.record(key, body, 0, {}, messages)
+
+
+class CassetteAdapter(BaseAdapter):
+    """
+    A requests adapter that records through the real adapter, or replays.
+    """
+
+    def __init__(self, cassette: Cassette, adapter: BaseAdapter) -> None:
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        key = f"{request.method} {request.url}"
+        if self.cassette.mode == "replay":
+            interaction = self.cassette.find(key, request.body)
+            start = time.perf_counter()
+            body = b"".join(self.cassette.iter_messages(interaction))
+            return self._build_response(
+                request, interaction.status, interaction.headers, body, time.perf_counter() - start
+            )
+
+        start = time.perf_counter()
+        r = self.adapter.send(request, **kwargs)
+        # Reading the body here leaves it cached on the response, so callers
+        # streaming it still get every byte.
+        body = r.content
+        elapsed = time.perf_counter() - start
+        self.cassette.record(key, request.body, r.status_code, dict(r.headers), [(body, elapsed)])
+        return r
+
+    def _build_response(
+        self,
+        request: requests.PreparedRequest,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        elapsed: float,
+    ) -> requests.Response:
+        r = requests.Response()
+        r.status_code = status
+        r.headers = CaseInsensitiveDict(headers)
+        r.headers["Content-Length"] = str(len(body))
+        r._content = body
+        r._content_consumed = True
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r.elapsed = timedelta(seconds=elapsed)
+        return r
+
+    def close(self) -> None:
+        pass
+
+
+class _ReplayedAioResponse(object):
+    """
+    Enough of aiohttp.ClientResponse for chisel's providers and openai.
+    """
+
+    def __init__(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        self.method = method
+        self.url = url
+        self.status = status
+        self.reason = None
+        self.headers = CaseInsensitiveDict(headers)
+        self.headers["Content-Length"] = str(len(body))
+        self.content_length = len(body)
+        self.content = _ReplayedStream(body)
+        self._body = body
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: str = "utf-8") -> str:
+        return self._body.decode(encoding)
+
+    async def json(self, **kwargs) -> Any:
+        return json.loads(self._body.decode("utf-8"))
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise requests.HTTPError(f"{self.status} for {self.url}")
+
+    def release(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "_ReplayedAioResponse":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+class _ReplayedStream(object):
+    def __init__(self, body: bytes) -> None:
+        self._buf = io.BytesIO(body)
+
+    async def read(self, n: int = -1) -> bytes:
+        return self._buf.read(n)
+
+    async def iter_chunked(self, n: int):
+        while True:
+            chunk = self._buf.read(n)
+            if not chunk:
+                return
+            yield chunk
+
+    async def readline(self) -> bytes:
+        return self._buf.readline()
+
+
+class _AioRequest(object):
+    """
+    What session.request() returns: awaitable, and usable with `async with`,
+    like aiohttp's own request context manager.
+    """
+
+    def __init__(self, session: "CassetteAioSession", method: str, url: str, kwargs: Dict) -> None:
+        self.session = session
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+    def __await__(self):
+        return self.session._send(self.method, self.url, self.kwargs).__await__()
+
+    async def __aenter__(self) -> _ReplayedAioResponse:
+        return await self.session._send(self.method, self.url, self.kwargs)
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+class CassetteAioSession(object):
+    """
+    Stands in for the shared aiohttp session: records through the real one,
+    or replays without it. Responses are read in full either way.
+    """
+
+    def __init__(self, cassette: Cassette, get_session: Callable[[], Any]) -> None:
+        self.cassette = cassette
+        self._get_session = get_session
+        self.closed = False
+
+    def request(self, method: str, url: Any, **kwargs) -> _AioRequest:
+        return _AioRequest(self, method.upper(), str(url), kwargs)
+
+    def get(self, url: Any, **kwargs) -> _AioRequest:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: Any, **kwargs) -> _AioRequest:
+        return self.request("POST", url, **kwargs)
+
+    def _get_body(self, kwargs: Dict) -> Any:
+        if kwargs.get("json", None) is not None:
+            return json.dumps(kwargs["json"], sort_keys=True)
+        return kwargs.get("data", None)
+
+    async def _send(self, method: str, url: str, kwargs: Dict) -> _ReplayedAioResponse:
+        key = f"{method} {url}"
+        body = self._get_body(kwargs)
+        if self.cassette.mode == "replay":
+            interaction = self.cassette.find(key, body)
+            data = await self.cassette.aread_messages(interaction)
+            return _ReplayedAioResponse(method, url, interaction.status, interaction.headers, data)
+
+        start = time.perf_counter()
+        async with self._get_session().request(method, url, **kwargs) as r:
+            data = await r.read()
+            status = r.status
+            headers = dict(r.headers)
+        self.cassette.record(key, body, status, headers, [(data, time.perf_counter() - start)])
+        return _ReplayedAioResponse(method, url, status, headers, data)
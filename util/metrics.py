@@ -0,0 +1,272 @@
+import bisect
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Request latencies range from sub-second (cache-warm HTTP) to minutes
+# (queued StableDiffusionAPI jobs).
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f"{k}=\"{v}\"" for k, v in escaped) + "}"
+
+
+class _Metric(object):
+    type_name: str = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _get_key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames) or any(n not in labels for n in self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}.")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only go up.")
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._get_key(labels), 0)
+
+    def _samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """
+    A histogram with fixed bucket upper bounds; observations above the last
+    bound only land in the implicit +Inf bucket.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count], sum.
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._get_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[i] += 1
+            total[0] += value
+
+    def get_count(self, **labels) -> int:
+        entry = self._values.get(self._get_key(labels), None)
+        return sum(entry[0]) if entry is not None else 0
+
+    def _samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        with self._lock:
+            values = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class _NoopMetric(object):
+    def inc(self, amount: float = 1, **labels) -> None:
+        pass
+
+    def observe(self, value: float, **labels) -> None:
+        pass
+
+
+_NOOP_METRIC = _NoopMetric()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MetricsRegistry(object):
+    """
+    Steady-state metrics for chisel's providers, rendered in the Prometheus
+    text format by render() or served on /metrics by serve().
+
+    While disabled, every metric is a shared no-op, so instrumented code
+    pays for an attribute lookup and an empty call.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+        self.requests = self.counter(
+            "chisel_requests_total",
+            "Provider calls by outcome (success or error).",
+            ("provider", "model_type", "outcome"),
+        )
+        self.request_seconds = self.histogram(
+            "chisel_request_seconds",
+            "Provider call latency, including retries.",
+            ("provider", "model_type"),
+        )
+        self.retries = self.counter(
+            "chisel_retries_total",
+            "Retried provider requests.",
+            ("provider", "endpoint"),
+        )
+        self.bytes = self.counter(
+            "chisel_bytes_total",
+            "Bytes sent to and received from providers.",
+            ("provider", "direction"),
+        )
+        self.images = self.counter(
+            "chisel_images_total",
+            "Images returned by providers (produced) or withheld by their safety filter (filtered).",
+            ("provider", "model_type", "outcome"),
+        )
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(name, Counter, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(name, Histogram, help, labelnames, buckets=buckets)
+
+    def _register(self, name: str, cls: type, help: str, labelnames: Sequence[str], **kwargs):
+        if not self.enabled:
+            return _NOOP_METRIC
+        metric = self._metrics.get(name, None)
+        if metric is None:
+            metric = cls(name, help, labelnames, **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already registered as a {metric.type_name}.")
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics.values())
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> int:
+        """
+        Serves render() on http://<host>:<port>/metrics from a background
+        thread. Returns the bound port.
+        """
+        if self._server is None:
+            self._server = _MetricsServer((host, port), _MetricsHandler)
+            self._server.registry = self
+            threading.Thread(
+                target=self._server.serve_forever,
+                name="chisel-metrics",
+                daemon=True,
+            ).start()
+        return self._server.server_address[1]
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(enabled=os.environ.get("CHISEL_METRICS", "") == "1")
+    return _metrics
+
+
+def configure_metrics(enabled: bool = True) -> MetricsRegistry:
+    """
+    Replaces the process-wide registry, stopping the old one's endpoint.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is not None:
+            _metrics.stop()
+        _metrics = MetricsRegistry(enabled=enabled)
+    return _metrics
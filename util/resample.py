@@ -0,0 +1,311 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy
+
+from chisel.util.tiling import PARITIES, Tile, get_feather, get_feather_size, get_parity, get_tiles
+from chisel.util.tracing import get_tracer
+
+
+def _lanczos(x: numpy.ndarray) -> numpy.ndarray:
+    return numpy.where(numpy.abs(x) < 3, numpy.sinc(x) * numpy.sinc(x / 3), 0)
+
+
+def _bicubic(x: numpy.ndarray) -> numpy.ndarray:
+    # Keys' cubic convolution with a = -0.5.
+    x = numpy.abs(x)
+    return numpy.where(
+        x <= 1,
+        (1.5 * x - 2.5) * x * x + 1,
+        numpy.where(x < 2, ((-0.5 * x + 2.5) * x - 4) * x + 2, 0),
+    )
+
+
+# name -> (kernel, support in input pixels)
+FILTERS: Dict[str, Tuple[Callable[[numpy.ndarray], numpy.ndarray], int]] = {
+    "lanczos": (_lanczos, 3),
+    "bicubic": (_bicubic, 2),
+}
+
+
+def _get_taps(
+    size_in: int,
+    out_start: int,
+    out_stop: int,
+    scale: float,
+    offset: int,
+    filter: str,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns the input indices and weights, each (n, taps), for output pixels
+    out_start..out_stop of an axis scaled by `scale`, when the input is a
+    slice of size_in pixels starting at `offset` of the full image.
+    """
+    kernel, support = FILTERS[filter]
+    # Downscaling stretches the kernel so it averages rather than aliases.
+    stretch = min(scale, 1.0)
+    support = support / stretch
+    centers = (numpy.arange(out_start, out_stop, dtype=numpy.float64) + 0.5) / scale - 0.5 - offset
+    first = numpy.floor(centers - support) + 1
+    idx = first[:, None] + numpy.arange(int(math.ceil(2 * support)))[None, :]
+    weights = kernel((centers[:, None] - idx) * stretch)
+    weights /= weights.sum(axis=1, keepdims=True)
+    idx = numpy.clip(idx, 0, size_in - 1).astype(numpy.intp)
+    return idx, weights.astype(numpy.float32)
+
+
+def _resample_rows(array: numpy.ndarray, idx: numpy.ndarray, weights: numpy.ndarray) -> numpy.ndarray:
+    out = array[idx[:, 0]] * weights[:, 0, None, None]
+    for k in range(1, idx.shape[1]):
+        out += array[idx[:, k]] * weights[:, k, None, None]
+    return out
+
+
+def _resample_cols(array: numpy.ndarray, idx: numpy.ndarray, weights: numpy.ndarray) -> numpy.ndarray:
+    out = array[:, idx[:, 0]] * weights[None, :, 0, None]
+    for k in range(1, idx.shape[1]):
+        out += array[:, idx[:, k]] * weights[None, :, k, None]
+    return out
+
+
+def _blur(array: numpy.ndarray) -> numpy.ndarray:
+    # Separable [1, 2, 1] / 4, repeating the edge pixels.
+    p = numpy.pad(array, ((1, 1), (0, 0), (0, 0)), mode="edge")
+    array = (p[:-2] + 2 * p[1:-1] + p[2:]) * 0.25
+    p = numpy.pad(array, ((0, 0), (1, 1), (0, 0)), mode="edge")
+    return (p[:, :-2] + 2 * p[:, 1:-1] + p[:, 2:]) * 0.25
+
+
+def sharpen(array: numpy.ndarray, amount: float) -> numpy.ndarray:
+    """
+    An edge-aware unsharp mask: detail is boosted by up to `amount` where
+    there's an edge, and left alone in flat areas so that noise and
+    gradients don't turn grainy.
+    """
+    if amount <= 0:
+        return array
+    detail = array - _blur(array)
+    edges = numpy.abs(detail).max(axis=2, keepdims=True)
+    gain = (amount * edges / (edges + 0.02)).astype(numpy.float32)
+    array += gain * detail
+    return array
+
+
+def upscale_region(
+    pixels: numpy.ndarray,
+    out_box: Tuple[int, int, int, int],
+    scale: Tuple[float, float],
+    offset: Tuple[int, int] = (0, 0),
+    filter: str = "lanczos",
+    sharpness: float = 0.0,
+) -> numpy.ndarray:
+    """
+    Upscales `pixels`, an (h, w, c) uint8 or float array that sits at
+    `offset` (x, y) in the full image, into the output pixels in `out_box`
+    of the full upscaled image. Returns them as float32 in [0, 1].
+    """
+    if filter not in FILTERS:
+        raise ValueError(f"Invalid filter: {filter}. Expected one of {tuple(FILTERS)}.")
+    if pixels.dtype == numpy.uint8:
+        pixels = pixels.astype(numpy.float32) / 255
+    else:
+        pixels = pixels.astype(numpy.float32, copy=False)
+    h, w = pixels.shape[:2]
+    x0, y0, x1, y1 = out_box
+    idx, weights = _get_taps(h, y0, y1, scale[1], offset[1], filter)
+    array = _resample_rows(pixels, idx, weights)
+    idx, weights = _get_taps(w, x0, x1, scale[0], offset[0], filter)
+    array = _resample_cols(array, idx, weights)
+    array = sharpen(array, sharpness)
+    return numpy.clip(array, 0, 1, out=array)
+
+
+def _attach(spec: Tuple[str, Tuple[int, ...], str]):
+    from multiprocessing import shared_memory
+
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _add_tile(
+    src: numpy.ndarray,
+    dst: numpy.ndarray,
+    tile: Tile,
+    scale: Tuple[float, float],
+    filter: str,
+    sharpness: float,
+    feather: int,
+) -> None:
+    x0, y0, x1, y1 = tile.box
+    pixels = upscale_region(src[y0:y1, x0:x1], tile.out_box, scale, (x0, y0), filter, sharpness)
+    ox0, oy0, ox1, oy1 = tile.out_box
+    dst[oy0:oy1, ox0:ox1] += pixels * get_feather(tile, feather)
+
+
+def _upscale_tile(
+    src_spec: Tuple[str, Tuple[int, ...], str],
+    dst_spec: Tuple[str, Tuple[int, ...], str],
+    tile: Tile,
+    scale: Tuple[float, float],
+    filter: str,
+    sharpness: float,
+    feather: int,
+) -> None:
+    # Runs in a pool worker: reads the tile from the shared input and adds
+    # its feathered pixels to the shared output. Only tiles of one parity run
+    # at a time, and those don't overlap, so no two workers add to the same
+    # pixels.
+    src_shm, src = _attach(src_spec)
+    dst_shm, dst = _attach(dst_spec)
+    try:
+        _add_tile(src, dst, tile, scale, filter, sharpness, feather)
+    finally:
+        del src, dst
+        src_shm.close()
+        dst_shm.close()
+
+
+def _create_shared_memory(*sizes: int) -> Optional[List]:
+    """
+    Creates a shared memory block of each size, or returns None if there's
+    no room for them (a Docker container gets a 64 MB /dev/shm by default).
+    """
+    from multiprocessing import shared_memory
+
+    try:
+        stat = os.statvfs("/dev/shm")
+    except (AttributeError, OSError):
+        pass
+    else:
+        # Linux only backs shared memory as it's written, so running out part
+        # way through would kill the process with SIGBUS rather than raise.
+        if stat.f_bavail * stat.f_frsize < sum(sizes):
+            return None
+    blocks: List = []
+    try:
+        for size in sizes:
+            blocks.append(shared_memory.SharedMemory(create=True, size=max(1, size)))
+    except OSError:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        return None
+    return blocks
+
+
+def upscale(
+    pixels: numpy.ndarray,
+    width: int,
+    height: int,
+    filter: str = "lanczos",
+    sharpness: float = 0.5,
+    tile_size: int = 512,
+    overlap: int = 16,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> numpy.ndarray:
+    """
+    Upscales an (h, w, c) uint8 or float image to width x height, returning
+    float32 in [0, 1]. Images larger than tile_size are cut into overlapping
+    tiles that are upscaled across a process pool, which reads the input
+    from and writes to shared memory, then blended over their overlap. When
+    shared memory can't hold the input and output (4 bytes per output pixel
+    and channel), the tiles are upscaled in this process instead.
+
+    The resampling is NumPy, about 10x slower than PIL's Lanczos on one core
+    (about 1.2 s vs 0.1 s for 1100x700 to 2200x1400), and more cores only help
+    with tiled images. The pool's workers are spawned, so scripts calling
+    this need an `if __name__ == "__main__":` guard.
+    """
+    h, w = pixels.shape[:2]
+    scale = (width / w, height / h)
+    tiles = get_tiles(w, h, tile_size, overlap, (width, height))
+    if len(tiles) == 1:
+        with get_tracer().span("upscale", cat="resample", width=width, height=height):
+            return upscale_region(pixels, (0, 0, width, height), scale, (0, 0), filter, sharpness)
+
+    feather = get_feather_size(overlap, min(scale))
+    dst_shape = (height, width, pixels.shape[2])
+    blocks = _create_shared_memory(
+        pixels.nbytes, int(numpy.prod(dst_shape)) * numpy.dtype(numpy.float32).itemsize
+    )
+    if blocks is None:
+        with get_tracer().span(
+            "upscale", cat="resample", width=width, height=height, tiles=len(tiles), pool=False
+        ):
+            out = numpy.zeros(dst_shape, dtype=numpy.float32)
+            for tile in tiles:
+                _add_tile(pixels, out, tile, scale, filter, sharpness, feather)
+        return numpy.clip(out, 0, 1, out=out)
+    if pool is None:
+        pool = get_upscale_pool()
+
+    src_shm, dst_shm = blocks
+    try:
+        src = numpy.ndarray(pixels.shape, dtype=pixels.dtype, buffer=src_shm.buf)
+        src[:] = pixels
+        dst = numpy.ndarray(dst_shape, dtype=numpy.float32, buffer=dst_shm.buf)
+        dst.fill(0)
+        src_spec = (src_shm.name, pixels.shape, pixels.dtype.str)
+        dst_spec = (dst_shm.name, dst_shape, dst.dtype.str)
+        with get_tracer().span(
+            "upscale", cat="resample", width=width, height=height, tiles=len(tiles)
+        ):
+            # One pass per parity, so that overlapping tiles never add to the
+            # output at the same time.
+            for parity in range(PARITIES):
+                futures = [
+                    pool.submit(
+                        _upscale_tile, src_spec, dst_spec, tile, scale, filter, sharpness, feather
+                    )
+                    for tile in tiles
+                    if get_parity(tile) == parity
+                ]
+                for future in futures:
+                    future.result()
+            out = dst.copy()
+        del src, dst
+    finally:
+        src_shm.close()
+        src_shm.unlink()
+        dst_shm.close()
+        dst_shm.unlink()
+    return numpy.clip(out, 0, 1, out=out)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _make_pool(max_workers: Optional[int]) -> ProcessPoolExecutor:
+    # Spawned rather than forked: the parent may hold gRPC channels and
+    # threads that don't survive a fork.
+    return ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def get_upscale_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _make_pool(None)
+    return _pool
+
+
+def configure_upscale_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Replaces the process-wide upscaling pool, shutting down the old one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = _make_pool(max_workers)
+    return _pool
@@ -0,0 +1,150 @@
+import math
+from typing import List, Tuple
+
+import numpy
+
+
+Box = Tuple[int, int, int, int]
+
+PARITIES = 4
+
+
+class Tile(object):
+    """
+    One tile of an image being upscaled piecewise. `box` is the region of the
+    input to upscale, (x0, y0, x1, y1), including `overlap` pixels of context
+    past the tile's cuts; `out_box` is where its upscaled pixels land in the
+    output.
+    """
+
+    __slots__ = ("row", "col", "box", "out_box", "cuts")
+
+    def __init__(self, row: int, col: int, box: Box, out_box: Box, cuts: Box) -> None:
+        self.row = row
+        self.col = col
+        self.box = box
+        self.out_box = out_box
+        # The output positions where this tile hands over to its neighbors.
+        # Edges of the image have no neighbor and no cut: -1.
+        self.cuts = cuts
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.box[2] - self.box[0], self.box[3] - self.box[1]
+
+    @property
+    def out_size(self) -> Tuple[int, int]:
+        return self.out_box[2] - self.out_box[0], self.out_box[3] - self.out_box[1]
+
+    def __repr__(self) -> str:
+        return f"Tile({self.row}, {self.col}, box={self.box}, out_box={self.out_box})"
+
+
+def _split(size: int, tile_size: int) -> List[int]:
+    # Evenly sized tiles of at most tile_size.
+    n = max(1, math.ceil(size / tile_size))
+    return [round(i * size / n) for i in range(n + 1)]
+
+
+def get_tiles(
+    width: int,
+    height: int,
+    tile_size: int,
+    overlap: int,
+    out_size: Tuple[int, int],
+) -> List[Tile]:
+    """
+    Cuts a width x height image into a grid of tiles of at most tile_size
+    pixels a side, each grown by `overlap` pixels into its neighbors, for an
+    output of `out_size` (width, height).
+
+    Every tile must span more than twice the overlap, so that tiles two
+    apart, which share a parity, never overlap.
+    """
+    if tile_size <= 2 * overlap:
+        raise ValueError(f"tile_size ({tile_size}) must be more than twice the overlap ({overlap}).")
+    sx = out_size[0] / width
+    sy = out_size[1] / height
+    xs = _split(width, tile_size)
+    ys = _split(height, tile_size)
+    for cuts in (xs, ys):
+        span = min(b - a for a, b in zip(cuts, cuts[1:]))
+        if len(cuts) > 2 and span <= 2 * overlap:
+            raise ValueError(
+                f"The overlap ({overlap}) must be less than half the tile span ({span}); "
+                f"lower it or raise tile_size ({tile_size})."
+            )
+    tiles = []
+    for row in range(len(ys) - 1):
+        for col in range(len(xs) - 1):
+            box = (
+                max(0, xs[col] - overlap),
+                max(0, ys[row] - overlap),
+                min(width, xs[col + 1] + overlap),
+                min(height, ys[row + 1] + overlap),
+            )
+            out_box = (
+                round(box[0] * sx),
+                round(box[1] * sy),
+                round(box[2] * sx) if box[2] < width else out_size[0],
+                round(box[3] * sy) if box[3] < height else out_size[1],
+            )
+            cuts = (
+                round(xs[col] * sx) if col > 0 else -1,
+                round(ys[row] * sy) if row > 0 else -1,
+                round(xs[col + 1] * sx) if col < len(xs) - 2 else -1,
+                round(ys[row + 1] * sy) if row < len(ys) - 2 else -1,
+            )
+            tiles.append(Tile(row, col, box, out_box, cuts))
+    return tiles
+
+
+def get_parity(tile: Tile) -> int:
+    """
+    Returns which of PARITIES classes a tile is in, by the parity of its row
+    and column. No two tiles of a class overlap, so a class's tiles can be
+    blended into the output concurrently.
+    """
+    return (tile.row % 2) * 2 + tile.col % 2
+
+
+def _ramp(start: int, stop: int, cut_lo: int, cut_hi: int, feather: int) -> numpy.ndarray:
+    pos = numpy.arange(start, stop, dtype=numpy.float32) + 0.5
+    weights = numpy.ones(stop - start, dtype=numpy.float32)
+    if cut_lo >= 0:
+        weights = numpy.minimum(weights, (pos - (cut_lo - feather)) / (2 * feather))
+    if cut_hi >= 0:
+        weights = numpy.minimum(weights, ((cut_hi + feather) - pos) / (2 * feather))
+    return numpy.clip(weights, 0, 1)
+
+
+def get_feather(tile: Tile, feather: int) -> numpy.ndarray:
+    """
+    Returns the (h, w, 1) blending weights for a tile's output: 1 inside its
+    cuts, ramping linearly to 0 over `feather` output pixels either side of
+    each cut. Neighbors' ramps mirror each other, so weights over the whole
+    output sum to 1.
+    """
+    feather = max(1, feather)
+    x0, y0, x1, y1 = tile.out_box
+    wx = _ramp(x0, x1, tile.cuts[0], tile.cuts[2], feather)
+    wy = _ramp(y0, y1, tile.cuts[1], tile.cuts[3], feather)
+    return (wy[:, None] * wx[None, :])[:, :, None]
+
+
+def get_feather_size(overlap: int, scale: float) -> int:
+    """
+    The feather, in output pixels, for tiles with `overlap` pixels of context:
+    half the overlap, so that the pixels each tile upscaled with the least
+    context never count.
+    """
+    return max(1, int(overlap * scale / 2))
+
+
+def blend(out: numpy.ndarray, tile: Tile, pixels: numpy.ndarray, feather: int) -> None:
+    """
+    Adds a tile's upscaled pixels, weighted by its feather, into `out`, an
+    (h, w, c) float32 array.
+    """
+    x0, y0, x1, y1 = tile.out_box
+    out[y0:y1, x0:x1] += pixels * get_feather(tile, feather)
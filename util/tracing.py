@@ -0,0 +1,222 @@
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+# The flow run that spans recorded in the current context belong to.
+_current_run: contextvars.ContextVar = contextvars.ContextVar("chisel_trace_run", default=None)
+_run_ids = itertools.count(1)
+
+
+class Span(object):
+    """
+    One timed section. Use as a context manager; `set()` attaches args
+    (bytes, status, retries, ...) that show up in the exported trace.
+    """
+
+    __slots__ = ("tracer", "name", "cat", "args", "start", "run", "tid")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0
+        self.run = _current_run.get()
+        self.tid = None
+
+    def set(self, **args) -> None:
+        self.args.update(args)
+
+    def __enter__(self) -> "Span":
+        self.tid = _get_tid()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record(self.name, self.cat, self.start, end, self.tid, self.run, self.args)
+        return False
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def set(self, **args) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _get_tid() -> Any:
+    # Returns the track to record on and its name. Concurrent asyncio tasks
+    # share a thread but don't nest, so each task gets its own track. The
+    # name is part of the key, so a reused thread ident or task id doesn't
+    # carry over an earlier owner's name.
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return (("task", id(task)), task.get_name())
+    return (threading.get_ident(), threading.current_thread().name)
+
+
+class Tracer(object):
+    """
+    An in-process tracer. Spans are kept in a ring buffer of `max_events`
+    and can be exported as Chrome trace JSON (chrome://tracing, Perfetto),
+    for everything recorded or for one flow run. While disabled, span()
+    returns a shared no-op span, so instrumented code costs one attribute
+    check.
+    """
+
+    def __init__(self, enabled: bool = False, max_events: int = 100000) -> None:
+        self.enabled = enabled
+        self._events: deque = deque(maxlen=max_events)
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name: str, cat: str = "chisel", **args) -> Union[Span, _NoopSpan]:
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, cat, args)
+
+    def add_span(
+        self,
+        name: str,
+        start_ns: int,
+        end_ns: int,
+        cat: str = "chisel",
+        **args
+    ) -> None:
+        """
+        Records a span timed elsewhere, from time.perf_counter_ns() values.
+        """
+        if self.enabled:
+            self._record(name, cat, start_ns, end_ns, _get_tid(), _current_run.get(), args)
+
+    @contextlib.contextmanager
+    def run(self, name: str) -> Iterator[Optional[str]]:
+        """
+        Marks everything traced inside the block (including on threads that
+        copy this context) as one run. Yields the run id to export with.
+        """
+        if not self.enabled:
+            yield None
+            return
+        run_id = f"{name}-{next(_run_ids)}"
+        token = _current_run.set(run_id)
+        try:
+            with self.span(name, cat="run"):
+                yield run_id
+        finally:
+            _current_run.reset(token)
+
+    def _record(
+        self,
+        name: str,
+        cat: str,
+        start: int,
+        end: int,
+        tid: Any,
+        run: Optional[str],
+        args: Dict[str, Any],
+    ) -> None:
+        # deque.append is atomic, so recording takes no lock.
+        self._events.append((name, cat, start, end, tid, run, args))
+
+    def get_events(self, run: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the recorded spans as Chrome trace events.
+        """
+        pid = os.getpid()
+        tids: Dict[Any, int] = {}
+        events = []
+        for name, cat, start, end, tid, run_id, args in list(self._events):
+            if run is not None and run_id != run:
+                continue
+            event_tid = tids.setdefault(tid, len(tids) + 1)
+            event_args = dict(args)
+            if run_id is not None:
+                event_args["run"] = run_id
+            events.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": event_tid,
+                "args": event_args,
+            })
+        for tid, event_tid in tids.items():
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": event_tid,
+                "args": {"name": tid[1]},
+            })
+        return events
+
+    def export_chrome_trace(self, path: Union[str, Path], run: Optional[str] = None) -> Path:
+        path = Path(os.path.expanduser(str(path)))
+        with open(str(path), "w") as f:
+            json.dump({"traceEvents": self.get_events(run), "displayTimeUnit": "ms"}, f)
+        return path
+
+    def clear(self) -> None:
+        self._events.clear()
+
+
+def bind_context(fn: Any) -> Any:
+    """
+    Wraps `fn` to run in a copy of the caller's context, so spans recorded
+    on another thread stay part of the caller's run.
+    """
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return run
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(enabled=os.environ.get("CHISEL_TRACE", "") == "1")
+    return _tracer
+
+
+def configure_tracer(**kwargs) -> Tracer:
+    """
+    Replaces the process-wide tracer. Takes the same keyword arguments as
+    Tracer, e.g. configure_tracer(enabled=True).
+    """
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer(**kwargs)
+    return _tracer
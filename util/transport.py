@@ -0,0 +1,261 @@
+import asyncio
+import socket
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from chisel.util.cassette import Cassette
+
+
+class DNSCache(object):
+    """
+    A small TTL cache in front of socket.getaddrinfo, shared by every
+    connection the transport opens.
+    """
+
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> str:
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, None)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = infos[0][4][0]
+        with self._lock:
+            self._entries[key] = (now + self.ttl, address)
+        return address
+
+    def invalidate(self, host: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == host]:
+                del self._entries[key]
+
+
+class _CachedDNSMixin(object):
+    dns_cache: DNSCache = None
+
+    def _new_conn(self):
+        # urllib3 only uses _dns_host to open the socket; TLS SNI and
+        # certificate checks read `host` after the connection is made, so
+        # swapping in the cached address here is safe.
+        dns_host = self._dns_host
+        if self.dns_cache is None or self.proxy is not None:
+            return super()._new_conn()
+        try:
+            self._dns_host = self.dns_cache.resolve(dns_host, self.port)
+        except OSError:
+            return super()._new_conn()
+        try:
+            return super()._new_conn()
+        except Exception:
+            self.dns_cache.invalidate(dns_host)
+            raise
+        finally:
+            self._dns_host = dns_host
+
+
+class _CachedDNSHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class _CachedDNSHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CachedDNSHTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedDNSHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _HTTPConnectionPool,
+            "https": _HTTPSConnectionPool,
+        }
+
+
+class Transport(object):
+    """
+    Process-wide HTTP transport. Every provider, downloader and data source
+    shares one requests.Session (sync) and one aiohttp.ClientSession per event
+    loop (async), so back-to-back calls reuse warm keep-alive connections
+    instead of paying a new TCP+TLS handshake each time.
+    """
+
+    def __init__(
+        self,
+        max_hosts: int = 32,
+        max_connections_per_host: int = 32,
+        max_connections: int = 512,
+        dns_ttl: float = 300.0,
+        keepalive_timeout: float = 60.0,
+    ) -> None:
+        self.max_hosts = max_hosts
+        self.max_connections_per_host = max_connections_per_host
+        self.max_connections = max_connections
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache = DNSCache(ttl=dns_ttl)
+        self.cassette: Optional["Cassette"] = None
+        self.adapter: Optional[HTTPAdapter] = None
+        self.session = self._build_session()
+        # id(loop) -> (loop ref, session, closer). aiohttp sessions hold their
+        # loop, so a WeakKeyDictionary on the loop would never let go of them.
+        self._aiohttp_sessions: Dict[int, Tuple[weakref.ref, Any, Any]] = {}
+        self._aiohttp_lock = threading.Lock()
+
+    def _build_session(self) -> requests.Session:
+        # The DNS cache is process-wide, like the transport itself.
+        _CachedDNSMixin.dns_cache = self.dns_cache
+        s = requests.Session()
+        # Only retry failed connects here, where the request never left the
+        # process. Everything else is retried by chisel.api.resilience, which
+        # knows about circuit breakers, the retry budget and Retry-After.
+        retries = Retry(
+            total=3,
+            connect=3,
+            read=0,
+            status=0,
+            backoff_factor=0.1,
+        )
+        self.adapter = PooledHTTPAdapter(
+            pool_connections=self.max_hosts,
+            pool_maxsize=self.max_connections_per_host,
+            max_retries=retries,
+        )
+        s.mount('http://', self.adapter)
+        s.mount('https://', self.adapter)
+        return s
+
+    def set_cassette(self, cassette: Optional["Cassette"]) -> None:
+        """
+        Routes all traffic through `cassette` to record or replay it, or back
+        to the network with None. Cassette's context manager calls this.
+        """
+        from chisel.util.cassette import CassetteAdapter
+
+        self.cassette = cassette
+        adapter = self.adapter if cassette is None else CassetteAdapter(cassette, self.adapter)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def aiohttp_session(self) -> "aiohttp.ClientSession":
+        """
+        Returns the shared aiohttp session for the running event loop.
+        """
+        if self.cassette is not None:
+            from chisel.util.cassette import CassetteAioSession
+
+            return CassetteAioSession(self.cassette, self._get_aiohttp_session)
+        return self._get_aiohttp_session()
+
+    def _get_aiohttp_session(self) -> "aiohttp.ClientSession":
+        # Imported here so sync-only processes never pay for aiohttp.
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        with self._aiohttp_lock:
+            entry = self._aiohttp_sessions.get(id(loop), None)
+        if entry is not None and entry[0]() is loop and not entry[1].closed:
+            return entry[1]
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=int(self.dns_ttl),
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        closer = self._close_on_shutdown(loop, session)
+        # Run it up to its yield, so the loop tracks it as a live async
+        # generator and finalizes it in shutdown_asyncgens(), which
+        # asyncio.run() calls before closing the loop.
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        with self._aiohttp_lock:
+            self._prune_aiohttp_sessions()
+            self._aiohttp_sessions[id(loop)] = (weakref.ref(loop), session, closer)
+        return session
+
+    async def _close_on_shutdown(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        session: "aiohttp.ClientSession",
+    ) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            with self._aiohttp_lock:
+                entry = self._aiohttp_sessions.get(id(loop), None)
+                if entry is not None and entry[1] is session:
+                    del self._aiohttp_sessions[id(loop)]
+            await session.close()
+
+    def _prune_aiohttp_sessions(self) -> None:
+        # Loops closed without shutdown_asyncgens() can't close their session
+        # any more; at least don't keep it alive, or let a new loop that
+        # reuses the id find it.
+        for key, (loop_ref, _, _) in list(self._aiohttp_sessions.items()):
+            loop = loop_ref()
+            if loop is None or loop.is_closed():
+                del self._aiohttp_sessions[key]
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._aiohttp_lock:
+            entry = self._aiohttp_sessions.get(id(loop), None)
+        if entry is not None:
+            await entry[2].aclose()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
+
+
+def configure_transport(**kwargs) -> Transport:
+    """
+    Replaces the process-wide transport, e.g. to resize the connection pools.
+    Takes the same keyword arguments as Transport.
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = Transport(**kwargs)
+    return _transport